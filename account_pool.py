@@ -0,0 +1,171 @@
+import os
+import json
+import bisect
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger('AccountPool')
+
+
+def _hash(value):
+    return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Консистентное хэширование каналов по аккаунтам.
+
+    Каждый аккаунт занимает replicas точек на кольце; канал закрепляется
+    за первым аккаунтом по часовой стрелке от своего хэша. При добавлении
+    канала остальные назначения не меняются, при добавлении аккаунта к нему
+    переходит лишь около 1/N каналов.
+    """
+
+    def __init__(self, names, replicas=100):
+        self.names = list(names)
+        self._points = sorted((_hash(f"{name}#{i}"), name) for name in self.names for i in range(replicas))
+        self._keys = [point for point, _ in self._points]
+
+    def candidates(self, key):
+        """Все аккаунты в порядке предпочтения для ключа (первый - основной)."""
+        if not self._points:
+            return []
+        result = []
+        start = bisect.bisect(self._keys, _hash(key))
+        for i in range(len(self._points)):
+            name = self._points[(start + i) % len(self._points)][1]
+            if name not in result:
+                result.append(name)
+                if len(result) == len(self.names):
+                    break
+        return result
+
+    def assign(self, key):
+        """Основной аккаунт для ключа."""
+        candidates = self.candidates(key)
+        return candidates[0] if candidates else None
+
+
+def load_accounts(config):
+    """
+    Аккаунты загрузчика из telegram.accounts (по умолчанию - один telegram.phone).
+
+    Элемент списка - номер телефона или объект {"phone", "api_id", "api_hash"};
+    недостающие api_id/api_hash берутся из раздела telegram.
+
+    Returns:
+        list: Словари name, phone, api_id, api_hash, session
+    """
+    telegram = config['telegram']
+    accounts = []
+    for item in telegram.get('accounts') or [telegram['phone']]:
+        if not isinstance(item, dict):
+            item = {'phone': item}
+        phone = str(item['phone'])
+        accounts.append({
+            'name': item.get('name') or phone,
+            'phone': phone,
+            'api_id': item.get('api_id', telegram['api_id']),
+            'api_hash': item.get('api_hash', telegram['api_hash']),
+            'session': os.path.join(config['paths']['sessions_dir'], f"tg_session_v3_{phone}"),
+        })
+    return accounts
+
+
+def sender_session(config):
+    """
+    Сессия воркера send: отдельная авторизация номера telegram.phone.
+
+    Копия файла сессии загрузчика содержала бы тот же ключ авторизации, а
+    два одновременных подключения с одним ключом Telegram отклоняет
+    (AuthKeyDuplicatedError) и может отозвать сессию. Поэтому воркер send
+    входит отдельно (python main.py login) и получает свой ключ.
+    """
+    return os.path.join(config['paths']['sessions_dir'], f"tg_session_v3_{config['telegram']['phone']}_sender")
+
+
+class AccountPool:
+    """Аккаунты загрузчика: распределение каналов и учет блокировок FloodWait.
+
+    Если аккаунт получил FloodWait, он исключается до истечения ожидания
+    (состояние сохраняется в data_dir/accounts.json и учитывается в следующих
+    запусках), а его каналы переходят к следующему аккаунту на кольце.
+    """
+
+    def __init__(self, config, accounts=None):
+        """
+        Args:
+            config: Конфигурация приложения
+            accounts: Список аккаунтов (по умолчанию load_accounts(config))
+        """
+        self.accounts = {account['name']: account for account in (accounts or load_accounts(config))}
+        self.ring = HashRing(self.accounts, config.get('app', {}).get('account_ring_replicas', 100))
+        self.state_file = os.path.join(config['paths']['data_dir'], 'accounts.json')
+        self.banned_until = {}
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            now = datetime.now()
+            for name, until in data.get('banned_until', {}).items():
+                until = datetime.fromisoformat(until)
+                if name in self.accounts and until > now:
+                    self.banned_until[name] = until
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния аккаунтов: {e}")
+
+    def _save_state(self):
+        try:
+            atomic_write_json(self.state_file, {
+                'banned_until': {name: until.isoformat() for name, until in self.banned_until.items()}
+            })
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния аккаунтов: {e}")
+
+    def available(self, name):
+        until = self.banned_until.get(name)
+        return until is None or until <= datetime.now()
+
+    def ban(self, name, seconds):
+        """Исключение аккаунта на время FloodWait."""
+        self.banned_until[name] = datetime.now() + timedelta(seconds=seconds)
+        logger.warning(f"Аккаунт {name} получил FloodWait на {seconds} с и исключен до "
+                       f"{self.banned_until[name].isoformat(timespec='seconds')}")
+        self._save_state()
+
+    def assign(self, channel_id, exclude=()):
+        """
+        Доступный аккаунт для канала.
+
+        Args:
+            channel_id: ID канала
+            exclude: Аккаунты, которые уже не смогли загрузить канал
+
+        Returns:
+            str: Имя аккаунта или None, если доступных не осталось
+        """
+        for name in self.ring.candidates(str(channel_id)):
+            if name not in exclude and self.available(name):
+                return name
+        return None
+
+    def plan(self, channel_ids):
+        """
+        Распределение каналов по доступным аккаунтам.
+
+        Returns:
+            tuple: ({аккаунт: [ID каналов]}, [ID каналов без доступного аккаунта])
+        """
+        groups, unassigned = {}, []
+        for channel_id in channel_ids:
+            name = self.assign(channel_id)
+            if name is None:
+                unassigned.append(channel_id)
+            else:
+                groups.setdefault(name, []).append(channel_id)
+        return groups, unassigned
@@ -0,0 +1,50 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8'):
+    """
+    Запись файла целиком или никак: данные пишутся во временный файл в том же
+    каталоге, сбрасываются на диск и атомарно переименовываются в path.
+
+    При сбое посреди записи на месте path остается предыдущая версия файла,
+    а не обрезанный JSON.
+
+    Args:
+        path: Путь к итоговому файлу
+        mode: 'w' (текст) или 'wb' (байты)
+        encoding: Кодировка для текстового режима
+
+    Yields:
+        file: Открытый временный файл
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data, indent=2):
+    """Атомарная запись data в JSON-файл path."""
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+
+
+def atomic_write_text(path, text):
+    """Атомарная запись текста в файл path."""
+    with atomic_write(path) as f:
+        f.write(text)
@@ -0,0 +1,274 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from telethon.errors import FloodWaitError, TakeoutInitDelayError
+from telegram_downloader import TelegramDownloader
+from account_pool import AccountPool
+from atomic_io import atomic_write_json
+from log_setup import LogSummary
+
+logger = logging.getLogger('Backfill')
+
+
+class HistoryBackfill(TelegramDownloader):
+    """Загрузка истории каналов за несколько дней (подключение новых каналов).
+
+    История канала делится на диапазоны ID сообщений по backfill_range_size,
+    которые загружаются параллельно (до backfill_concurrency на аккаунт),
+    каналы распределяются по аккаунтам так же, как при обычной загрузке.
+    Сообщения диапазона записываются в хранилище и поисковый индекс одной
+    пачкой. План и выполненные диапазоны хранятся в
+    data_dir/backfill/<канал>.json, поэтому прерванная загрузка
+    продолжается с невыполненных диапазонов.
+
+    Курсоры обычной загрузки (last_run.json, расписание опроса) и
+    new_messages.json не меняются: история попадает в архив и поиск, но не
+    в анализ и рассылку.
+    """
+
+    def __init__(self, days, channel_ids=None, takeout=False, metrics=None, config=None):
+        """
+        Args:
+            days: Глубина истории, дней
+            channel_ids: Каналы (по умолчанию - все из конфигурации)
+            takeout: Использовать takeout-сессию Telegram (экспорт данных, более мягкие лимиты)
+            metrics: Реестр метрик
+            config: Конфигурация приложения
+        """
+        super().__init__(metrics=metrics, config=config)
+        app_config = self.config.get('app', {})
+        self.days = days
+        self.channel_ids = [str(channel_id) for channel_id in (channel_ids or self.config['channels'])]
+        self.takeout = takeout
+        self.range_size = app_config.get('backfill_range_size', 2000)
+        self.concurrency = app_config.get('backfill_concurrency', 4)
+        # Пауза Telethon между страницами по 100 сообщений; в takeout-сессии не нужна
+        self.wait_time = 0 if takeout else app_config.get('backfill_wait_time', 1)
+        self.state_dir = os.path.join(self.config['paths']['data_dir'], 'backfill')
+        self._index_lock = threading.Lock()
+
+    def _state_file(self, channel_id):
+        return os.path.join(self.state_dir, f"{channel_id}.json")
+
+    def _load_state(self, channel_id):
+        path = self._state_file(channel_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния загрузки истории {path}: {e}")
+            return None
+
+    def _save_state(self, state):
+        try:
+            atomic_write_json(self._state_file(state['channel_id']), state, indent=None)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния загрузки истории канала {state['channel_id']}: {e}")
+
+    def _ranges(self, low, high):
+        """Диапазоны ID (low, high] по backfill_range_size."""
+        return [
+            {'min_id': start, 'max_id': min(start + self.range_size, high), 'done': False, 'messages': 0}
+            for start in range(low, high, self.range_size)
+        ]
+
+    async def _plan(self, client, channel_id, channel):
+        """
+        План загрузки канала: план с той же глубиной продолжается, а выполненный
+        дополняется сообщениями, появившимися после него; иначе история с начала
+        периода до последнего сообщения делится на диапазоны ID.
+
+        Returns:
+            dict: Состояние загрузки или None, если в канале нет сообщений
+        """
+        state = self._load_state(channel_id)
+        if state and state.get('days') != self.days:
+            state = None
+        if state and not state.get('completed'):
+            done = sum(1 for r in state['ranges'] if r['done'])
+            logger.info(f"Канал {channel_id}: продолжение загрузки истории, выполнено {done} из {len(state['ranges'])} диапазонов")
+            return state
+
+        latest = await client.get_messages(channel, limit=1)
+        if not latest:
+            return state
+        high = latest[0].id
+
+        if state:
+            # Выполненный план: загружаются только сообщения после его верхней границы
+            old_high = state.get('high', max((r['max_id'] for r in state['ranges']), default=0))
+            if high <= old_high:
+                logger.info(f"Канал {channel_id}: история за {self.days} дн. уже загружена {state['completed_at']}")
+                return state
+            ranges = self._ranges(old_high, high)
+            state['ranges'].extend(ranges)
+            state['high'] = high
+            state['completed'] = False
+            logger.info(f"Канал {channel_id}: история загружена {state['completed_at']}, "
+                        f"догрузка сообщений {old_high + 1}..{high}, {len(ranges)} диапазонов")
+            self._save_state(state)
+            return state
+
+        since = datetime.now(timezone.utc) - timedelta(days=self.days)
+        # Последнее сообщение до начала периода: история начинается после него
+        before = await client.get_messages(channel, limit=1, offset_date=since)
+        low = before[0].id if before else 0
+        state = {
+            'channel_id': channel_id,
+            'days': self.days,
+            'since': since.isoformat(),
+            'high': high,
+            'created_at': datetime.now().isoformat(),
+            'completed': False,
+            'ranges': self._ranges(low, high),
+        }
+        logger.info(f"Канал {channel_id}: история за {self.days} дн. - сообщения {low + 1}..{high}, "
+                    f"{len(state['ranges'])} диапазонов")
+        self._save_state(state)
+        return state
+
+    def _store(self, channel_id, messages):
+        """Запись сообщений диапазона в архив и поисковый индекс (выполняется в потоке)."""
+        for msg in messages:
+            self._save_message_to_file(channel_id, msg['id'], msg)
+        if self.search_index_enabled and messages:
+            from search_index import SearchIndex
+            # Индекс - одна база SQLite: диапазоны пишут в нее по очереди
+            with self._index_lock:
+                search_index = SearchIndex(self.config)
+                try:
+                    search_index.add(messages)
+                finally:
+                    search_index.close()
+
+    async def _fetch_range(self, client, channel, id_range, skipped):
+        """
+        Загрузка сообщений с ID в (min_id, max_id].
+
+        Части альбома на границе диапазонов попадают в разные диапазоны;
+        часть без подписи пропускается, как альбом без текста.
+
+        Returns:
+            int: Количество сохраненных сообщений
+        """
+        channel_title = getattr(channel, 'title', f'Чат {channel.id}')
+        messages, albums = [], {}
+        async for message in client.iter_messages(
+            channel,
+            min_id=id_range['min_id'],
+            max_id=id_range['max_id'] + 1,
+            reverse=True,
+            wait_time=self.wait_time
+        ):
+            self._add_message(message, channel, channel_title, messages, albums, skipped)
+        self._finish_albums(albums, messages, skipped, channel_title)
+        await asyncio.to_thread(self._store, channel.id, messages)
+        self.metrics.counter('news_tg_backfill_messages_total', 'Загружено сообщений истории').inc(
+            len(messages), channel=channel.id
+        )
+        return len(messages)
+
+    async def _backfill_channel(self, client, channel_id, channel, semaphore, flooded):
+        """
+        Загрузка истории одного канала.
+
+        Returns:
+            bool: True, если все диапазоны загружены
+        """
+        state = await self._plan(client, channel_id, channel)
+        if state is None:
+            logger.info(f"Канал {channel_id}: сообщений нет")
+            return True
+        skipped = LogSummary(logger, f"Пропущены сообщения истории без текста из канала {channel_id} (ID)")
+
+        async def run(id_range):
+            async with semaphore:
+                if flooded.is_set():
+                    return
+                try:
+                    id_range['messages'] = await self._fetch_range(client, channel, id_range, skipped)
+                except FloodWaitError:
+                    flooded.set()
+                    raise
+                except Exception as e:
+                    logger.error(f"Канал {channel_id}, сообщения {id_range['min_id'] + 1}..{id_range['max_id']}: {e}")
+                    return
+                id_range['done'] = True
+                self._save_state(state)
+
+        results = await asyncio.gather(*(run(r) for r in state['ranges'] if not r['done']), return_exceptions=True)
+        skipped.flush()
+        flood = next((r for r in results if isinstance(r, FloodWaitError)), None)
+        if flood:
+            raise flood
+
+        done = [r for r in state['ranges'] if r['done']]
+        total = sum(r['messages'] for r in done)
+        if len(done) < len(state['ranges']):
+            logger.warning(f"Канал {channel_id}: загружено {len(done)} из {len(state['ranges'])} диапазонов "
+                           f"({total} сообщений), остальные будут загружены при повторном запуске")
+            return False
+        if not state['completed']:
+            state['completed'] = True
+            state['completed_at'] = datetime.now().isoformat()
+            self._save_state(state)
+            logger.info(f"Канал {channel_id}: история загружена, {total} сообщений")
+        return True
+
+    async def _backfill_channels(self, client, resolved, account, pool):
+        """Загрузка каналов аккаунта (клиент - обычный или takeout)."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        flooded = asyncio.Event()
+        results = await asyncio.gather(*(
+            self._backfill_channel(client, channel_id, channel, semaphore, flooded)
+            for channel_id, channel in resolved
+        ), return_exceptions=True)
+        for (channel_id, _), result in zip(resolved, results):
+            if isinstance(result, FloodWaitError):
+                pool.ban(account['name'], result.seconds)
+            elif isinstance(result, Exception):
+                logger.error(f"Ошибка загрузки истории канала {channel_id}: {result}")
+        return sum(1 for result in results if result is True)
+
+    async def _backfill_account(self, account, channel_ids, pool):
+        client = await self._connect_account(account)
+        if client is None:
+            return 0
+        resolved, _ = await self._resolve_channels(client, channel_ids)
+        if not resolved:
+            return 0
+        if self.takeout:
+            try:
+                async with client.takeout(finalize=True, channels=True, megagroups=True) as takeout:
+                    return await self._backfill_channels(takeout, resolved, account, pool)
+            except TakeoutInitDelayError as e:
+                logger.warning(f"Telegram разрешит takeout-сессию для {account['name']} через {e.seconds} с "
+                               f"(подтвердите экспорт данных в приложении); загрузка без takeout")
+        return await self._backfill_channels(client, resolved, account, pool)
+
+    async def run(self):
+        """
+        Загрузка истории всех выбранных каналов.
+
+        Returns:
+            bool: True, если история всех каналов загружена полностью
+        """
+        pool = AccountPool(self.config, self.accounts)
+        groups, unassigned = pool.plan(self.channel_ids)
+        if unassigned:
+            logger.error(f"Нет доступных аккаунтов для каналов: {', '.join(unassigned)}")
+        accounts = {account['name']: account for account in self.accounts}
+        logger.info(f"Загрузка истории за {self.days} дн. для {len(self.channel_ids)} каналов"
+                    + (" (takeout)" if self.takeout else ""))
+        try:
+            completed = await asyncio.gather(*(
+                self._backfill_account(accounts[name], ids, pool) for name, ids in groups.items()
+            ))
+        finally:
+            await self.close()
+        return sum(completed) == len(self.channel_ids)
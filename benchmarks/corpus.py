@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+# Словарь для синтетических текстов: похож на новостные посты по длине слов
+_WORDS = (
+    "рынок компания рост снижение правительство заявление проект данные отчет "
+    "аналитики источник регион запуск инвестиции банк ставка нефть курс рубль "
+    "доллар экспорт импорт технологии искусственный интеллект сервис пользователи "
+    "обновление безопасность сделка акции индекс прогноз квартал выручка прибыль "
+    "министерство решение закон совещание эксперты исследование вакансия вебинар"
+).split()
+
+DEFAULT_MEDIA_MIX = {'photo': 0.2, 'video': 0.05, 'document': 0.05}
+
+
+def _sentence(rng, words):
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _text(rng, min_len, max_len):
+    target = rng.randint(min_len, max_len)
+    parts = []
+    length = 0
+    while length < target:
+        sentence = _sentence(rng, rng.randint(5, 15))
+        # Немного разметки, в том числе незакрытой - как в реальных постах
+        roll = rng.random()
+        if roll < 0.1:
+            sentence = f"**{sentence}**"
+        elif roll < 0.15:
+            sentence = sentence.replace(" ", "_", 1)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)[:max_len]
+
+
+def _near_duplicate(rng, text):
+    """Перепечатка поста другим каналом: мелкие правки и другая концовка."""
+    words = text.split()
+    for _ in range(max(1, len(words) // 20)):
+        words[rng.randrange(len(words))] = rng.choice(_WORDS)
+    return " ".join(words) + rng.choice(["", " Подробности по ссылке.", " #новости"])
+
+
+def generate_corpus(channels=5, messages_per_channel=100, min_len=80, max_len=1500,
+                    duplicate_rate=0.2, media_mix=None, album_rate=0.05, media_size=200 * 1024,
+                    hours=12, seed=1):
+    """
+    Генерация синтетического корпуса сообщений.
+
+    Args:
+        channels: Количество каналов
+        messages_per_channel: Сообщений в каждом канале
+        min_len, max_len: Диапазон длины текста
+        duplicate_rate: Доля сообщений, перепечатанных из других каналов
+        media_mix: Доли сообщений с медиа по типам {'photo': 0.2, ...}
+        album_rate: Доля сообщений-альбомов (2-5 фото с общим grouped_id)
+        media_size: Средний размер медиа, байт
+        hours: Период, за который "опубликованы" сообщения
+        seed: Зерно генератора для воспроизводимости
+
+    Returns:
+        dict: ID канала -> {'title': str, 'messages': [dict]} в порядке публикации
+    """
+    rng = random.Random(seed)
+    media_mix = DEFAULT_MEDIA_MIX if media_mix is None else media_mix
+    now = datetime.now(timezone.utc)
+    start = now - timedelta(hours=hours)
+    corpus = {}
+    published = []  # тексты уже "опубликованных" постов для дубликатов
+    media_id = 1000
+    grouped_id = 5000
+
+    for c in range(channels):
+        channel_id = -1001000000000 - c
+        messages = []
+        message_id = 1
+        for n in range(messages_per_channel):
+            date = start + timedelta(seconds=(n + 1) * hours * 3600 / (messages_per_channel + 1))
+            if published and rng.random() < duplicate_rate:
+                text = _near_duplicate(rng, rng.choice(published))
+            else:
+                text = _text(rng, min_len, max_len)
+            published.append(text)
+
+            roll = rng.random()
+            if roll < album_rate:
+                grouped_id += 1
+                for part in range(rng.randint(2, 5)):
+                    media_id += 1
+                    messages.append({
+                        'id': message_id, 'date': date, 'text': text if part == 0 else '',
+                        'media': {'type': 'photo', 'id': media_id, 'size': rng.randint(media_size // 2, media_size * 2)},
+                        'grouped_id': grouped_id,
+                    })
+                    message_id += 1
+                continue
+
+            media = None
+            threshold = album_rate
+            for media_type, share in media_mix.items():
+                threshold += share
+                if roll < threshold:
+                    media_id += 1
+                    size = rng.randint(media_size // 2, media_size * (10 if media_type == 'video' else 2))
+                    media = {'type': media_type, 'id': media_id, 'size': size}
+                    break
+            messages.append({'id': message_id, 'date': date, 'text': text, 'media': media, 'grouped_id': None})
+            message_id += 1
+        corpus[channel_id] = {'title': f"Канал {c + 1}", 'messages': messages}
+    return corpus
+
+
+def unique_messages_from_corpus(corpus):
+    """Сообщения корпуса в формате unique_messages.json (для замера одной отправки)."""
+    result = []
+    for channel_id, channel in corpus.items():
+        for msg in channel['messages']:
+            if msg['grouped_id'] or not msg['text']:
+                continue
+            result.append({
+                'id': msg['id'],
+                'channel_id': channel_id,
+                'channel_name': channel['title'],
+                'date': msg['date'].isoformat(),
+                'message': msg['text'],
+                'has_media': msg['media'] is not None,
+            })
+    return result
@@ -0,0 +1,196 @@
+import os
+import random
+import asyncio
+from types import SimpleNamespace
+from datetime import timezone
+from telethon.errors import FloodWaitError
+from telethon.tl import types
+
+
+def _bare_id(peer_id):
+    """ID канала без префикса -100 (как его возвращает Telethon в entity.id)."""
+    peer_id = int(peer_id)
+    if peer_id < -1000000000000:
+        return -peer_id - 1000000000000
+    return abs(peer_id)
+
+
+class FakeMessage:
+    """Сообщение с интерфейсом telethon.tl.custom.Message, нужным приложению."""
+
+    def __init__(self, client, peer_id, data):
+        self._client = client
+        self.id = data['id']
+        self.peer_id = peer_id
+        self.date = data['date']
+        self.text = data['text']
+        self.message = data['text']
+        self.grouped_id = data['grouped_id']
+        self.media = None
+        self.file = None
+        media = data.get('media')
+        if media:
+            self._size = media['size']
+            self.media = self._build_media(media)
+            self.file = SimpleNamespace(size=media['size'])
+
+    def _build_media(self, media):
+        if media['type'] == 'photo':
+            photo = types.Photo(
+                id=media['id'], access_hash=0, file_reference=b'', date=self.date,
+                sizes=[types.PhotoSize('y', 1280, 720, media['size'])], dc_id=2
+            )
+            return types.MessageMediaPhoto(photo=photo)
+        mime_type = 'video/mp4' if media['type'] == 'video' else 'application/pdf'
+        extension = '.mp4' if media['type'] == 'video' else '.pdf'
+        document = types.Document(
+            id=media['id'], access_hash=0, file_reference=b'', date=self.date, mime_type=mime_type,
+            size=media['size'], dc_id=2,
+            attributes=[types.DocumentAttributeFilename(f"file_{media['id']}{extension}")]
+        )
+        return types.MessageMediaDocument(document=document)
+
+    async def download_media(self, path):
+        await self._client._download_delay(self._size)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(self._size))
+        return path
+
+
+class FakeTelegramClient:
+    """Заменитель TelegramClient для бенчмарков: корпус в памяти, задержки и flood wait.
+
+    Каждый вызов "RPC" ждет latency секунд (плюс jitter), с вероятностью
+    flood_rate вызывает FloodWaitError на flood_seconds. Загрузка медиа
+    идет со скоростью download_bps байт в секунду.
+    """
+
+    def __init__(self, corpus, latency=0.05, jitter=0.02, flood_rate=0.0, flood_seconds=1,
+                 download_bps=20 * 1024 * 1024, seed=1):
+        self.corpus = {_bare_id(channel_id): channel for channel_id, channel in corpus.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.download_bps = download_bps
+        self.rng = random.Random(seed)
+        self.calls = {}
+        self.flood_waits = 0
+        self.sent_id = 0
+        self._messages = {}
+        for bare_id, channel in self.corpus.items():
+            for data in channel['messages']:
+                self._messages[(bare_id, data['id'])] = FakeMessage(self, bare_id, data)
+
+    def factory(self, *args, **kwargs):
+        """Подстановка вместо конструктора TelegramClient(session, api_id, api_hash, ...)."""
+        return self
+
+    async def _rpc(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    async def _download_delay(self, size):
+        await self._rpc('download')
+        await asyncio.sleep(size / self.download_bps)
+
+    # Авторизация и соединение
+
+    async def start(self, *args, **kwargs):
+        return self
+
+    async def connect(self):
+        return True
+
+    async def is_user_authorized(self):
+        return True
+
+    async def disconnect(self):
+        return None
+
+    # Получение данных
+
+    async def get_entity(self, peer_id):
+        await self._rpc('get_entity')
+        bare_id = _bare_id(peer_id)
+        channel = self.corpus.get(bare_id)
+        if channel is None:
+            # Получатель рассылки
+            return types.User(id=bare_id, first_name='Получатель')
+        return types.Channel(
+            id=bare_id, title=channel['title'], photo=types.ChatPhotoEmpty(), date=None, broadcast=True
+        )
+
+    async def iter_messages(self, entity, offset_date=None, reverse=False, limit=None,
+                            min_id=0, max_id=0, wait_time=None):
+        bare_id = _bare_id(getattr(entity, 'id', entity))
+        messages = [self._messages[(bare_id, data['id'])] for data in self.corpus[bare_id]['messages']]
+        messages = [m for m in messages if m.id > min_id and (not max_id or m.id < max_id)]
+        if offset_date is not None:
+            # Загрузчик передает локальное время без часового пояса
+            offset_date = offset_date.astimezone(timezone.utc)
+            if reverse:
+                messages = [m for m in messages if m.date > offset_date]
+            else:
+                messages = [m for m in messages if m.date < offset_date]
+        if not reverse:
+            messages.reverse()
+        # Telethon получает историю страницами по 100 сообщений
+        for i, message in enumerate(messages[:limit] if limit else messages):
+            if i % 100 == 0:
+                await self._rpc('get_history')
+            yield message
+
+    async def get_messages(self, entity, ids=None, limit=None, offset_date=None):
+        if ids is None:
+            return [message async for message in self.iter_messages(entity, offset_date=offset_date, limit=limit)]
+        await self._rpc('get_messages')
+        bare_id = _bare_id(getattr(entity, 'id', entity))
+        if isinstance(ids, (list, tuple)):
+            return [self._messages.get((bare_id, int(i))) for i in ids]
+        return self._messages.get((bare_id, int(ids)))
+
+    def takeout(self, finalize=True, **kwargs):
+        """Takeout-сессия: тот же клиент."""
+        client = self
+
+        class _Takeout:
+            async def __aenter__(self):
+                await client._rpc('init_takeout')
+                return client
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return _Takeout()
+
+    async def iter_download(self, source, chunk_size=512 * 1024):
+        size = getattr(source, 'size', None) or chunk_size * 4
+        await self._rpc('download')
+        sent = 0
+        while sent < size:
+            chunk = min(chunk_size, size - sent)
+            await asyncio.sleep(chunk / self.download_bps)
+            sent += chunk
+            yield os.urandom(chunk)
+
+    # Отправка
+
+    async def send_message(self, entity, message, **kwargs):
+        await self._rpc('send_message')
+        self.sent_id += 1
+        return SimpleNamespace(id=self.sent_id)
+
+    async def forward_messages(self, entity, messages, **kwargs):
+        await self._rpc('forward_messages')
+        if isinstance(messages, list):
+            result = []
+            for _ in messages:
+                self.sent_id += 1
+                result.append(SimpleNamespace(id=self.sent_id))
+            return result
+        self.sent_id += 1
+        return SimpleNamespace(id=self.sent_id)
@@ -0,0 +1,254 @@
+"""
+Офлайн-бенчмарк конвейера: синтетический корпус, FakeTelegramClient,
+заглушки LLM и Bot API. Замеряет этапы download, analyze, send, backfill и полный
+parse_and_send, выводит пропускную способность и перцентили задержек.
+
+Запуск из корня проекта:
+    python benchmarks/run_benchmarks.py --channels 10 --messages 200 --json result.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import generate_corpus, unique_messages_from_corpus
+from benchmarks.fake_telegram import FakeTelegramClient
+from benchmarks.stub_servers import StubLLMServer, StubBotApiServer
+from log_setup import LOG_FORMAT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк NEWS_TG")
+    parser.add_argument('--stages', default='download,analyze,send,pipeline',
+                        help="Этапы через запятую: download, analyze, send, pipeline, backfill")
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=100, help="Сообщений в каждом канале")
+    parser.add_argument('--hours', type=float, default=12,
+                        help="Период публикации корпуса, часов (download берет не больше суток, backfill - весь)")
+    parser.add_argument('--min-len', type=int, default=80)
+    parser.add_argument('--max-len', type=int, default=1500)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2)
+    parser.add_argument('--photo-rate', type=float, default=0.2)
+    parser.add_argument('--video-rate', type=float, default=0.05)
+    parser.add_argument('--document-rate', type=float, default=0.05)
+    parser.add_argument('--album-rate', type=float, default=0.05)
+    parser.add_argument('--media-size', type=int, default=200 * 1024, help="Средний размер медиа, байт")
+    parser.add_argument('--rpc-latency', type=float, default=0.05, help="Задержка RPC Telegram, с")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="Вероятность FloodWait на RPC")
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-keep-ratio', type=float, default=0.7)
+    parser.add_argument('--bot-latency', type=float, default=0.05)
+    parser.add_argument('--bot-flood-rate', type=float, default=0.0, help="Вероятность 429 от Bot API")
+    parser.add_argument('--request-delay', type=float, default=0.0, help="app.request_delay")
+    parser.add_argument('--accounts', type=int, default=1, help="Аккаунтов загрузчика (telegram.accounts)")
+    parser.add_argument('--takeout', action='store_true', help="backfill: через takeout-сессию")
+    parser.add_argument('--direct-forward', action='store_true', help="Прямой форвард вместо Bot API")
+    parser.add_argument('--app', default='{}', help="Дополнительные параметры app в JSON")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    parser.add_argument('--verbose', action='store_true', help="Показывать логи приложения")
+    return parser.parse_args()
+
+
+def write_config(workdir, args, corpus, llm, bot):
+    """Конфигурация приложения, указывающая на заглушки."""
+    app = {
+        'request_delay': args.request_delay,
+        'direct_forward': args.direct_forward,
+        'media_evict_interval': 3600,
+    }
+    app.update(json.loads(args.app))
+    config = {
+        'telegram': {
+            'api_id': 1, 'api_hash': 'bench', 'phone': '+10000000000',
+            'bot_token': 'bench:token', 'bot_api_url': bot.url, 'user_id': '424242',
+        },
+        'llm': {'enabled': True, 'lm_studio_api_url': llm.completions_url, 'lm_studio_model': 'stub'},
+        'paths': {
+            'data_dir': os.path.join(workdir, 'data'),
+            'sessions_dir': os.path.join(workdir, 'sessions'),
+            'reports_dir': os.path.join(workdir, 'reports'),
+            'log_dir': os.path.join(workdir, 'logs'),
+        },
+        'channels': [str(channel_id) for channel_id in corpus],
+        'app': app,
+    }
+    if args.accounts > 1:
+        config['telegram']['accounts'] = [f"+1000000{i:04d}" for i in range(args.accounts)]
+    with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    return config
+
+
+def histogram_quantiles(metric, quantiles=(0.5, 0.95, 0.99)):
+    """Оценка перцентилей по корзинам гистограммы (линейная интерполяция внутри корзины)."""
+    if metric is None or not metric.values:
+        return {}
+    counts = [0] * len(metric.buckets)
+    total = 0
+    for state in metric.values.values():
+        for i, count in enumerate(state['counts']):
+            counts[i] += count
+        total += state['count']
+    result = {}
+    for q in quantiles:
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(metric.buckets, counts):
+            if count and cumulative + count >= rank:
+                # Для корзины +Inf верхней границы нет - оценка не выше последней конечной границы
+                upper = bound if bound != float('inf') else lower
+                result[f"p{int(q * 100)}"] = lower + (upper - lower) * (rank - cumulative) / count
+                break
+            cumulative += count
+            lower = bound if bound != float('inf') else lower
+    return result
+
+
+def stage_seconds(registry):
+    """Точная длительность этапов конвейера (сумма наблюдений news_tg_stage_seconds по этапу)."""
+    metric = registry.metrics.get('news_tg_stage_seconds')
+    if metric is None:
+        return {}
+    return {dict(key).get('stage'): round(state['sum'], 3) for key, state in metric.values.items()}
+
+
+async def run_stage(stage, registry, corpus, days=1, takeout=False):
+    """Выполнение одного этапа; возвращает (количество обработанных элементов, гистограмма задержек)."""
+    from telegram_downloader import TelegramDownloader
+    from message_analyzer import MessageAnalyzer
+    from message_sender import MessageSender
+    import main
+
+    if stage == 'download':
+        messages = await TelegramDownloader().download_messages() or []
+        return len(messages), registry.metrics.get('news_tg_rpc_seconds')
+    if stage == 'backfill':
+        from backfill import HistoryBackfill
+        # История всего корпуса одной загрузкой (курсор download не меняется)
+        await HistoryBackfill(days=days, takeout=takeout).run()
+        fetched = registry.metrics.get('news_tg_backfill_messages_total')
+        return (sum(fetched.values.values()) if fetched else 0), registry.metrics.get('news_tg_rpc_seconds')
+    if stage == 'analyze':
+        analyzer = MessageAnalyzer()
+        messages = analyzer.load_messages() or []
+        # analyze_messages синхронный и блокирует цикл событий так же, как в main.py
+        informative = analyzer.filter_informative_messages(messages)
+        analyzer.analyze_messages(informative)
+        return len(messages), registry.metrics.get('news_tg_llm_seconds')
+    if stage == 'send':
+        sender = MessageSender()
+        if not os.path.exists(os.path.join(sender.data_dir, 'unique_messages.json')):
+            # Этап send без analyze: отправляем весь корпус
+            with open(os.path.join(sender.data_dir, 'unique_messages.json'), 'w', encoding='utf-8') as f:
+                json.dump({'timestamp': '', 'messages': unique_messages_from_corpus(corpus)}, f, ensure_ascii=False)
+        await sender.send_messages()
+        await sender.close()
+        sent = registry.metrics.get('news_tg_messages_sent_total')
+        return (sent.value() if sent else 0), registry.metrics.get('news_tg_rpc_seconds')
+    if stage == 'pipeline':
+        await main.parse_and_send()
+        sent = registry.metrics.get('news_tg_messages_sent_total')
+        # По одному наблюдению на этап: перцентили по корзинам бессмысленны,
+        # точные длительности этапов выводятся отдельно (stage_seconds)
+        return (sent.value() if sent else 0), None
+    raise ValueError(f"Неизвестный этап: {stage}")
+
+
+async def benchmark(args):
+    corpus = generate_corpus(
+        channels=args.channels, messages_per_channel=args.messages,
+        min_len=args.min_len, max_len=args.max_len, duplicate_rate=args.duplicate_rate,
+        media_mix={'photo': args.photo_rate, 'video': args.video_rate, 'document': args.document_rate},
+        album_rate=args.album_rate, media_size=args.media_size, hours=args.hours, seed=args.seed,
+    )
+    llm = StubLLMServer(args.llm_latency, args.llm_keep_ratio, seed=args.seed).start()
+    bot = StubBotApiServer(args.bot_latency, args.bot_flood_rate, seed=args.seed).start()
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format=LOG_FORMAT)
+    results = []
+    original_cwd = os.getcwd()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='news_tg_bench_') as tmp:
+            # Этапы по отдельности работают в одном каталоге (каждый читает результат
+            # предыдущего), полный конвейер - в отдельном
+            for stage in stages:
+                workdir = os.path.join(tmp, 'pipeline' if stage == 'pipeline' else 'stages')
+                os.makedirs(workdir, exist_ok=True)
+                write_config(workdir, args, corpus, llm, bot)
+                os.chdir(workdir)
+
+                import telegram_downloader
+                import message_sender
+                from metrics import REGISTRY
+
+                fake = FakeTelegramClient(
+                    corpus, latency=args.rpc_latency, flood_rate=args.flood_rate,
+                    flood_seconds=args.flood_seconds, seed=args.seed
+                )
+                telegram_downloader.TelegramClient = fake.factory
+                message_sender.TelegramClient = fake.factory
+
+                REGISTRY.metrics.clear()
+                start = time.perf_counter()
+                items, latency = await run_stage(stage, REGISTRY, corpus, math.ceil(args.hours / 24), args.takeout)
+                wall = time.perf_counter() - start
+                results.append({
+                    'stage': stage,
+                    'seconds': round(wall, 3),
+                    'items': items,
+                    'per_second': round(items / wall, 2) if wall else 0.0,
+                    'latency': {k: round(v, 4) for k, v in histogram_quantiles(latency).items()},
+                    'stage_seconds': stage_seconds(REGISTRY) if stage == 'pipeline' else {},
+                    'telegram_calls': dict(fake.calls),
+                    'telegram_flood_waits': fake.flood_waits,
+                    'bot_api_calls': dict(bot.requests),
+                    'llm_calls': dict(llm.requests),
+                })
+                bot.requests.clear()
+                llm.requests.clear()
+                os.chdir(original_cwd)
+    finally:
+        os.chdir(original_cwd)
+        llm.stop()
+        bot.stop()
+    return results
+
+
+def print_results(results):
+    print(f"\n{'Этап':<10} {'Время, с':>9} {'Элементов':>10} {'В секунду':>10} {'p50, с':>8} {'p95, с':>8} {'p99, с':>8}")
+    print("-" * 69)
+    for r in results:
+        lat = r['latency']
+        quantiles = ' '.join(f"{lat[q]:>8.3f}" if q in lat else f"{'-':>8}" for q in ('p50', 'p95', 'p99'))
+        print(f"{r['stage']:<10} {r['seconds']:>9.2f} {r['items']:>10} {r['per_second']:>10.2f} {quantiles}")
+    for r in results:
+        print(f"{r['stage']}: Telegram {r['telegram_calls']} (flood wait: {r['telegram_flood_waits']}), "
+              f"Bot API {r['bot_api_calls']}, LLM {r['llm_calls']}")
+        if r.get('stage_seconds'):
+            print(f"{r['stage']}: этапы, с {r['stage_seconds']}")
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(benchmark(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import re
+import json
+import time
+import random
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _StubServer:
+    """Локальный HTTP-сервер в фоновом потоке с записью задержек ответов."""
+
+    handler_class = None
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, seed=1):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.server = ThreadingHTTPServer((host, port), self.handler_class)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _LLMHandler(_JsonHandler):
+    def do_POST(self):
+        stub = self.server.stub
+        request = json.loads(self._body() or b'{}')
+        prompt = request.get('messages', [{}])[-1].get('content', '')
+        stub.count('chat.completions')
+        time.sleep(stub.latency)
+
+        # Номера сообщений из промпта; часть "отбрасываем", как это сделала бы модель
+        indices = [int(n) for n in re.findall(r'Сообщение #(\d+)', prompt)]
+        with stub.lock:
+            keep = [i for i in indices if stub.rng.random() < stub.keep_ratio]
+        self._reply(200, {
+            'id': 'stub', 'object': 'chat.completion', 'model': request.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': json.dumps(keep)}}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(keep) * 2},
+        })
+
+
+class StubLLMServer(_StubServer):
+    """OpenAI-совместимый /v1/chat/completions: возвращает keep_ratio номеров сообщений."""
+
+    handler_class = _LLMHandler
+
+    def __init__(self, latency=0.5, keep_ratio=0.7, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.keep_ratio = keep_ratio
+
+    @property
+    def completions_url(self):
+        return f"{self.url}/v1/chat/completions"
+
+
+class _BotApiHandler(_JsonHandler):
+    def _form(self):
+        body = self._body()
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+            )
+            form = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename() is None:
+                    form[name] = part.get_content()
+            return form
+        return {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+
+    def do_POST(self):
+        stub = self.server.stub
+        method = self.path.rsplit('/', 1)[-1]
+        form = self._form()
+        stub.count(method)
+        time.sleep(stub.latency)
+
+        with stub.lock:
+            flood = stub.flood_rate and stub.rng.random() < stub.flood_rate
+        if flood:
+            self._reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                              'parameters': {'retry_after': stub.retry_after}})
+            return
+
+        if method == 'sendMediaGroup':
+            items = json.loads(form.get('media') or '[]')
+            result = [stub.sent_message(item.get('type', 'document')) for item in items]
+        else:
+            kind = method[4:].lower() if method.startswith('send') else None
+            result = stub.sent_message(kind)
+        self._reply(200, {'ok': True, 'result': result})
+
+
+class StubBotApiServer(_StubServer):
+    """Заглушка Telegram Bot API: отвечает на send* с новыми message_id и file_id."""
+
+    handler_class = _BotApiHandler
+
+    def __init__(self, latency=0.05, flood_rate=0.0, retry_after=1, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.message_id = 0
+
+    def sent_message(self, kind):
+        with self.lock:
+            self.message_id += 1
+            message = {'message_id': self.message_id, 'date': int(time.time())}
+        file_id = f"stub_{kind}_{message['message_id']}"
+        if kind == 'photo':
+            message['photo'] = [{'file_id': file_id, 'width': 1280, 'height': 720}]
+        elif kind and kind != 'message':
+            message[kind] = {'file_id': file_id}
+        return message
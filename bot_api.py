@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from contextlib import ExitStack
+import requests
+
+logger = logging.getLogger('BotApi')
+
+DEFAULT_BOT_API_URL = "https://api.telegram.org"
+
+# Поля ответа с file_id, которые сохраняются в кассете
+_MEDIA_FIELDS = ('photo', 'video', 'audio', 'animation', 'document')
+
+
+def _summarize_result(result):
+    """Сокращенный ответ Bot API для кассеты: ID сообщения и file_id медиа."""
+    if isinstance(result, list):
+        return [_summarize_result(item) for item in result]
+    if not isinstance(result, dict):
+        return result
+    summary = {'message_id': result.get('message_id')}
+    for field in _MEDIA_FIELDS:
+        value = result.get(field)
+        if isinstance(value, list) and value:
+            summary[field] = [{'file_id': value[-1].get('file_id')}]
+        elif isinstance(value, dict):
+            summary[field] = {'file_id': value.get('file_id')}
+    return summary
+
+
+class BotApiError(Exception):
+    """Ошибка, возвращенная Telegram Bot API."""
+
+    def __init__(self, method, error_code, description, retry_after=None):
+        super().__init__(f"{method}: {error_code} {description}")
+        self.method = method
+        self.error_code = error_code
+        self.description = description or ''
+        self.retry_after = retry_after
+
+    @property
+    def is_parse_error(self):
+        """Telegram не смог разобрать разметку текста или подписи."""
+        return "can't parse entities" in self.description
+
+
+class BotApi:
+    """Минимальный клиент Telegram Bot API поверх requests."""
+
+    def __init__(self, bot_token, base_url=DEFAULT_BOT_API_URL, cassette=None):
+        """
+        Инициализация клиента.
+
+        Args:
+            bot_token: Токен бота Telegram
+            base_url: Адрес сервера Bot API (можно указать локальный сервер)
+            cassette: Кассета для записи или воспроизведения запросов
+        """
+        self.bot_token = bot_token
+        self.cassette = cassette
+        self.base_url = (base_url or DEFAULT_BOT_API_URL).rstrip('/')
+
+    def method_url(self, method):
+        """URL метода Bot API."""
+        return f"{self.base_url}/bot{self.bot_token}/{method}"
+
+    async def call(self, method, data=None, files=None):
+        """
+        Вызов метода Bot API (запрос выполняется в отдельном потоке).
+
+        Args:
+            method: Имя метода, например sendMessage
+            data: Параметры запроса; списки и словари передаются как JSON
+            files: Файлы: имя поля -> (имя файла, путь или файловый объект[, mime-тип])
+
+        Returns:
+            Поле result из ответа Bot API
+
+        Raises:
+            BotApiError: Если Bot API вернул ошибку
+        """
+        if self.cassette and self.cassette.replaying:
+            return await self._replay(method)
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(self._call_sync, method, data, files)
+        except BotApiError as e:
+            self._record(method, data, files, start, error=[e.error_code, e.description, e.retry_after])
+            raise
+        self._record(method, data, files, start, result=_summarize_result(result))
+        return result
+
+    async def call_stream(self, method, data, field, stream, filename, content_type=None):
+        """
+        Вызов метода Bot API с файлом, который передается потоком (multipart через aiohttp).
+
+        Запрос записывается в кассету и воспроизводится так же, как call().
+
+        Args:
+            method: Имя метода, например sendPhoto
+            data: Параметры запроса; списки и словари передаются как JSON
+            field: Имя поля с файлом, например photo
+            stream: Асинхронный итератор фрагментов файла
+            filename: Имя файла
+            content_type: MIME-тип файла
+
+        Returns:
+            Поле result из ответа Bot API
+
+        Raises:
+            BotApiError: Если Bot API вернул ошибку
+        """
+        if self.cassette and self.cassette.replaying:
+            return await self._replay(method)
+
+        import aiohttp
+
+        files = {field: filename}
+        start = time.perf_counter()
+        form = aiohttp.FormData()
+        for key, value in (data or {}).items():
+            if value is None:
+                continue
+            form.add_field(key, json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value))
+        form.add_field(field, stream, filename=filename, content_type=content_type or 'application/octet-stream')
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self.method_url(method), data=form) as response:
+                    try:
+                        payload = await response.json(content_type=None)
+                    except ValueError:
+                        raise BotApiError(method, response.status, (await response.text())[:200])
+            if not payload.get('ok'):
+                raise BotApiError(
+                    method,
+                    payload.get('error_code', response.status),
+                    payload.get('description', ''),
+                    (payload.get('parameters') or {}).get('retry_after')
+                )
+        except BotApiError as e:
+            self._record(method, data, files, start, error=[e.error_code, e.description, e.retry_after])
+            raise
+        result = payload.get('result')
+        self._record(method, data, files, start, result=_summarize_result(result))
+        return result
+
+    def _record(self, method, data, files, start, **outcome):
+        if not self.cassette:
+            return
+        data = data or {}
+        self.cassette.record('bot_api', {
+            'method': method,
+            'chat_id': data.get('chat_id'),
+            'text_chars': len(data.get('text') or data.get('caption') or ''),
+            'files': len(files or {}),
+            **outcome,
+        }, time.perf_counter() - start, key=method)
+
+    async def _replay(self, method):
+        """Ответ из кассеты с исходной задержкой."""
+        event = self.cassette.take('bot_api', method, fallback=False)
+        if event is None:
+            # Запросов стало больше, чем при записи - отвечаем как успешная отправка
+            return {'message_id': 0}
+        await self.cassette.wait(event)
+        if event.get('error'):
+            raise BotApiError(method, *event['error'])
+        return event['result']
+
+    def _call_sync(self, method, data, files):
+        form = {}
+        for key, value in (data or {}).items():
+            if value is None:
+                continue
+            form[key] = json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+        with ExitStack() as stack:
+            prepared = None
+            if files:
+                prepared = {}
+                for name, (filename, source, *rest) in files.items():
+                    if isinstance(source, (str, os.PathLike)):
+                        fileobj = stack.enter_context(open(source, 'rb'))
+                    else:
+                        # Файловый объект перематываем, чтобы повторная попытка отправила файл целиком
+                        fileobj = source
+                        fileobj.seek(0)
+                    prepared[name] = (filename, fileobj, *rest)
+            response = requests.post(self.method_url(method), data=form, files=prepared)
+
+        try:
+            payload = response.json()
+        except ValueError:
+            raise BotApiError(method, response.status_code, response.text[:200])
+        if not payload.get('ok'):
+            raise BotApiError(
+                method,
+                payload.get('error_code', response.status_code),
+                payload.get('description', ''),
+                (payload.get('parameters') or {}).get('retry_after')
+            )
+        return payload.get('result')
@@ -0,0 +1,152 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict, deque
+from datetime import datetime
+
+logger = logging.getLogger('Cassette')
+
+CASSETTE_VERSION = 1
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+
+class CassetteMiss(LookupError):
+    """В кассете нет записанного ответа на запрос, который обязан совпасть с записью."""
+
+
+def prompt_key(prompt):
+    """Ключ промпта LLM для поиска ответа при воспроизведении."""
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Запись и воспроизведение внешнего трафика (Telegram, LLM, Bot API).
+
+    В режиме record события копятся в памяти и при close() пишутся в
+    сжатый JSON Lines файл. В режиме replay события выдаются обратно
+    в порядке записи; ответ ищется по ключу (например, хэшу промпта), а если
+    ключ не найден - берется следующее событие того же вида (кроме запросов,
+    где чужой ответ недопустим, как у LLM: take(..., fallback=False)). Перед выдачей
+    выдерживается исходная длительность запроса, деленная на speed
+    (speed=0 - без задержек).
+    """
+
+    def __init__(self, path, mode, speed=1.0):
+        """
+        Инициализация кассеты.
+
+        Args:
+            path: Путь к файлу кассеты (.jsonl.gz)
+            mode: "record" или "replay"
+            speed: Множитель скорости воспроизведения (0 - максимально быстро)
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Неизвестный режим кассеты: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.events = []
+        self._queues = defaultdict(deque)  # вид события -> очередь для воспроизведения
+        self._by_key = defaultdict(deque)  # (вид, ключ) -> очередь
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия кассеты: {header.get('version')}")
+            for line in f:
+                event = json.loads(line)
+                self.events.append(event)
+                self._queues[event['kind']].append(event)
+                if event.get('key'):
+                    self._by_key[(event['kind'], event['key'])].append(event)
+        logger.info(f"Кассета {self.path}: {len(self.events)} событий от {header.get('recorded_at')}")
+
+    def record(self, kind, payload, duration, key=None):
+        """Запись события (только в режиме record)."""
+        if not self.recording:
+            return
+        event = {'kind': kind, 'duration': round(duration, 4), **payload}
+        if key:
+            event['key'] = key
+        self.events.append(event)
+
+    def take(self, kind, key=None, fallback=True):
+        """
+        Следующее записанное событие вида kind (при наличии - с тем же ключом).
+
+        Args:
+            kind: Вид события
+            key: Ключ события
+            fallback: Если событий с ключом нет, брать следующее событие вида kind
+
+        Returns:
+            dict: Событие или None, если события этого вида закончились
+        """
+        event = None
+        if key and self._by_key[(kind, key)]:
+            event = self._by_key[(kind, key)].popleft()
+            self._queues[kind].remove(event)
+        elif self._queues[kind] and (fallback or not key):
+            event = self._queues[kind].popleft()
+            if event.get('key'):
+                self._by_key[(kind, event['key'])].remove(event)
+        if event is None:
+            if key and self._queues[kind]:
+                logger.warning(f"В кассете нет события {kind} с ключом {key}")
+            else:
+                logger.warning(f"В кассете закончились события {kind}")
+        return event
+
+    def all(self, kind):
+        """Все оставшиеся события вида kind в порядке записи."""
+        events = list(self._queues[kind])
+        self._queues[kind].clear()
+        return events
+
+    def _delay(self, event):
+        if not event or not self.speed:
+            return 0.0
+        return event.get('duration', 0.0) / self.speed
+
+    async def wait(self, event):
+        """Выдержка исходной длительности события (асинхронно)."""
+        delay = self._delay(event)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def wait_sync(self, event):
+        """Выдержка исходной длительности события (для синхронного кода)."""
+        delay = self._delay(event)
+        if delay:
+            time.sleep(delay)
+
+    def close(self):
+        """Сохранение записанных событий (в режиме record)."""
+        if not self.recording:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            header = {'version': CASSETTE_VERSION, 'recorded_at': datetime.now().isoformat()}
+            f.write(json.dumps(header) + "\n")
+            for event in self.events:
+                f.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n")
+        os.replace(tmp_path, self.path)
+        logger.info(f"Кассета сохранена в {self.path}: {len(self.events)} событий")
@@ -0,0 +1,132 @@
+import os
+import json
+import random
+import logging
+from datetime import datetime, timedelta
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger('ChannelSchedule')
+
+
+class ChannelSchedule:
+    """Расписание опроса каналов по их активности.
+
+    Для каждого канала хранится время последнего опроса (с него начинается
+    следующая загрузка) и оценка частоты публикаций: число сообщений и часы
+    наблюдения, затухающие с периодом полураспада poll_rate_half_life_hours.
+    Интервал опроса - время, за которое в канале ожидается
+    poll_target_messages новых сообщений, в пределах
+    [poll_min_interval, poll_max_interval] со случайным отклонением poll_jitter.
+    Состояние хранится в data_dir/channel_schedule.json.
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            config: Конфигурация приложения
+        """
+        app_config = config.get('app', {})
+        self.state_file = os.path.join(config['paths']['data_dir'], 'channel_schedule.json')
+        self.min_interval = app_config.get('poll_min_interval', 60)
+        self.max_interval = app_config.get('poll_max_interval', 6 * 3600)
+        self.target_messages = app_config.get('poll_target_messages', 1)
+        self.half_life_hours = app_config.get('poll_rate_half_life_hours', 72)
+        self.jitter = app_config.get('poll_jitter', 0.1)
+        # Загрузка канала не уходит в прошлое дальше этого срока (как и при обычном запуске - не меньше суток)
+        self.max_lookback = timedelta(seconds=max(24 * 3600, self.max_interval))
+        self.channels = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.channels = json.load(f).get('channels', {})
+        except Exception as e:
+            logger.error(f"Ошибка чтения расписания опроса: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.state_file, {'channels': self.channels})
+        except Exception as e:
+            logger.error(f"Ошибка сохранения расписания опроса: {e}")
+
+    def rate(self, channel_id):
+        """Оценка частоты публикаций, сообщений в час (None - канал еще не опрашивался)."""
+        state = self.channels.get(str(channel_id))
+        if not state or not state['hours']:
+            return None
+        return state['messages'] / state['hours']
+
+    def interval(self, channel_id):
+        """Интервал опроса канала без случайного отклонения, секунд."""
+        rate = self.rate(channel_id)
+        if rate is None:
+            return self.min_interval
+        if rate <= 0:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, self.target_messages / rate * 3600))
+
+    def _next_poll(self, channel_id):
+        state = self.channels.get(str(channel_id))
+        return datetime.fromisoformat(state['next_poll']) if state else None
+
+    def due(self, channel_ids, now=None):
+        """Каналы, которые пора опросить (новые каналы - сразу)."""
+        now = now or datetime.now()
+        return [
+            channel_id for channel_id in channel_ids
+            if (self._next_poll(channel_id) or now) <= now
+        ]
+
+    def seconds_until_due(self, channel_ids, now=None):
+        """Сколько секунд до ближайшего опроса (0 - есть каналы, которые пора опросить)."""
+        now = now or datetime.now()
+        times = [self._next_poll(channel_id) or now for channel_id in channel_ids]
+        return max(0.0, (min(times) - now).total_seconds()) if times else float(self.max_interval)
+
+    def since(self, channel_id, default, now=None):
+        """
+        Начало периода загрузки канала.
+
+        Args:
+            channel_id: ID канала
+            default: Время для канала, который еще не опрашивался (время последнего обычного запуска)
+        """
+        now = now or datetime.now()
+        state = self.channels.get(str(channel_id))
+        last_polled = datetime.fromisoformat(state['last_polled']) if state and state.get('last_polled') else default
+        return max(last_polled, now - self.max_lookback)
+
+    def record(self, channel_id, count, since, polled_at):
+        """
+        Учет результата опроса и планирование следующего.
+
+        Args:
+            channel_id: ID канала
+            count: Сколько новых сообщений получено
+            since: Начало загруженного периода
+            polled_at: Время начала опроса (с него начнется следующая загрузка)
+
+        Returns:
+            float: Интервал до следующего опроса, секунд
+        """
+        key = str(channel_id)
+        state = self.channels.get(key) or {'messages': 0.0, 'hours': 0.0}
+        hours = max((polled_at - since).total_seconds() / 3600, 0.0)
+        decay = 0.5 ** (hours / self.half_life_hours)
+        state['messages'] = state['messages'] * decay + count
+        state['hours'] = state['hours'] * decay + hours
+        state['last_polled'] = polled_at.isoformat()
+        self.channels[key] = state
+        interval = self.interval(channel_id) * random.uniform(1 - self.jitter, 1 + self.jitter)
+        state['next_poll'] = (polled_at + timedelta(seconds=interval)).isoformat()
+        return interval
+
+    def defer(self, channel_id, now=None):
+        """Перенос опроса канала, который не удалось получить, на poll_max_interval (курсор не меняется)."""
+        now = now or datetime.now()
+        state = self.channels.setdefault(str(channel_id), {'messages': 0.0, 'hours': 0.0})
+        state.setdefault('last_polled', None)
+        state['next_poll'] = (now + timedelta(seconds=self.max_interval)).isoformat()
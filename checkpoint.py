@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger('Checkpoint')
+
+
+def messages_key(messages, batch_size):
+    """Ключ входных данных этапа: при другом наборе сообщений чекпойнт не используется."""
+    digest = hashlib.sha1(str(batch_size).encode('utf-8'))
+    for msg in messages:
+        digest.update(f"\0{msg.get('channel_id')}:{msg.get('id')}:{msg.get('message', '')}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BatchCheckpoint:
+    """Результаты обработанных партий этапа анализа.
+
+    После каждой партии, для которой LLM вернул ответ, в файл атомарно
+    записываются позиции выбранных сообщений. Повторный запуск на тех же
+    входных данных берет готовые партии из файла и отправляет в LLM только
+    оставшиеся. После успешного завершения этапа файл удаляется.
+    """
+
+    def __init__(self, data_dir, stage, input_key):
+        """
+        Args:
+            data_dir: Каталог данных (чекпойнты лежат в data_dir/checkpoints)
+            stage: Этап ("filter" или "unique")
+            input_key: Ключ входных данных (messages_key)
+        """
+        self.path = os.path.join(data_dir, 'checkpoints', f"{stage}.json")
+        self.stage = stage
+        self.input_key = input_key
+        self.batches = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения чекпойнта {self.path}: {e}")
+            return
+        if data.get('input') != self.input_key:
+            logger.info(f"Чекпойнт этапа {self.stage} относится к другим сообщениям и не используется")
+            return
+        self.batches = {int(start): positions for start, positions in data.get('batches', {}).items()}
+        if self.batches:
+            logger.info(f"Этап {self.stage}: из чекпойнта восстановлено партий: {len(self.batches)}")
+
+    def get(self, batch_start):
+        """Позиции сообщений, выбранных в партии, или None, если партия не обработана."""
+        return self.batches.get(batch_start)
+
+    def put(self, batch_start, positions):
+        """Сохранение результата партии (позиции выбранных сообщений во входном списке)."""
+        self.batches[batch_start] = list(positions)
+        try:
+            atomic_write_json(self.path, {
+                'stage': self.stage,
+                'input': self.input_key,
+                'updated_at': datetime.now().isoformat(),
+                'batches': {str(start): positions for start, positions in self.batches.items()},
+            }, indent=None)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения чекпойнта {self.path}: {e}")
+
+    def clear(self):
+        """Удаление чекпойнта после завершения этапа."""
+        self.batches = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
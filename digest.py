@@ -0,0 +1,80 @@
+import re
+import logging
+
+logger = logging.getLogger('Digest')
+
+# Разделитель между постами внутри одного сообщения-дайджеста
+DIGEST_SEPARATOR = "\n\n———\n\n"
+
+# Ссылки [текст](url) и код `...` в разметке Markdown
+_LINK_RE = re.compile(r'\[[^\]\n]*\]\([^)\n]*\)')
+_CODE_RE = re.compile(r'`[^`\n]*`')
+
+
+def markdown_is_balanced(text):
+    """
+    Проверка, что все сущности Markdown внутри поста закрыты.
+
+    Пост с непарными *, _ или ` нельзя склеивать с другими: Telegram
+    "замкнет" такую сущность на символе из соседнего поста.
+    """
+    stripped = _LINK_RE.sub('', text)
+    stripped = _CODE_RE.sub('', stripped)
+    if '`' in stripped or '[' in stripped:
+        return False
+    return stripped.count('*') % 2 == 0 and stripped.count('_') % 2 == 0
+
+
+def pack_posts(posts, limit=4096, strategy='greedy', separator=DIGEST_SEPARATOR, check_markdown=True):
+    """
+    Упаковка постов в сообщения-дайджесты длиной не более limit символов.
+
+    Посты никогда не разрезаются. Пост длиннее лимита или с незакрытой
+    разметкой отправляется отдельным сообщением.
+
+    Args:
+        posts: Тексты постов (с заголовками)
+        limit: Максимальная длина сообщения
+        strategy: "greedy" - по порядку, новое сообщение при переполнении;
+                  "first_fit" - first-fit decreasing, меньше сообщений, но порядок постов меняется
+        separator: Разделитель между постами
+        check_markdown: Не склеивать посты с незакрытой разметкой Markdown
+                        (не нужно, если разметка передается сущностями)
+
+    Returns:
+        list: Список сообщений, каждое - список индексов постов из posts
+    """
+    bins = []     # списки индексов постов
+    lengths = []  # длина текста каждого сообщения
+
+    order = list(range(len(posts)))
+    if strategy == 'first_fit':
+        order.sort(key=lambda i: -len(posts[i]))
+
+    for i in order:
+        post_len = len(posts[i])
+        if post_len > limit or (check_markdown and not markdown_is_balanced(posts[i])):
+            bins.append([i])
+            lengths.append(limit)  # Закрываем сообщение для других постов
+            continue
+
+        if strategy == 'first_fit':
+            candidates = range(len(bins))
+        else:
+            candidates = range(len(bins) - 1, len(bins)) if bins else range(0)
+
+        for b in candidates:
+            if lengths[b] + len(separator) + post_len <= limit:
+                bins[b].append(i)
+                lengths[b] += len(separator) + post_len
+                break
+        else:
+            bins.append([i])
+            lengths.append(post_len)
+
+    if strategy == 'first_fit':
+        # Внутри сообщения восстанавливаем исходный порядок постов
+        for b in bins:
+            b.sort()
+        bins.sort(key=lambda b: b[0])
+    return bins
@@ -1,40 +1,18 @@
 import os
 import json
 import asyncio
-import sys
 import logging
+import argparse
+from datetime import datetime, timedelta, timezone
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 from telethon.tl.types import Channel, Chat
+from telethon.utils import get_peer_id
+from log_setup import setup_logging
+from atomic_io import atomic_write_json
 
-# Настройка логирования (можно использовать ту же логику, что в main.py)
-class EmojiSafeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            try:
-                stream.write(msg + self.terminator)
-            except UnicodeEncodeError:
-                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/list_channels_log.txt", mode='w', encoding='utf-8'),
-        EmojiSafeStreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('ListChannelsScript')
 
-# Ensure logs dir
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-
 def load_config(config_path='config.json'):
     """Загрузка конфигурации из JSON файла."""
     try:
@@ -45,10 +23,171 @@ def load_config(config_path='config.json'):
         logger.critical(f"Ошибка загрузки конфигурации: {e}")
         raise
 
-async def list_dialogs():
-    """Получение и вывод списка чатов/каналов."""
-    config = load_config()
-    
+def dialog_record(dialog):
+    """
+    Данные диалога для кэша.
+
+    ID записывается в том же виде, что и в config.json: "-100..." для каналов
+    и супергрупп, "-..." для обычных групп (telethon.utils.get_peer_id).
+
+    Returns:
+        dict: Запись или None, если диалог - не канал и не группа
+    """
+    entity = dialog.entity
+    if isinstance(entity, Channel):
+        kind = 'channel' if entity.broadcast else 'megagroup'
+    elif isinstance(entity, Chat):
+        kind = 'group'
+    else:
+        return None
+    return {
+        'id': str(get_peer_id(entity)),
+        'title': getattr(entity, 'title', None) or 'Без названия',
+        'type': kind,
+        'username': getattr(entity, 'username', None),
+        'participants_count': getattr(entity, 'participants_count', None),
+        'last_message_id': dialog.message.id if dialog.message else None,
+        'last_message_date': dialog.date.isoformat() if dialog.date else None,
+        'unread_count': dialog.unread_count,
+        'pinned': dialog.pinned,
+        'archived': dialog.archived,
+    }
+
+class DialogCache:
+    """Кэш каналов и групп аккаунта (data_dir/dialogs.json).
+
+    Telegram отдает диалоги от последних по времени сообщения к старым
+    (закрепленные - первыми), поэтому обновление идет с начала списка и
+    останавливается на первом незакрепленном диалоге, у которого не
+    изменились последнее сообщение и число непрочитанных: все следующие
+    диалоги тоже не менялись. Полное обновление (full) проходит весь
+    список и удаляет диалоги, из которых аккаунт вышел.
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            config: Конфигурация приложения
+        """
+        self.cache_file = os.path.join(config['paths']['data_dir'], 'dialogs.json')
+        self.dialogs = {}
+        self.updated_at = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.dialogs = data.get('dialogs', {})
+            self.updated_at = data.get('updated_at')
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша диалогов: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.cache_file, {'updated_at': self.updated_at, 'dialogs': self.dialogs})
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша диалогов: {e}")
+
+    def _unchanged(self, record):
+        cached = self.dialogs.get(record['id'])
+        return (
+            cached is not None
+            and cached['last_message_id'] == record['last_message_id']
+            and cached['unread_count'] == record['unread_count']
+        )
+
+    async def refresh(self, client, full=False):
+        """
+        Обновление кэша.
+
+        Args:
+            client: Авторизованный TelegramClient
+            full: Пройти весь список диалогов (иначе - до первого неизмененного)
+
+        Returns:
+            tuple: (просмотрено диалогов, обновлено записей)
+        """
+        full = full or not self.dialogs
+        seen, updated = {}, 0
+        viewed = 0
+        async for dialog in client.iter_dialogs():
+            viewed += 1
+            record = dialog_record(dialog)
+            if record is None:
+                continue
+            if not full and not dialog.pinned and self._unchanged(record):
+                break
+            if not self._unchanged(record):
+                updated += 1
+            seen[record['id']] = record
+        if full:
+            removed = len(set(self.dialogs) - set(seen))
+            if removed:
+                logger.info(f"Удалено диалогов, недоступных аккаунту: {removed}")
+            self.dialogs = seen
+        else:
+            self.dialogs.update(seen)
+        self.updated_at = datetime.now().isoformat()
+        self.save()
+        return viewed, updated
+
+    def select(self, kinds=None, active_days=None, text=None):
+        """
+        Диалоги из кэша, от последних по времени сообщения к старым.
+
+        Args:
+            kinds: Типы ("channel", "megagroup", "group"), None - все
+            active_days: Только с сообщениями за последние N дней
+            text: Подстрока названия или username
+
+        Returns:
+            list: Записи кэша
+        """
+        since = datetime.now(timezone.utc) - timedelta(days=active_days) if active_days else None
+        result = []
+        for record in self.dialogs.values():
+            if kinds and record['type'] not in kinds:
+                continue
+            if since and not (record['last_message_date'] and datetime.fromisoformat(record['last_message_date']) >= since):
+                continue
+            if text and text.lower() not in f"{record['title']} {record['username'] or ''}".lower():
+                continue
+            result.append(record)
+        result.sort(key=lambda r: r['last_message_date'] or '', reverse=True)
+        return result
+
+def export_channels(config_path, config, records):
+    """
+    Добавление каналов в список channels файла config.json (уже добавленные не дублируются).
+
+    Returns:
+        list: ID добавленных каналов
+    """
+    channels = config.get('channels', [])
+    existing = {str(channel_id) for channel_id in channels}
+    added = [record['id'] for record in records if record['id'] not in existing]
+    if added:
+        config['channels'] = channels + added
+        atomic_write_json(config_path, config, indent=4)
+    return added
+
+def print_dialogs(records, config):
+    """Таблица диалогов; * - канал уже есть в config.json."""
+    configured = {str(channel_id) for channel_id in config.get('channels', [])}
+    print("\nСписок ваших каналов и групп (для добавления в config.json; * - уже добавлен):\n")
+    print(f"  {'ID':<16} {'Тип':<10} {'Непрочит.':>9} {'Последнее':<16}  {'Название'}")
+    print("-" * 80)
+    for record in records:
+        mark = '*' if record['id'] in configured else ' '
+        date = (record['last_message_date'] or '')[:16].replace('T', ' ')
+        print(f"{mark} {record['id']:<16} {record['type']:<10} {record['unread_count']:>9} {date:<16}  {record['title']}")
+    print(f"\nВсего: {len(records)}")
+
+async def connect(config):
+    """Подключение и авторизация клиента Telegram."""
     session_file = os.path.join(
         config['paths']['sessions_dir'],
         f'tg_session_v3_{config["telegram"]["phone"]}'
@@ -69,46 +208,69 @@ async def list_dialogs():
         sequential_updates=True
     )
 
-    try:
-        logger.info("Подключение к Telegram...")
-        await client.start(phone=config['telegram']['phone'])
+    logger.info("Подключение к Telegram...")
+    await client.start(phone=config['telegram']['phone'])
 
-        if not await client.is_user_authorized():
-            logger.info("Необходима авторизация!")
-            await client.send_code_request(config['telegram']['phone'])
-            try:
-                code = input('Введите код подтверждения: ')
-                await client.sign_in(config['telegram']['phone'], code)
-            except SessionPasswordNeededError:
-                password = input('Введите пароль двухфакторной аутентификации: ')
-                await client.sign_in(password=password)
+    if not await client.is_user_authorized():
+        logger.info("Необходима авторизация!")
+        await client.send_code_request(config['telegram']['phone'])
+        try:
+            code = input('Введите код подтверждения: ')
+            await client.sign_in(config['telegram']['phone'], code)
+        except SessionPasswordNeededError:
+            password = input('Введите пароль двухфакторной аутентификации: ')
+            await client.sign_in(password=password)
 
-        logger.info("Авторизация успешна!")
+    logger.info("Авторизация успешна!")
+    return client
 
-        print("\nСписок ваших чатов, групп и каналов (для добавления в config.json):\n")
-        print(f"{'ID':<20} {'Название'}")
-        print("-" * 60)
+async def list_dialogs(args, config, config_path='config.json'):
+    """Обновление кэша диалогов, вывод списка каналов/групп и экспорт в config.json."""
+    cache = DialogCache(config)
 
-        async for dialog in client.iter_dialogs():
-            entity = dialog.entity
-            if isinstance(entity, (Channel, Chat)):
-                 # Для каналов и групп используем отрицательный ID, если это необходимо для API
-                display_id = entity.id
-                if isinstance(entity, Channel) and entity.broadcast: # Это публичный или приватный канал
-                    display_id = -100 * 10**9 - entity.id # Формат ID для каналов в config.json
-                elif isinstance(entity, Chat): # Это группа
-                     display_id = -entity.id # Формат ID для групп
-                
-                # Используем title или name в зависимости от типа
-                title = getattr(entity, 'title', getattr(entity, 'name', 'Без названия'))
-                print(f"{str(display_id):<20} {title}")
+    if not args.offline:
+        client = None
+        try:
+            client = await connect(config)
+            viewed, updated = await cache.refresh(client, full=args.full)
+            logger.info(f"Кэш диалогов обновлен: просмотрено {viewed}, изменилось {updated}, всего в кэше {len(cache.dialogs)}")
+        except Exception as e:
+            logger.error(f"Произошла ошибка: {e}", exc_info=True)
+            if not cache.dialogs:
+                return
+            logger.warning(f"Используется кэш от {cache.updated_at}")
+        finally:
+            if client:
+                await client.disconnect()
+                logger.info("Клиент Telegram отключен.")
+    elif not cache.dialogs:
+        logger.error("Кэш диалогов пуст: запустите без --offline")
+        return
 
-    except Exception as e:
-        logger.error(f"Произошла ошибка: {e}", exc_info=True)
-    finally:
-        if client:
-            await client.disconnect()
-            logger.info("Клиент Telegram отключен.")
+    kinds = None if args.type == 'all' else (['channel'] if args.type == 'channel' else ['megagroup', 'group'])
+    records = cache.select(kinds, args.active_days, args.filter)
+    print_dialogs(records, config)
+
+    if args.export:
+        added = export_channels(config_path, config, records)
+        print(f"В config.json добавлено каналов: {len(added)}" + (f" ({', '.join(added)})" if added else ""))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Список каналов и групп аккаунта с экспортом в config.json")
+    parser.add_argument('--full', action='store_true',
+                        help="Полное обновление кэша (иначе - только изменившиеся диалоги)")
+    parser.add_argument('--offline', action='store_true', help="Показать кэш без подключения к Telegram")
+    parser.add_argument('--type', choices=['all', 'channel', 'group'], default='all',
+                        help="channel - только каналы, group - группы и супергруппы")
+    parser.add_argument('--active-days', type=int, help="Только с сообщениями за последние N дней")
+    parser.add_argument('--filter', help="Подстрока названия или username")
+    parser.add_argument('--export', action='store_true',
+                        help="Добавить показанные каналы в список channels в config.json")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    asyncio.run(list_dialogs())
\ No newline at end of file
+    args = parse_args()
+    # Конфигурация загружается до настройки логирования: из нее берутся paths.log_dir и app.log_*
+    config = load_config()
+    setup_logging('list_channels', config)
+    asyncio.run(list_dialogs(args, config))
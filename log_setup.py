@@ -0,0 +1,144 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Логгеры модулей, которые дополнительно пишутся в собственный файл
+COMPONENT_LOGS = {
+    'TelegramDownloader': 'downloader',
+    'MessageAnalyzer': 'analyzer',
+    'MessageSender': 'sender',
+}
+
+_listener = None
+
+
+class EmojiSafeStreamHandler(logging.StreamHandler):
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            stream = self.stream
+            # Безопасно заменяем неподдерживаемые символы
+            try:
+                stream.write(msg + self.terminator)
+            except UnicodeEncodeError:
+                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
+            self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def _file_handler(path, max_bytes, backup_count, formatter, level):
+    """Ротируемый файл лога; предыдущий запуск уходит в .1 вместо затирания."""
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+    )
+    if backup_count and os.path.exists(path) and os.path.getsize(path) > 0:
+        handler.doRollover()
+    handler.setFormatter(formatter)
+    handler.setLevel(level)
+    return handler
+
+
+def setup_logging(name='main', config=None):
+    """
+    Настройка логирования процесса (один раз, из точки входа).
+
+    Модули пишут записи в QueueHandler корневого логгера; форматирование
+    и запись в консоль и файлы выполняет QueueListener в отдельном потоке,
+    поэтому цикл событий не ждет диска. Файлы ротируются по размеру.
+
+    Args:
+        name: Имя основного файла лога (logs/<name>_log.txt)
+        config: Конфигурация приложения (paths.log_dir, app.log_level,
+            app.log_max_bytes, app.log_backup_count)
+    """
+    global _listener
+    if _listener is not None:
+        return
+    config = config or {}
+    app_config = config.get('app', {})
+    log_dir = config.get('paths', {}).get('log_dir', 'logs')
+    level = getattr(logging, str(app_config.get('log_level', 'INFO')).upper(), logging.INFO)
+    max_bytes = app_config.get('log_max_bytes', 10 * 1024 * 1024)
+    backup_count = app_config.get('log_backup_count', 5)
+    os.makedirs(log_dir, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = EmojiSafeStreamHandler(sys.stdout)
+    console.setFormatter(formatter)
+    console.setLevel(level)
+    handlers = [console, _file_handler(os.path.join(log_dir, f"{name}_log.txt"),
+                                       max_bytes, backup_count, formatter, level)]
+    if name == 'main':
+        for logger_name, file_name in COMPONENT_LOGS.items():
+            handler = _file_handler(os.path.join(log_dir, f"{file_name}_log.txt"),
+                                    max_bytes, backup_count, formatter, level)
+            handler.addFilter(logging.Filter(logger_name))
+            handlers.append(handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Запись оставшихся в очереди сообщений и остановка потока логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class LogSummary:
+    """Сводка однотипных записей вместо строки INFO на каждое сообщение.
+
+    Каждое событие пишется на уровне DEBUG, а flush() выводит одну строку
+    INFO с количеством и первыми примерами.
+    """
+
+    def __init__(self, logger, message, examples=5):
+        """
+        Args:
+            logger: Логгер
+            message: Текст сводки ("Помечено как информативные")
+            examples: Сколько примеров показать в сводке
+        """
+        self.logger = logger
+        self.message = message
+        self.max_examples = examples
+        self.count = 0
+        self.examples = []
+
+    def add(self, example, detail=None):
+        """
+        Учет события.
+
+        Args:
+            example: Краткое обозначение для сводки (например, ID сообщения)
+            detail: Полный текст для уровня DEBUG
+        """
+        self.count += 1
+        if len(self.examples) < self.max_examples:
+            self.examples.append(str(example))
+        if detail and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(detail)
+
+    def flush(self):
+        """Вывод сводки (если были события) и сброс счетчика."""
+        if self.count:
+            more = ", ..." if self.count > len(self.examples) else ""
+            self.logger.info(f"{self.message}: {self.count} ({', '.join(self.examples)}{more})")
+        self.count = 0
+        self.examples = []
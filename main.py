@@ -1,53 +1,37 @@
 import os
 import sys
+import json
 import asyncio
 import logging
+import argparse
 from datetime import datetime
-import re
 
-# Импортируем классы из модулей
-from telegram_downloader import TelegramDownloader
-from message_analyzer import MessageAnalyzer
-from message_sender import MessageSender
+# Модули этапов (Telethon, requests, медиа) импортируются внутри команд,
+# чтобы, например, analyze не загружал Telethon
+from metrics import REGISTRY
+from log_setup import setup_logging
 
-# Настройка логирования
-class EmojiSafeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            # Безопасно заменяем неподдерживаемые символы
-            try:
-                stream.write(msg + self.terminator)
-            except UnicodeEncodeError:
-                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/main_log.txt", mode='w', encoding='utf-8'),
-        EmojiSafeStreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('TelegramParserMain')
 
-# Ensure logs directory exists
-if not os.path.exists("logs"):
-    os.makedirs("logs")
+def _stage(name, profiler=None):
+    """Таймер этапа; при включенном профилировании этап еще и профилируется."""
+    timer = REGISTRY.timer('news_tg_stage_seconds', 'Длительность этапов', stage=name)
+    return profiler.stage(name, timer) if profiler else timer
 
-async def parse_and_send():
+async def parse_and_send(cassette=None, profiler=None, config=None):
     """Основная функция для запуска всего процесса парсинга и отправки."""
+    from telegram_downloader import TelegramDownloader
+    from message_analyzer import MessageAnalyzer
+    from message_sender import MessageSender
+
     start_time = datetime.now()
     logger.info(f"Запуск процесса парсинга Telegram каналов в {start_time.isoformat()}")
     
     # Шаг 1: Загрузка сообщений из каналов
     logger.info("Шаг 1: Загрузка сообщений из каналов")
-    downloader = TelegramDownloader()
-    messages = await downloader.download_messages()
+    downloader = TelegramDownloader(cassette=cassette, config=config)
+    with _stage('download', profiler):
+        messages = await downloader.download_messages()
     
     if not messages:
         logger.warning("Не найдено новых сообщений для анализа.")
@@ -57,8 +41,9 @@ async def parse_and_send():
     
     # Шаг 2: Анализ сообщений для выявления полезных и информативных
     logger.info("Шаг 2: Фильтрация информативных сообщений")
-    analyzer = MessageAnalyzer()
-    informative_messages = analyzer.filter_informative_messages(messages)
+    analyzer = MessageAnalyzer(cassette=cassette, config=config)
+    with _stage('filter', profiler):
+        informative_messages = analyzer.filter_informative_messages(messages)
     
     if not informative_messages:
         logger.warning("Не найдено информативных сообщений после фильтрации.")
@@ -68,7 +53,8 @@ async def parse_and_send():
     
     # Шаг 3: Анализ информативных сообщений для выявления уникальных
     logger.info("Шаг 3: Анализ информативных сообщений для выявления уникальных")
-    unique_messages = analyzer.analyze_messages(informative_messages)
+    with _stage('unique', profiler):
+        unique_messages = analyzer.analyze_messages(informative_messages)
     
     if not unique_messages:
         logger.warning("Не найдено уникальных сообщений для отправки.")
@@ -78,8 +64,9 @@ async def parse_and_send():
     
     # Шаг 4: Отправка уникальных сообщений
     logger.info("Шаг 4: Отправка уникальных сообщений")
-    sender = MessageSender()
-    success = await sender.send_messages()
+    sender = MessageSender(cassette=cassette, config=config)
+    with _stage('send', profiler):
+        success = await sender.send_messages()
     
     if success:
         logger.info("Сообщения успешно отправлены")
@@ -96,21 +83,26 @@ async def parse_and_send():
     logger.info(f"Процесс парсинга завершен за {duration}")
     logger.info(f"Статистика: загружено {len(messages)} сообщений, найдено {len(informative_messages)} информативных, {len(unique_messages)} уникальных, отправлено: {len(unique_messages) if success else 0}")
 
-async def run_download():
+async def run_download(cassette=None, profiler=None, config=None):
     """Запуск только загрузки сообщений."""
+    from telegram_downloader import TelegramDownloader
+
     logger.info("Запуск загрузки сообщений из каналов")
-    downloader = TelegramDownloader()
-    messages = await downloader.download_messages()
+    downloader = TelegramDownloader(cassette=cassette, config=config)
+    with _stage('download', profiler):
+        messages = await downloader.download_messages()
     
     if messages:
         logger.info(f"Загружено {len(messages)} сообщений.")
     else:
         logger.info("Не удалось загрузить сообщения или новых сообщений нет.")
 
-async def run_analyze():
+async def run_analyze(cassette=None, profiler=None, config=None):
     """Запуск только анализа сообщений."""
+    from message_analyzer import MessageAnalyzer
+
     logger.info("Запуск анализа загруженных сообщений")
-    analyzer = MessageAnalyzer()
+    analyzer = MessageAnalyzer(cassette=cassette, config=config)
     messages = analyzer.load_messages()
     
     if not messages:
@@ -119,7 +111,8 @@ async def run_analyze():
     
     # Шаг 1: Фильтрация информативных сообщений
     logger.info("Шаг 1: Фильтрация информативных сообщений")
-    informative_messages = analyzer.filter_informative_messages(messages)
+    with _stage('filter', profiler):
+        informative_messages = analyzer.filter_informative_messages(messages)
     
     if not informative_messages:
         logger.warning("Не найдено информативных сообщений после фильтрации.")
@@ -129,18 +122,22 @@ async def run_analyze():
     
     # Шаг 2: Определение уникальных информативных сообщений
     logger.info("Шаг 2: Определение уникальных информативных сообщений")
-    unique_messages = analyzer.find_unique_messages(informative_messages)
+    with _stage('unique', profiler):
+        unique_messages = analyzer.analyze_messages(informative_messages)
     
     if unique_messages:
         logger.info(f"Найдено {len(unique_messages)} уникальных сообщений из {len(informative_messages)} информативных")
     else:
         logger.info("Не найдено уникальных сообщений")
 
-async def run_send():
+async def run_send(cassette=None, profiler=None, config=None):
     """Запуск только отправки сообщений."""
+    from message_sender import MessageSender
+
     logger.info("Запуск отправки уникальных сообщений")
-    sender = MessageSender()
-    success = await sender.send_messages()
+    sender = MessageSender(cassette=cassette, config=config)
+    with _stage('send', profiler):
+        success = await sender.send_messages()
     
     if success:
         logger.info("Сообщения успешно отправлены")
@@ -149,25 +146,341 @@ async def run_send():
         
     await sender.close()
 
-async def main():
-    """Обработка аргументов командной строки."""
-    if len(sys.argv) < 2:
-        # Если аргументов нет, запускаем `run` по умолчанию
-        await parse_and_send()
+async def run_poll(profiler=None, config=None):
+    """Постоянный опрос каналов по расписанию их активности с анализом и отправкой новых сообщений.
+
+    Каждый канал опрашивается со своим интервалом (см. ChannelSchedule):
+    активные - чаще, редко пишущие - реже. Работает до прерывания (Ctrl+C).
+    """
+    from telegram_downloader import TelegramDownloader
+    from message_analyzer import MessageAnalyzer
+    from message_sender import MessageSender
+    from channel_schedule import ChannelSchedule
+
+    schedule = ChannelSchedule(config)
+    downloader = TelegramDownloader(config=config)
+    # Отправитель создается один раз и пересылает через подключенный клиент загрузчика
+    sender = MessageSender(config=config)
+    logger.info(f"Опрос {len(config['channels'])} каналов по расписанию: интервал "
+                f"{schedule.min_interval}-{schedule.max_interval} с")
+    try:
+        while True:
+            try:
+                with _stage('download', profiler):
+                    messages = await downloader.poll_channels(schedule)
+                if messages:
+                    analyzer = MessageAnalyzer(config=config)
+                    # Анализ синхронный: выполняется в потоке, чтобы клиенты Telegram оставались на связи
+                    with _stage('filter', profiler):
+                        informative_messages = await asyncio.to_thread(analyzer.filter_informative_messages, messages)
+                    unique_messages = []
+                    if informative_messages:
+                        with _stage('unique', profiler):
+                            unique_messages = await asyncio.to_thread(analyzer.analyze_messages, informative_messages)
+                    if unique_messages:
+                        sender.share_client(downloader.client)
+                        with _stage('send', profiler):
+                            await sender.send_messages(unique_messages)
+            except Exception as e:
+                # Ошибка одного опроса (LLM, Bot API, отправка) не должна останавливать опрос;
+                # недоставленное остается в outbox и будет отправлено при следующей отправке
+                logger.error(f"Ошибка при обработке опроса: {e}", exc_info=True)
+            await asyncio.sleep(max(1.0, schedule.seconds_until_due(config['channels'])))
+    finally:
+        await sender.close()
+        await downloader.close()
+
+async def run_backfill(config, args, profiler=None):
+    """Загрузка истории каналов за --days дней (курсоры обычной загрузки не меняются)."""
+    from backfill import HistoryBackfill
+
+    backfill = HistoryBackfill(args.days, args.channel, args.takeout, config=config)
+    with _stage('backfill', profiler):
+        completed = await backfill.run()
+    if completed:
+        logger.info("История всех каналов загружена")
+    else:
+        logger.warning("История загружена не полностью, повторный запуск продолжит загрузку")
+
+def _format_bytes(size):
+    """Размер в человекочитаемом виде."""
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024 or unit == 'ГБ':
+            return f"{size:.1f} {unit}" if unit != 'Б' else f"{size} {unit}"
+        size /= 1024
+
+def _load_config(config_path='config.json'):
+    """Загрузка конфигурации из JSON файла."""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+async def run_login(config):
+    """Авторизация отдельной сессии воркера send (код подтверждения вводится в консоли)."""
+    from telegram_downloader import TelegramDownloader
+    from account_pool import sender_session
+
+    telegram_config = config['telegram']
+    account = {
+        'name': 'sender',
+        'phone': str(telegram_config['phone']),
+        'api_id': telegram_config['api_id'],
+        'api_hash': telegram_config['api_hash'],
+        'session': sender_session(config),
+    }
+    downloader = TelegramDownloader(config=config)
+    try:
+        if await downloader._connect_account(account):
+            logger.info(f"Сессия воркера send авторизована: {account['session']}.session")
+    finally:
+        await downloader.close()
+
+async def run_media(action=None, config=None):
+    """Отчет об использовании медиа-хранилища по каналам (и вытеснение при action == 'evict')."""
+    from media_store import MediaStore
+
+    config = config or _load_config()
+    store = MediaStore(config)
+
+    if action == "evict":
+        removed = await store.evict()
+        logger.info(f"Вытеснение завершено, удалено файлов: {removed}")
+
+    usage = store.usage()
+    total = sum(stats['bytes'] for stats in usage.values())
+    print(f"\n{'Канал':<20} {'Файлов':>8} {'Размер':>12}")
+    print("-" * 42)
+    for channel_id, stats in sorted(usage.items(), key=lambda item: -item[1]['bytes']):
+        print(f"{channel_id:<20} {stats['files']:>8} {_format_bytes(stats['bytes']):>12}")
+    print("-" * 42)
+    print(f"{'Всего':<20} {sum(s['files'] for s in usage.values()):>8} {_format_bytes(total):>12}")
+    print(f"Квота: {_format_bytes(store.quota_bytes)}, максимальный возраст: {store.max_age_days} дн.")
+
+def run_report(config, command="run"):
+    """Сравнение последнего запуска команды с базовой линией предыдущих запусков."""
+    from run_report import load_reports, compare
+
+    app_config = config.get('app', {})
+    baseline_runs = app_config.get('report_baseline_runs', 5)
+    threshold_pct = app_config.get('report_regression_pct', 20)
+
+    reports = load_reports(config['paths'].get('reports_dir', 'reports'), command)
+    if not reports:
+        print(f"Нет сохраненных отчетов для команды {command}")
+        return False
+    latest, baseline = reports[-1], reports[-baseline_runs - 1:-1]
+
+    print(f"\nЗапуск {latest['started_at']} ({command}), базовая линия: {len(baseline)} предыдущих запусков")
+    print(f"{'Этап':<12} {'Сейчас, с':>10} {'База, с':>10} {'Изм., %':>9}")
+    print("-" * 44)
+    rows = compare(latest, baseline, threshold_pct)
+    for row in rows:
+        flag = "  <-- медленнее" if row['regressed'] else ""
+        print(f"{row['stage']:<12} {row['latest']:>10.2f} {row['baseline']:>10.2f} {row['change_pct']:>+9.1f}{flag}")
+    if not rows:
+        print("Недостаточно данных для сравнения")
+    send = latest.get('send', {})
+    if send.get('sent'):
+        print(f"Отправка: {send['sent']} доставок, {send['per_second']} в секунду, ошибок: {send['failed']}")
+
+    regressed = [row['stage'] for row in rows if row['regressed']]
+    if regressed:
+        logger.warning(f"Этапы замедлились более чем на {threshold_pct}%: {', '.join(regressed)}")
+    return not regressed
+
+def run_search(config, args):
+    """Поиск по архиву сообщений (--reindex - проиндексировать сохраненные сообщения)."""
+    from search_index import SearchIndex
+
+    search_index = SearchIndex(config)
+    try:
+        if args.reindex:
+            count = search_index.index_archive()
+            print(f"Проиндексировано сообщений: {count}")
+        if not args.target:
+            stats = search_index.stats()
+            print(f"В индексе {stats['messages']} сообщений из {stats['channels']} каналов")
+            return
+        start = datetime.now()
+        results = search_index.search(args.target, args.channel, args.since, args.until, args.limit)
+        elapsed_ms = (datetime.now() - start).total_seconds() * 1000
+        for row in results:
+            print(f"\n[{row['date']}] {row['channel_name']} ({row['channel_id']}/{row['message_id']})")
+            print(f"  {search_index.snippet(row['text'], args.target)}")
+        print(f"\nНайдено: {len(results)} ({elapsed_ms:.1f} мс)")
+    finally:
+        search_index.close()
+
+def run_workers(config, args):
+    """
+    Воркеры этапов (worker all|download|analyze|send|status).
+
+    Вызывается вне цикла событий: supervise блокирует поток до остановки
+    воркеров, а единственный воркер этапа запускает собственный цикл.
+    """
+    from workers import STAGES, StageWorker, supervise
+
+    stage = args.target or "all"
+    if stage == "status":
+        from work_queue import WorkQueue
+
+        queue = WorkQueue(config)
+        try:
+            stats = queue.stats()
+        finally:
+            queue.close()
+        for topic, states in sorted(stats.items()):
+            print(f"{topic:<10} " + ", ".join(f"{state}: {count}" for state, count in sorted(states.items())))
+        if not stats:
+            print("Очередь пуста")
         return
-        
-    command = sys.argv[1].lower()
-    
+    if stage != "all" and stage not in STAGES:
+        logger.error(f"Неизвестный этап воркера: {stage}")
+        return
+    analyze_count = args.workers or config.get('app', {}).get('worker_analyze_processes', 1)
+    if stage == "all":
+        counts = {'download': 1, 'analyze': analyze_count, 'send': 1}
+    else:
+        counts = {stage: analyze_count if stage == "analyze" else args.workers or 1}
+    if counts.get(stage) == 1:
+        # Один воркер этапа выполняется в текущем процессе
+        asyncio.run(StageWorker(stage, config).run())
+        return
+    supervise(config, counts)
+
+async def run_command(command, target=None, cassette=None, profiler=None, config=None, args=None):
+    """Выполнение команды командной строки."""
     if command == "run":
-        await parse_and_send()
+        await parse_and_send(cassette, profiler, config)
     elif command == "download":
-        await run_download()
+        await run_download(cassette, profiler, config)
     elif command == "analyze":
-        await run_analyze()
+        await run_analyze(cassette, profiler, config)
     elif command == "send":
-        await run_send()
+        await run_send(cassette, profiler, config)
+    elif command == "poll":
+        await run_poll(profiler, config)
+    elif command == "backfill":
+        await run_backfill(config, args, profiler)
+    elif command == "media":
+        await run_media(target, config)
+    elif command == "login":
+        await run_login(config)
+
+def _date_arg(value):
+    """Проверка даты аргумента (YYYY-MM-DD или ISO); строка передается в поиск без изменений."""
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверная дата '{value}', ожидается YYYY-MM-DD или YYYY-MM-DDTHH:MM")
+    return value
+
+def parse_args():
+    """Аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Парсер Telegram-каналов с отбором уникальных новостей")
+    parser.add_argument('command', nargs='?', default='run', type=str.lower,
+                        choices=['run', 'download', 'analyze', 'send', 'poll', 'backfill', 'media', 'report', 'search', 'worker', 'login'],
+                        help="Команда (по умолчанию run)")
+    parser.add_argument('target', nargs='?',
+                        help="media: evict; report: команда, запуски которой сравниваются; search: запрос; "
+                             "worker: all, download, analyze, send или status")
+    parser.add_argument('--record', metavar='FILE',
+                        help="Записать трафик Telegram, LLM и Bot API в кассету")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="Воспроизвести трафик из кассеты без обращения к внешним сервисам")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="Скорость воспроизведения: 1 - исходные задержки, 0 - без задержек")
+    parser.add_argument('--profile', action='store_true',
+                        help="Профилировать этапы cProfile (reports_dir/profiles)")
+    parser.add_argument('--profile-loop-lag', type=float, metavar='SECONDS',
+                        help="С --profile: замерять задержку цикла событий с этим интервалом")
+    parser.add_argument('--profile-slow-callbacks', type=float, metavar='SECONDS',
+                        help="С --profile: режим отладки asyncio, callback-и дольше порога пишутся в отчет")
+    parser.add_argument('--channel', action='append', type=int,
+                        help="search: искать только в канале; backfill: загрузить историю канала "
+                             "(можно указать несколько раз)")
+    parser.add_argument('--since', type=_date_arg, help="search: с даты (YYYY-MM-DD)")
+    parser.add_argument('--until', type=_date_arg, help="search: по дату включительно (YYYY-MM-DD)")
+    parser.add_argument('--limit', type=int, default=20, help="search: максимум результатов")
+    parser.add_argument('--reindex', action='store_true',
+                        help="search: проиндексировать все сохраненные сообщения из data_dir")
+    parser.add_argument('--days', type=int, default=30, help="backfill: глубина истории, дней")
+    parser.add_argument('--takeout', action='store_true',
+                        help="backfill: загружать через takeout-сессию (экспорт данных) с более мягкими лимитами")
+    parser.add_argument('--workers', type=int,
+                        help="worker: количество процессов этапа (для all - воркеров анализа)")
+    args = parser.parse_args()
+    if args.target and args.command in ('media', 'report', 'worker'):
+        args.target = args.target.lower()
+    return args
+
+def main():
+    """Обработка аргументов командной строки.
+
+    report, search и worker выполняются без общего цикла событий,
+    остальные команды - в run_app.
+    """
+    args = parse_args()
+    command = args.command
+
+    config = _load_config()
+    setup_logging('main', config)
+    if command == "report":
+        ok = run_report(config, args.target or "run")
+        sys.exit(0 if ok else 1)
+    if command == "search":
+        run_search(config, args)
+        return
+    if command == "worker":
+        run_workers(config, args)
+        return
+    asyncio.run(run_app(config, args))
+
+async def run_app(config, args):
+    """Выполнение команды в цикле событий.
+
+    Если задан app.metrics_port, на время работы поднимается эндпоинт
+    /metrics; по завершении метрики сохраняются в reports_dir/metrics.prom.
+    """
+    command = args.command
+    cassette = None
+    if args.record or args.replay:
+        from cassette import Cassette, RECORD, REPLAY
+    if args.record:
+        cassette = Cassette(args.record, RECORD)
+    elif args.replay:
+        cassette = Cassette(args.replay, REPLAY, args.replay_speed)
+
+    reports_dir = config['paths'].get('reports_dir', 'reports')
+    profiler = None
+    if args.profile and command in ("run", "download", "analyze", "send", "backfill"):
+        from profiling import Profiler
+        profiler = Profiler(reports_dir, command, args.profile_loop_lag, args.profile_slow_callbacks, REGISTRY)
+        await profiler.start()
+
+    app_config = config.get('app', {})
+    started_at = datetime.now()
+    server = None
+    if app_config.get('metrics_port'):
+        try:
+            server = await REGISTRY.serve(app_config.get('metrics_host', '127.0.0.1'), app_config['metrics_port'])
+        except OSError as e:
+            logger.error(f"Не удалось запустить эндпоинт метрик: {e}")
+
+    try:
+        await run_command(command, args.target, cassette, profiler, config, args)
+    finally:
+        if profiler:
+            await profiler.stop()
+        if cassette:
+            cassette.close()
+        if server:
+            server.close()
+            await server.wait_closed()
+        REGISTRY.dump(os.path.join(reports_dir, 'metrics.prom'))
+        if command in ("run", "download", "analyze", "send"):
+            from run_report import build_report, save_report
+            save_report(build_report(REGISTRY, command, started_at), reports_dir)
 
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
-    
\ No newline at end of file
+    main()
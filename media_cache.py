@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger('MediaCache')
+
+
+class MediaCache:
+    """Кэш медиа-файлов, адресуемый по ID фото/документа Telegram и хэшу содержимого.
+
+    Индекс записывается на диск не после каждого изменения, а не чаще раза в
+    media_cache_save_interval секунд и при закрытии (save). Потеря последних
+    изменений при сбое приводит только к повторной загрузке медиа.
+    """
+
+    def __init__(self, config):
+        """
+        Инициализация кэша медиа.
+
+        Args:
+            config: Конфигурация приложения
+        """
+        self.data_dir = config['paths']['data_dir']
+        self.index_file = os.path.join(self.data_dir, 'media_cache.json')
+        self.entries = {}  # ключ медиа -> информация о файле
+        self.hashes = {}   # sha256 содержимого -> ключ медиа
+        # Абсолютный путь файла -> время последнего обращения в этом процессе (timestamp);
+        # вытеснение в пуле потоков проверяет его перед удалением каждого файла
+        self.used_at = {}
+        self.save_interval = config.get('app', {}).get('media_cache_save_interval', 30)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+
+    def _load(self):
+        """Загрузка индекса кэша с диска."""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            self.hashes = {
+                entry['sha256']: key
+                for key, entry in self.entries.items()
+                if entry.get('sha256')
+            }
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса медиа-кэша: {e}")
+            self.entries = {}
+            self.hashes = {}
+
+    def save(self):
+        """Сохранение индекса кэша на диск (если он изменился с прошлого сохранения)."""
+        if not self._dirty:
+            return
+        try:
+            atomic_write_json(self.index_file, {'entries': self.entries})
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения индекса медиа-кэша: {e}")
+
+    def _changed(self):
+        """Отметка изменения индекса; запись - если с прошлой прошло save_interval секунд."""
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    @staticmethod
+    def _file_sha256(path):
+        """Подсчет SHA-256 содержимого файла."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _touch(self, entry, ref=None):
+        """Отметка обращения к медиа (для LRU-вытеснения) и ссылки на сообщение."""
+        now = datetime.now()
+        entry['last_access'] = now.isoformat()
+        self._dirty = True
+        paths = [entry.get('local_path')] + [v.get('local_path') for v in entry.get('variants', {}).values()]
+        for path in paths:
+            if path:
+                self.used_at[os.path.abspath(path)] = now.timestamp()
+        if ref and ref not in entry.setdefault('refs', []):
+            entry['refs'].append(ref)
+
+    def get(self, key, ref=None):
+        """
+        Поиск медиа в кэше.
+
+        Args:
+            key: Ключ медиа (например, photo_<id> или document_<id>)
+            ref: Ссылка на сообщение, использующее медиа ("<channel_id>:<message_id>")
+
+        Returns:
+            dict: Копия информации о медиа, если файл есть на диске, иначе None
+        """
+        entry = self.entries.get(key) if key else None
+        if not entry:
+            return None
+        if not os.path.exists(entry.get('local_path') or ''):
+            # Файл был удален - запись устарела
+            return None
+        # Время обращения сохраняется вместе со следующей записью индекса
+        self._touch(entry, ref)
+        media_info = dict(entry['media_info'])
+        media_info['local_path'] = entry['local_path']
+        media_info['cache_key'] = key
+        return media_info
+
+    def get_uploaded(self, key, methods, ref=None):
+        """
+        Медиа, файл которого удален с диска, но уже загружен в Bot API.
+
+        Args:
+            key: Ключ медиа
+            methods: Методы Bot API, для каждого из которых нужен сохраненный file_id
+            ref: Ссылка на сообщение, использующее медиа
+
+        Returns:
+            dict: Информация о медиа без local_path (отправляется по file_id) или None
+        """
+        entry = self.entries.get(key) if key else None
+        if not entry or not all(entry.get('file_ids', {}).get(method) for method in methods):
+            return None
+        self._touch(entry, ref)
+        media_info = dict(entry['media_info'])
+        media_info['local_path'] = None
+        media_info['cache_key'] = key
+        return media_info
+
+    async def add(self, key, media_info, ref=None):
+        """
+        Регистрация только что загруженного файла в кэше.
+
+        Если файл с таким же содержимым уже есть в кэше, новая копия удаляется,
+        а запись ссылается на существующий файл.
+
+        Args:
+            key: Ключ медиа
+            media_info: Информация о загруженном медиа
+            ref: Ссылка на сообщение, использующее медиа ("<channel_id>:<message_id>")
+
+        Returns:
+            dict: Информация о медиа с актуальным путем к файлу
+        """
+        local_path = media_info.get('local_path')
+        if not key or not local_path or not os.path.exists(local_path):
+            return media_info
+
+        try:
+            # Хэш большого видео считается секундами: не блокируем цикл событий
+            sha256 = await asyncio.to_thread(self._file_sha256, local_path)
+        except Exception as e:
+            logger.error(f"Ошибка подсчета хэша файла {local_path}: {e}")
+            return media_info
+
+        existing_key = self.hashes.get(sha256)
+        existing = self.entries.get(existing_key) if existing_key else None
+        if existing and existing_key != key and os.path.exists(existing.get('local_path') or ''):
+            if os.path.abspath(existing['local_path']) != os.path.abspath(local_path):
+                os.remove(local_path)
+            logger.info(f"Медиа {key} совпадает по содержимому с {existing_key}, используем существующий файл")
+            local_path = existing['local_path']
+
+        previous = self.entries.get(key) or existing or {}
+        stored_info = {k: v for k, v in media_info.items() if k not in ('local_path', 'caption', 'cache_key')}
+        self.entries[key] = {
+            'local_path': local_path,
+            'sha256': sha256,
+            'size': os.path.getsize(local_path),
+            'media_info': stored_info,
+            'file_ids': dict(previous.get('file_ids', {})),
+            'refs': list(previous.get('refs', [])),
+            'created_at': datetime.now().isoformat()
+        }
+        self._touch(self.entries[key], ref)
+        self.hashes.setdefault(sha256, key)
+        self._changed()
+
+        result = dict(media_info)
+        result['local_path'] = local_path
+        result['cache_key'] = key
+        return result
+
+    def get_variant(self, key, variant):
+        """
+        Поиск преобразованной версии медиа (например, уменьшенного JPEG).
+
+        Returns:
+            dict: Путь и размер преобразованного файла или None
+        """
+        entry = self.entries.get(key) if key else None
+        if not entry:
+            return None
+        stored = entry.get('variants', {}).get(variant)
+        if not stored or not os.path.exists(stored.get('local_path') or ''):
+            return None
+        self.used_at[os.path.abspath(stored['local_path'])] = datetime.now().timestamp()
+        return stored
+
+    def set_variant(self, key, variant, local_path, size):
+        """Сохранение преобразованной версии медиа."""
+        entry = self.entries.get(key) if key else None
+        if not entry:
+            return
+        entry.setdefault('variants', {})[variant] = {'local_path': local_path, 'size': size}
+        self._changed()
+
+    def get_file_id(self, key, method):
+        """Получение file_id, ранее возвращенного Bot API для данного медиа."""
+        entry = self.entries.get(key) if key else None
+        if not entry:
+            return None
+        return entry.get('file_ids', {}).get(method)
+
+    def set_file_id(self, key, method, file_id, media_info=None):
+        """
+        Сохранение file_id, полученного от Bot API после первой загрузки.
+
+        Для медиа, переданного потоком без сохранения на диск, запись создается
+        по media_info без локального файла.
+        """
+        if not key or not file_id:
+            return
+        entry = self.entries.get(key)
+        if not entry and media_info:
+            stored_info = {k: v for k, v in media_info.items() if k not in ('local_path', 'caption', 'cache_key')}
+            entry = self.entries[key] = {
+                'local_path': None,
+                'sha256': None,
+                'size': 0,
+                'media_info': stored_info,
+                'file_ids': {},
+                'created_at': datetime.now().isoformat()
+            }
+        if not entry:
+            return
+        entry.setdefault('file_ids', {})[method] = file_id
+        self._changed()
+
+    def forget_file_id(self, key, method):
+        """Удаление недействительного file_id (например, после смены бота)."""
+        entry = self.entries.get(key) if key else None
+        if entry and entry.get('file_ids', {}).pop(method, None):
+            self._changed()
+
+    def drop_files(self, removed_paths):
+        """
+        Отметка удаленных с диска файлов в индексе.
+
+        Записи сохраняются ради file_id: такое медиа по-прежнему можно
+        отправить в Bot API по ссылке, не загружая его заново.
+        """
+        removed = {os.path.abspath(p) for p in removed_paths}
+        if not removed:
+            return
+        for entry in self.entries.values():
+            if entry.get('local_path') and os.path.abspath(entry['local_path']) in removed:
+                entry['local_path'] = None
+            variants = entry.get('variants', {})
+            for name in [n for n, v in variants.items() if os.path.abspath(v.get('local_path') or '') in removed]:
+                del variants[name]
+        self._dirty = True
+        self.save()
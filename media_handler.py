@@ -1,10 +1,34 @@
 import os
 import logging
 import asyncio
+import tempfile
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, MessageMediaWebPage
-import requests
 import re
+from media_cache import MediaCache
+from bot_api import BotApi, BotApiError, DEFAULT_BOT_API_URL
+from metrics import REGISTRY, SIZE_BUCKETS
+
+
+@functools.lru_cache(maxsize=None)
+def _optional_module(name):
+    """
+    Импорт необязательной зависимости при первом использовании.
+
+    aiohttp нужен только для потоковой передачи медиа, Pillow - только для
+    перекодирования изображений, поэтому они не загружаются при импорте модуля.
+
+    Returns:
+        module: Модуль или None, если он не установлен
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
 
 # Настройка логирования
 logger = logging.getLogger('MediaHandler')
@@ -12,19 +36,115 @@ logger = logging.getLogger('MediaHandler')
 class MediaHandler:
     """Класс для обработки медиа-вложений сообщений из Telegram."""
     
-    def __init__(self, client, config):
+    def __init__(self, client, config, scheduler=None, metrics=None, cassette=None):
         """
         Инициализация обработчика медиа.
         
         Args:
             client: Инициализированный TelegramClient
             config: Конфигурация приложения
+            scheduler: Планировщик отправок SendScheduler (опционально)
+            metrics: Реестр метрик (по умолчанию общий)
+            cassette: Кассета для записи запросов Bot API (опционально)
         """
         self.client = client
+        self.metrics = metrics or REGISTRY
+        self.cassette = cassette
         self.config = config
         self.data_dir = config['paths']['data_dir']
         self.request_delay = config.get('app', {}).get('request_delay', 0.5)
+        self.scheduler = scheduler
+        self.bot_api_url = config.get('telegram', {}).get('bot_api_url', DEFAULT_BOT_API_URL)
+        self.cache = MediaCache(config)
+        # Потоковая передача медиа из Telegram в Bot API без сохранения файлов
+        self.streaming_enabled = config.get('app', {}).get('media_streaming', False)
+        self.stream_chunk_size = config.get('app', {}).get('stream_chunk_size', 512 * 1024)
+        self.stream_buffer_chunks = config.get('app', {}).get('stream_buffer_chunks', 8)
+        self.stream_spool_threshold = config.get('app', {}).get('stream_spool_threshold', 8 * 1024 * 1024)
+        # Перекодирование изображений перед загрузкой в Bot API
+        self.transform_enabled = config.get('app', {}).get('media_transform', False)
+        self.transform_max_dimension = config.get('app', {}).get('media_max_dimension', 2560)
+        self.transform_quality = config.get('app', {}).get('media_quality', 85)
+        self.transform_format = config.get('app', {}).get('media_format', 'JPEG').upper()
+        self._transform_executor = None
+        self.transform_bytes_saved = 0
+        if self.transform_enabled and _optional_module('PIL.ImageOps') is None:
+            logger.warning("Pillow не установлен, перекодирование медиа отключено")
+            self.transform_enabled = False
+
+    @staticmethod
+    def _media_key(media):
+        """Ключ медиа для кэша: ID фото или документа Telegram."""
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            return f"photo_{media.photo.id}"
+        if isinstance(media, MessageMediaDocument) and media.document:
+            return f"document_{media.document.id}"
+        if isinstance(media, MessageMediaWebPage) and getattr(media.webpage, 'photo', None):
+            return f"photo_{media.webpage.photo.id}"
+        return None
         
+    @staticmethod
+    def _describe_media(media, base_filename):
+        """
+        Определение типа, имени файла и mime-типа медиа без его загрузки.
+
+        Args:
+            media: Объект медиа из сообщения Telegram
+            base_filename: Имя файла без расширения
+
+        Returns:
+            dict: Тип, имя файла и mime-тип или None для неподдерживаемых медиа
+        """
+        # Обрабатываем фото
+        if isinstance(media, MessageMediaPhoto):
+            return {'type': 'photo', 'filename': f"{base_filename}.jpg", 'mime_type': 'image/jpeg'}
+
+        # Обрабатываем документы (включая GIF, видео и т.д.)
+        if isinstance(media, MessageMediaDocument):
+            document = media.document
+
+            # Определяем тип документа по атрибутам
+            for attribute in document.attributes:
+                if hasattr(attribute, 'file_name') and attribute.file_name:
+                    extension = os.path.splitext(attribute.file_name)[1]
+                    break
+            else:
+                # Если имя файла не определено, используем mime-тип
+                mime_type = document.mime_type
+                if 'image' in mime_type:
+                    extension = '.jpg' if 'jpeg' in mime_type else '.png'
+                elif 'video' in mime_type:
+                    extension = '.mp4'
+                elif 'gif' in mime_type:
+                    extension = '.gif'
+                elif 'audio' in mime_type:
+                    extension = '.mp3' if 'mpeg' in mime_type else '.ogg'
+                else:
+                    extension = '.bin'  # Неизвестный тип
+
+            return {'type': 'document', 'filename': f"{base_filename}{extension}", 'mime_type': document.mime_type}
+
+        # Обрабатываем веб-страницы с изображениями
+        if isinstance(media, MessageMediaWebPage) and hasattr(media.webpage, 'photo'):
+            return {'type': 'webpage_photo', 'filename': f"{base_filename}_webpage.jpg", 'mime_type': 'image/jpeg'}
+
+        return None
+
+    @staticmethod
+    def _bot_method(media_info):
+        """Определение поля медиа в Bot API (photo, video, ...) по информации о файле."""
+        media_type = media_info.get('type', 'document')
+        mime_type = media_info.get('mime_type') or ''
+        if media_type == 'photo' or media_type == 'webpage_photo':
+            return 'photo'
+        if 'video' in mime_type:
+            return 'video'
+        if 'audio' in mime_type:
+            return 'audio'
+        if 'gif' in mime_type or (media_info.get('filename') or '').endswith('.gif'):
+            return 'animation'
+        return 'document'
+
     async def download_message_media(self, message, channel_id):
         """
         Загрузка медиа-файлов из сообщения.
@@ -38,6 +158,22 @@ class MediaHandler:
         """
         if not message.media:
             return None
+
+        # Одно и то же медиа, пересланное несколькими каналами, загружаем один раз
+        cache_key = self._media_key(message.media)
+        ref = f"{channel_id}:{message.id}"
+        cached = self.cache.get(cache_key, ref)
+        if cached:
+            logger.debug(f"Медиа из сообщения {message.id} канала {channel_id} найдено в кэше: {cached['filename']}")
+            return cached
+        described = self._describe_media(message.media, cache_key or 'media')
+        if described:
+            # Файл вытеснен с диска, но уже загружен в Bot API: отправка пойдет по file_id
+            methods = {self._bot_method(described), self._group_type(described)}
+            uploaded = self.cache.get_uploaded(cache_key, methods, ref)
+            if uploaded:
+                logger.debug(f"Медиа из сообщения {message.id} канала {channel_id} не загружается: есть file_id")
+                return uploaded
             
         media_info = {
             'type': None,
@@ -52,81 +188,32 @@ class MediaHandler:
         os.makedirs(channel_media_dir, exist_ok=True)
         
         try:
-            # Генерируем имя файла с датой и ID сообщения для уникальности
-            date_str = datetime.now().strftime('%Y%m%d%H%M%S')
-            base_filename = f"{date_str}_{message.id}"
-            
-            # Обрабатываем фото
-            if isinstance(message.media, MessageMediaPhoto):
-                media_info['type'] = 'photo'
-                filename = f"{base_filename}.jpg"
-                local_path = os.path.join(channel_media_dir, filename)
-                
-                # Загружаем фото
-                await message.download_media(local_path)
-                media_info['local_path'] = local_path
-                media_info['filename'] = filename
-                media_info['mime_type'] = 'image/jpeg'
-                
-                logger.info(f"Загружено фото из сообщения {message.id} канала {channel_id}")
-                
-            # Обрабатываем документы (включая GIF, видео и т.д.)
-            elif isinstance(message.media, MessageMediaDocument):
-                document = message.media.document
-                
-                # Определяем тип документа по атрибутам
-                for attribute in document.attributes:
-                    if hasattr(attribute, 'file_name') and attribute.file_name:
-                        original_filename = attribute.file_name
-                        extension = os.path.splitext(original_filename)[1]
-                        filename = f"{base_filename}{extension}"
-                        break
-                else:
-                    # Если имя файла не определено, используем mime-тип
-                    mime_type = document.mime_type
-                    if 'image' in mime_type:
-                        extension = '.jpg' if 'jpeg' in mime_type else '.png'
-                    elif 'video' in mime_type:
-                        extension = '.mp4'
-                    elif 'gif' in mime_type:
-                        extension = '.gif'
-                    elif 'audio' in mime_type:
-                        extension = '.mp3' if 'mpeg' in mime_type else '.ogg'
-                    else:
-                        extension = '.bin'  # Неизвестный тип
-                    
-                    filename = f"{base_filename}{extension}"
-                
-                local_path = os.path.join(channel_media_dir, filename)
-                
-                # Загружаем документ
-                await message.download_media(local_path)
-                
-                media_info['type'] = 'document'
-                media_info['local_path'] = local_path
-                media_info['filename'] = filename
-                media_info['mime_type'] = document.mime_type
-                
-                logger.info(f"Загружен документ из сообщения {message.id} канала {channel_id}")
-                
-            # Обрабатываем веб-страницы с изображениями
-            elif isinstance(message.media, MessageMediaWebPage) and hasattr(message.media.webpage, 'photo'):
-                media_info['type'] = 'webpage_photo'
-                filename = f"{base_filename}_webpage.jpg"
-                local_path = os.path.join(channel_media_dir, filename)
-                
-                # Загружаем фото из веб-страницы
-                await message.download_media(local_path)
-                media_info['local_path'] = local_path
-                media_info['filename'] = filename
-                media_info['mime_type'] = 'image/jpeg'
-                
-                logger.info(f"Загружено фото из веб-страницы, сообщение {message.id} канала {channel_id}")
-            
-            else:
+            # Имя файла определяется ID медиа, чтобы повторные загрузки попадали в тот же файл
+            base_filename = cache_key or f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{message.id}"
+
+            described = self._describe_media(message.media, base_filename)
+            if not described:
                 logger.info(f"Неподдерживаемый тип медиа в сообщении {message.id} канала {channel_id}")
                 return None
+            media_info.update(described)
+
+            local_path = os.path.join(channel_media_dir, media_info['filename'])
+            with self.metrics.timer('news_tg_rpc_seconds', 'Длительность запросов к Telegram', method='download_media'):
+                await message.download_media(local_path)
+            media_info['local_path'] = local_path
+            self._observe_bytes(local_path, 'download')
+
+            if media_info['type'] == 'photo':
+                logger.debug(f"Загружено фото из сообщения {message.id} канала {channel_id}")
+            elif media_info['type'] == 'document':
+                logger.debug(f"Загружен документ из сообщения {message.id} канала {channel_id}")
+            else:
+                logger.debug(f"Загружено фото из веб-страницы, сообщение {message.id} канала {channel_id}")
+                
                 
+            # Регистрируем файл в кэше (с дедупликацией по содержимому)
+            media_info = await self.cache.add(cache_key, media_info, ref)
+
             # Добавляем задержку после загрузки медиа
             await asyncio.sleep(self.request_delay)
                 
@@ -136,93 +223,219 @@ class MediaHandler:
             logger.error(f"Ошибка при загрузке медиа из сообщения {message.id} канала {channel_id}: {e}")
             return None
 
-    async def forward_media_to_bot(self, bot_token, chat_id, media_info, caption=None):
+    @staticmethod
+    def _transform_image(src_path, dst_path, max_dimension, quality, image_format):
+        """
+        Уменьшение и перекодирование изображения (выполняется в пуле потоков).
+
+        Returns:
+            int: Размер результата в байтах
+        """
+        from PIL import Image, ImageOps
+
+        with Image.open(src_path) as img:
+            # Поворачиваем по EXIF Orientation, чтобы после удаления метаданных фото не "легло на бок"
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(dst_path, image_format, quality=quality, optimize=True)
+        return os.path.getsize(dst_path)
+
+    async def transform_media(self, media_info):
+        """
+        Перекодирование фото перед загрузкой в Bot API.
+
+        Изображение уменьшается до media_max_dimension по большей стороне и
+        перекодируется в media_format с качеством media_quality. Результат
+        хранится в медиа-кэше и повторно не пересчитывается. Если перекодированный
+        файл не меньше исходного, отправляется исходный.
+
+        Args:
+            media_info: Информация о медиа-файле
+
+        Returns:
+            dict: Информация о медиа с путем к файлу, который нужно загрузить
+        """
+        if not self.transform_enabled or self._bot_method(media_info) != 'photo':
+            return media_info
+        src_path = media_info.get('local_path')
+        if not src_path or not os.path.exists(src_path):
+            return media_info
+
+        cache_key = media_info.get('cache_key')
+        variant = f"{self.transform_format.lower()}_{self.transform_max_dimension}_q{self.transform_quality}"
+        extension = '.webp' if self.transform_format == 'WEBP' else '.jpg'
+
+        stored = self.cache.get_variant(cache_key, variant)
+        if not stored:
+            dst_path = f"{os.path.splitext(src_path)[0]}_{variant}{extension}"
+            if self._transform_executor is None:
+                self._transform_executor = ThreadPoolExecutor(
+                    max_workers=self.config.get('app', {}).get('media_transform_workers', 2),
+                    thread_name_prefix='media-transform'
+                )
+            try:
+                loop = asyncio.get_running_loop()
+                new_size = await loop.run_in_executor(
+                    self._transform_executor, self._transform_image, src_path, dst_path,
+                    self.transform_max_dimension, self.transform_quality, self.transform_format
+                )
+            except Exception as e:
+                logger.error(f"Ошибка перекодирования {src_path}: {e}")
+                return media_info
+
+            original_size = os.path.getsize(src_path)
+            if new_size >= original_size:
+                # Перекодирование не дало выигрыша - запоминаем исходный файл
+                os.remove(dst_path)
+                dst_path, new_size = src_path, original_size
+            else:
+                logger.info(f"Изображение {media_info.get('filename')} перекодировано: "
+                            f"{original_size} -> {new_size} байт (сэкономлено {original_size - new_size})")
+                self.transform_bytes_saved += original_size - new_size
+            self.cache.set_variant(cache_key, variant, dst_path, new_size)
+            stored = {'local_path': dst_path, 'size': new_size}
+
+        if stored['local_path'] == src_path:
+            return media_info
+        result = dict(media_info)
+        result['local_path'] = stored['local_path']
+        result['filename'] = f"{os.path.splitext(media_info.get('filename') or 'photo')[0]}{extension}"
+        result['mime_type'] = 'image/webp' if extension == '.webp' else 'image/jpeg'
+        return result
+
+    def close(self):
+        """Освобождение пула потоков перекодирования и сохранение индекса кэша."""
+        if self._transform_executor:
+            self._transform_executor.shutdown(wait=False)
+            self._transform_executor = None
+        if self.transform_bytes_saved:
+            logger.info(f"Перекодирование изображений сэкономило {self.transform_bytes_saved} байт")
+        # Сохраняем время обращений к кэшу для LRU-вытеснения
+        self.cache.save()
+
+    def _observe_bytes(self, path, direction):
+        """Учет размера загруженного или выгруженного медиа в метриках."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self.metrics.histogram('news_tg_media_bytes', 'Размер медиа, байт', SIZE_BUCKETS).observe(size, direction=direction)
+
+    @staticmethod
+    def _extract_file_id(result, method):
+        """Извлечение file_id из ответа Bot API на отправку медиа."""
+        if not isinstance(result, dict):
+            return None
+        if method == 'photo':
+            # Для фото возвращается список размеров, берем самый большой
+            sizes = result.get('photo') or []
+            return sizes[-1].get('file_id') if sizes else None
+        return (result.get(method) or {}).get('file_id')
+
+    async def _bot_call(self, bot_token, chat_id, method, data, files=None):
+        """Вызов Bot API через планировщик отправок (если он задан)."""
+        bot_api = BotApi(bot_token, self.bot_api_url, self.cassette)
+        if self.scheduler:
+            return await self.scheduler.submit(chat_id, bot_api.call, method, data, files)
+        return await bot_api.call(method, data, files)
+
+    async def _post_media(self, bot_token, data, method, media_info, local_path, file_id):
+        """Отправка медиа по file_id (без передачи байтов) или загрузкой файла."""
+        api_method = f"send{method.capitalize()}"
+        if file_id:
+            return await self._bot_call(bot_token, data['chat_id'], api_method, {**data, method: file_id})
+        files = {method: (media_info.get('filename', os.path.basename(local_path)), local_path)}
+        return await self._bot_call(bot_token, data['chat_id'], api_method, data, files)
+
+    async def forward_media_to_bot(self, bot_token, chat_id, media_info, caption=None, caption_entities=None):
         """
         Пересылка медиа-файла в бот.
+
+        Если медиа уже загружалось в Bot API, повторно отправляется по сохраненному
+        file_id без передачи содержимого файла.
         
         Args:
             bot_token: Токен бота Telegram
             chat_id: ID чата/пользователя для отправки
             media_info: Информация о медиа-файле
             caption: Подпись к медиа (опционально)
+            caption_entities: Сущности Bot API для подписи; если заданы, подпись
+                              отправляется без parse_mode и не обрезается
             
         Returns:
-            bool: True если отправка успешна, иначе False
+            list: ID отправленных сообщений или False при ошибке
         """
-        if not media_info or not media_info.get('local_path'):
+        if not media_info:
             return False
             
         try:
-            local_path = media_info['local_path']
-            media_type = media_info.get('type', 'document')
-            
-            # Проверяем, что файл существует
-            if not os.path.exists(local_path):
-                logger.error(f"Файл {local_path} не найден")
-                return False
+            local_path = media_info.get('local_path') or ''
+            cache_key = media_info.get('cache_key')
                 
             # Определяем метод API в зависимости от типа файла
-            if media_type == 'photo' or media_type == 'webpage_photo':
-                url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-                method = 'photo'
-            elif 'video' in media_info.get('mime_type', ''):
-                url = f"https://api.telegram.org/bot{bot_token}/sendVideo"
-                method = 'video'
-            elif 'audio' in media_info.get('mime_type', ''):
-                url = f"https://api.telegram.org/bot{bot_token}/sendAudio"
-                method = 'audio'
-            elif 'gif' in media_info.get('mime_type', '') or media_info.get('filename', '').endswith('.gif'):
-                url = f"https://api.telegram.org/bot{bot_token}/sendAnimation"
-                method = 'animation'
-            else:
-                url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
-                method = 'document'
+            method = self._bot_method(media_info)
+            file_id = self.cache.get_file_id(cache_key, method)
+
+            # Проверяем, что файл существует (при отправке по file_id он не нужен)
+            if not file_id and not os.path.exists(local_path):
+                logger.error(f"Файл {local_path} не найден")
+                return False
+
+            # Перекодируем изображение перед загрузкой (если включено)
+            if not file_id:
+                media_info = await self.transform_media(media_info)
+                local_path = media_info['local_path']
                 
-            # Подготавливаем данные для запроса (используем Markdown)
-            data = {
-                'chat_id': chat_id,
-                'parse_mode': 'Markdown'
-            }
-            # Добавляем подпись к медиа, если есть
-            if caption:
+            # Подготавливаем данные для запроса
+            data = {'chat_id': chat_id}
+            if caption_entities is not None:
+                # Разметка передается явными сущностями - Telegram нечего разбирать
+                if caption:
+                    data['caption'] = caption
+                    data['caption_entities'] = caption_entities
+            elif caption:
+                # Подпись в Markdown
+                data['parse_mode'] = 'Markdown'
                 # Обрезаем подпись до 1024 символов
                 if len(caption) > 1024:
                     data['caption'] = caption[:1021] + "..."
                 else:
                     data['caption'] = caption
             
-            files = {
-                method: (media_info.get('filename', os.path.basename(local_path)), open(local_path, 'rb'))
-            }
-            
             # Отправляем запрос
             try:
-                response = requests.post(url, data=data, files=files)
-                response.raise_for_status()
-            except Exception as e:
-                if "can't parse entities" in str(e):
-                    logger.warning(f"Ошибка парсинга HTML, отправляем без форматирования")
-                    # Если возникла ошибка парсинга HTML, пробуем отправить без форматирования
-                    data['parse_mode'] = None
-                    response = requests.post(url, data=data, files=files)
-                    response.raise_for_status()
+                result = await self._post_media(bot_token, data, method, media_info, local_path, file_id)
+            except BotApiError as e:
+                if e.is_parse_error:
+                    logger.warning("Ошибка парсинга Markdown, отправляем без форматирования")
+                    # Если возникла ошибка парсинга разметки, пробуем отправить без форматирования
+                    data.pop('parse_mode', None)
+                    result = await self._post_media(bot_token, data, method, media_info, local_path, file_id)
+                elif file_id and os.path.exists(local_path):
+                    # file_id мог стать недействительным (например, сменился бот) - загружаем файл заново
+                    logger.warning(f"Не удалось отправить по file_id, загружаем файл заново: {e}")
+                    self.cache.forget_file_id(cache_key, method)
+                    file_id = None
+                    media_info = await self.transform_media(media_info)
+                    local_path = media_info['local_path']
+                    result = await self._post_media(bot_token, data, method, media_info, local_path, file_id)
                 else:
                     raise
+
+            if file_id:
+                logger.debug(f"Медиа-файл {media_info.get('filename')} отправлен в бот по file_id")
+            else:
+                self.cache.set_file_id(cache_key, method, self._extract_file_id(result, method))
+                self._observe_bytes(local_path, 'upload')
+                logger.debug(f"Медиа-файл {media_info.get('filename')} успешно отправлен в бот")
             
-            logger.info(f"Медиа-файл {media_info.get('filename')} успешно отправлен в бот")
-            
-            # Добавляем задержку после отправки
-            await asyncio.sleep(self.request_delay)
-            
-            return True
+            return [result['message_id']]
             
         except Exception as e:
             logger.error(f"Ошибка при отправке медиа в бот: {e}")
             return False
-        finally:
-            # Закрываем файл если он был открыт
-            if 'files' in locals() and method in files:
-                files[method][1].close()
 
     def _convert_markdown_to_html(self, text):
         """Конвертирует Markdown-форматирование в HTML."""
@@ -242,51 +455,231 @@ class MediaHandler:
         
         return text
 
-    async def forward_message_with_media(self, bot_token, chat_id, message, media_info, channel_name=None):
+    @staticmethod
+    def _group_type(media_info):
+        """Тип элемента sendMediaGroup (анимации в альбоме отправляются как документы)."""
+        method = MediaHandler._bot_method(media_info)
+        return method if method in ('photo', 'video', 'audio') else 'document'
+
+    async def _post_media_group(self, bot_token, chat_id, media_infos, caption, parse_mode, caption_entities=None):
+        """Отправка альбома: элементы с известным file_id идут по ссылке, остальные загружаются."""
+        media = []
+        files = {}
+        for i, media_info in enumerate(media_infos):
+            group_type = self._group_type(media_info)
+            item = {'type': group_type}
+            file_id = self.cache.get_file_id(media_info.get('cache_key'), group_type)
+            if file_id:
+                item['media'] = file_id
+            else:
+                attach_name = f"file{i}"
+                item['media'] = f"attach://{attach_name}"
+                files[attach_name] = (
+                    media_info.get('filename', os.path.basename(media_info['local_path'])),
+                    media_info['local_path']
+                )
+            # Подпись альбома задается у первого элемента
+            if i == 0 and caption:
+                item['caption'] = caption
+                if caption_entities is not None:
+                    item['caption_entities'] = caption_entities
+                elif parse_mode:
+                    item['parse_mode'] = parse_mode
+            media.append(item)
+
+        data = {'chat_id': chat_id, 'media': media}
+        return await self._bot_call(bot_token, chat_id, 'sendMediaGroup', data, files or None)
+
+    async def forward_media_group_to_bot(self, bot_token, chat_id, media_infos, caption=None, caption_entities=None):
         """
-        Пересылка сообщения с медиа в бот.
-        
+        Пересылка альбома в бот одним запросом sendMediaGroup.
+
         Args:
             bot_token: Токен бота Telegram
-            chat_id: ID чата/пользователя
-            message: Данные сообщения (словарь с текстом и метаданными)
-            media_info: Информация о медиа
-            channel_name: Название канала (опционально)
-        
+            chat_id: ID чата/пользователя для отправки
+            media_infos: Список информации о медиа-файлах альбома (до 10 элементов)
+            caption: Подпись к альбому (опционально)
+            caption_entities: Сущности Bot API для подписи (вместо Markdown)
+
         Returns:
-            bool: True если отправка успешна
+            list: ID отправленных сообщений или False при ошибке
         """
-        if not media_info:
+        # Элемент без файла на диске отправляется по file_id, если он сохранен
+        media_infos = [
+            m for m in media_infos
+            if m and ((m.get('local_path') and os.path.exists(m['local_path']))
+                      or self.cache.get_file_id(m.get('cache_key'), self._group_type(m)))
+        ][:10]
+        if not media_infos:
             return False
-            
+
+        # Документы и аудио нельзя смешивать в одном альбоме с фото/видео
+        group_types = {self._group_type(m) for m in media_infos}
+        if len(media_infos) == 1 or (len(group_types) > 1 and not group_types <= {'photo', 'video'}):
+            logger.info("Альбом нельзя отправить одним sendMediaGroup, отправляем медиа по одному")
+            sent_ids = []
+            for i, media_info in enumerate(media_infos):
+                sent_ids.extend(await self.forward_media_to_bot(
+                    bot_token, chat_id, media_info,
+                    caption if i == 0 else None, caption_entities if i == 0 else None
+                ) or [])
+            return sent_ids or False
+
+        if caption and caption_entities is None and len(caption) > 1024:
+            caption = caption[:1021] + "..."
+
+        # Перекодируем изображения альбома параллельно в пуле потоков
+        media_infos = list(await asyncio.gather(*(self.transform_media(m) for m in media_infos)))
+
         try:
-            # Используем существующий caption, если он передан через media_info
-            # (это может быть заголовок, добавленный в message_sender.py)
-            caption = media_info.get('caption', '')
-            
-            # Получаем текст сообщения
-            msg_text = message.get('message', '')
-            
-            # Если caption не был передан, формируем его с нуля
-            if not caption:
-                # Формируем подпись с указанием источника
-                source_info = f"*Источник: {channel_name}*" if channel_name else ""
-                date_info = f"*Дата: {message.get('date', '')}*" if message.get('date') else ""
-                
-                # Добавляем текст и метаданные
-                caption = f"{msg_text}\n\n{date_info}\n{source_info}".strip()
-            # Если caption уже содержит заголовок, но не текст сообщения, добавляем его
-            elif msg_text and msg_text not in caption:
-                caption += msg_text
-            
-            # Ограничиваем длину текста для подписи (максимум 1024 символа для подписи)
-            if len(caption) > 1024:
-                caption = caption[:1021] + "..."
-                
-            # Отправляем медиа с подписью
-            result = await self.forward_media_to_bot(bot_token, chat_id, media_info, caption)
-            return result
-            
+            try:
+                result = await self._post_media_group(bot_token, chat_id, media_infos, caption, 'Markdown', caption_entities)
+            except BotApiError as e:
+                if e.is_parse_error:
+                    logger.warning("Ошибка парсинга Markdown в подписи альбома, отправляем без форматирования")
+                    result = await self._post_media_group(bot_token, chat_id, media_infos, caption, None)
+                else:
+                    raise
+
+            # Сохраняем file_id каждого элемента для повторных отправок по ссылке
+            for media_info, sent in zip(media_infos, result or []):
+                group_type = self._group_type(media_info)
+                self.cache.set_file_id(media_info.get('cache_key'), group_type, self._extract_file_id(sent, group_type))
+
+            logger.debug(f"Альбом из {len(media_infos)} медиа успешно отправлен в бот")
+            return [sent['message_id'] for sent in result or []]
         except Exception as e:
-            logger.error(f"Ошибка при пересылке сообщения с медиа: {e}")
-            return False 
\ No newline at end of file
+            logger.error(f"Ошибка при отправке альбома в бот: {e}")
+            return False
+
+    @staticmethod
+    def _download_source(media):
+        """Объект, передаваемый в iter_download для загрузки содержимого медиа."""
+        if isinstance(media, MessageMediaWebPage):
+            return media.webpage.photo
+        return media
+
+    async def _stream_upload(self, bot_token, data, method, media_info, source):
+        """
+        Передача медиа из Telegram в Bot API потоком, без промежуточного файла.
+
+        Загрузка через iter_download и multipart-выгрузка связаны очередью
+        ограниченного размера, поэтому в памяти одновременно находится не более
+        stream_buffer_chunks фрагментов.
+
+        Returns:
+            dict: Поле result из ответа Bot API
+        """
+        queue = asyncio.Queue(maxsize=self.stream_buffer_chunks)
+
+        async def produce():
+            try:
+                async for chunk in self.client.iter_download(source, chunk_size=self.stream_chunk_size):
+                    await queue.put(chunk)
+                await queue.put(None)
+            except Exception as e:
+                # Передаем ошибку потребителю, чтобы не отправить обрезанный файл
+                await queue.put(e)
+
+        async def body():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        # Поток нельзя отправить повторно, поэтому только ждем слот без повторов
+        if self.scheduler:
+            await self.scheduler.acquire(data['chat_id'])
+
+        bot_api = BotApi(bot_token, self.bot_api_url, self.cassette)
+        producer = asyncio.create_task(produce())
+        try:
+            return await bot_api.call_stream(
+                f"send{method.capitalize()}", data, method, body(), media_info['filename'],
+                media_info.get('mime_type')
+            )
+        except BotApiError as e:
+            if e.retry_after and self.scheduler:
+                # Повтора здесь нет, но следующие отправки в этот чат должны выждать retry_after
+                logger.warning(f"Bot API просит подождать {e.retry_after} с перед отправкой в {data['chat_id']}")
+                self.scheduler.penalize(data['chat_id'], e.retry_after)
+            raise
+        finally:
+            producer.cancel()
+
+    async def _spooled_upload(self, bot_token, data, method, media_info, source):
+        """
+        Передача медиа через SpooledTemporaryFile (если aiohttp недоступен).
+
+        До stream_spool_threshold байт файл держится в памяти, сверх порога
+        сбрасывается во временный файл, который удаляется сразу после отправки.
+
+        Returns:
+            dict: Поле result из ответа Bot API
+        """
+        with tempfile.SpooledTemporaryFile(max_size=self.stream_spool_threshold) as spool:
+            async for chunk in self.client.iter_download(source, chunk_size=self.stream_chunk_size):
+                spool.write(chunk)
+            files = {method: (media_info['filename'], spool, media_info.get('mime_type'))}
+            return await self._bot_call(bot_token, data['chat_id'], f"send{method.capitalize()}", data, files)
+
+    async def stream_media_to_bot(self, bot_token, chat_id, message, caption=None, caption_entities=None):
+        """
+        Пересылка медиа из сообщения Telegram в бот без сохранения в data_dir.
+
+        Если медиа уже есть в кэше (на диске или как file_id Bot API), используется
+        обычная отправка без повторной загрузки из Telegram.
+
+        Args:
+            bot_token: Токен бота Telegram
+            chat_id: ID чата/пользователя для отправки
+            message: Объект сообщения Telegram
+            caption: Подпись к медиа (опционально)
+            caption_entities: Сущности Bot API для подписи (вместо Markdown)
+
+        Returns:
+            list: ID отправленных сообщений или False при ошибке
+        """
+        if not message.media:
+            return False
+
+        cache_key = self._media_key(message.media)
+        described = self._describe_media(message.media, cache_key or f"media_{message.id}")
+        if not described:
+            logger.info(f"Неподдерживаемый тип медиа в сообщении {message.id}")
+            return False
+        media_info = {**described, 'cache_key': cache_key}
+        method = self._bot_method(media_info)
+
+        cached = self.cache.get(cache_key)
+        if cached or self.cache.get_file_id(cache_key, method):
+            return await self.forward_media_to_bot(bot_token, chat_id, cached or media_info, caption, caption_entities)
+
+        data = {'chat_id': chat_id}
+        if caption and caption_entities is not None:
+            data['caption'] = caption
+            data['caption_entities'] = caption_entities
+        elif caption:
+            data['parse_mode'] = 'Markdown'
+            data['caption'] = caption[:1021] + "..." if len(caption) > 1024 else caption
+
+        try:
+            source = self._download_source(message.media)
+            if _optional_module('aiohttp') is not None:
+                result = await self._stream_upload(bot_token, data, method, media_info, source)
+            else:
+                result = await self._spooled_upload(bot_token, data, method, media_info, source)
+
+            self.cache.set_file_id(cache_key, method, self._extract_file_id(result, method), media_info)
+            if message.file and message.file.size:
+                self.metrics.histogram('news_tg_media_bytes', 'Размер медиа, байт', SIZE_BUCKETS).observe(
+                    message.file.size, direction='stream'
+                )
+            logger.debug(f"Медиа {media_info['filename']} передано в бот потоком")
+            return [result['message_id']]
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой отправке медиа из сообщения {message.id}: {e}")
+            return False
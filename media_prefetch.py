@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('MediaPrefetcher')
+
+
+class MediaPrefetcher:
+    """Опережающая загрузка медиа для следующих сообщений очереди отправки.
+
+    Пока отправляется сообщение N, медиа сообщений N+1..N+K уже скачиваются,
+    так что загрузка из Telegram и выгрузка в Bot API идут параллельно.
+    """
+
+    def __init__(self, media_handler, load_message, max_ahead=3, max_bytes=64 * 1024 * 1024):
+        """
+        Инициализация префетчера.
+
+        Args:
+            media_handler: Обработчик медиа (MediaHandler)
+            load_message: Корутина (channel_id, message_id или список ID) -> (channel, сообщение или список)
+            max_ahead: Максимальное число одновременных опережающих загрузок
+            max_bytes: Максимальный суммарный размер загружаемых одновременно файлов
+        """
+        self.media_handler = media_handler
+        self.load_message = load_message
+        self.max_ahead = max_ahead
+        self.max_bytes = max_bytes
+        self.tasks = {}  # (channel_id, message_id) -> asyncio.Task
+        self.bytes_in_flight = 0
+        self._bytes_changed = asyncio.Condition()
+
+    @staticmethod
+    def _key(msg):
+        return (str(msg.get('channel_id')), str(msg.get('id')))
+
+    def fill(self, messages, position):
+        """
+        Запуск опережающей загрузки медиа для сообщений после позиции position.
+
+        Args:
+            messages: Очередь сообщений на отправку
+            position: Индекс сообщения, которое отправляется сейчас
+        """
+        if self.max_ahead <= 0:
+            return
+        for msg in messages[position + 1:]:
+            active = sum(1 for task in self.tasks.values() if not task.done())
+            if active >= self.max_ahead:
+                break
+            if not msg.get('has_media'):
+                continue
+            key = self._key(msg)
+            if key not in self.tasks:
+                self.tasks[key] = asyncio.create_task(self._prefetch(msg))
+
+    async def _reserve_bytes(self, size):
+        """Ожидание, пока суммарный размер загрузок позволит начать новую."""
+        async with self._bytes_changed:
+            # Один файл больше лимита все равно загружаем, но только в одиночку
+            await self._bytes_changed.wait_for(
+                lambda: self.bytes_in_flight == 0 or self.bytes_in_flight + size <= self.max_bytes
+            )
+            self.bytes_in_flight += size
+
+    async def _release_bytes(self, size):
+        async with self._bytes_changed:
+            self.bytes_in_flight -= size
+            self._bytes_changed.notify_all()
+
+    async def _prefetch(self, msg):
+        """Загрузка сообщений Telegram (несколько для альбома) и их медиа."""
+        channel, loaded = await self.load_message(msg['channel_id'], msg.get('message_ids') or msg['id'])
+        if not loaded:
+            return [], []
+        tele_msgs = loaded if isinstance(loaded, list) else [loaded]
+
+        size = sum(getattr(getattr(m, 'file', None), 'size', None) or 0 for m in tele_msgs)
+        await self._reserve_bytes(size)
+        try:
+            media_infos = []
+            for tele_msg in tele_msgs:
+                media_info = await self.media_handler.download_message_media(tele_msg, msg['channel_id'])
+                if media_info:
+                    media_infos.append(media_info)
+        finally:
+            await self._release_bytes(size)
+        logger.debug(f"Медиа сообщения {msg['id']} загружено заранее")
+        return tele_msgs, media_infos
+
+    async def take(self, msg):
+        """
+        Получение сообщений Telegram и информации об их медиа.
+
+        Если опережающая загрузка не запускалась, медиа загружается сразу.
+
+        Returns:
+            tuple: (список сообщений Telegram, список информации о медиа);
+            для альбома в списках несколько элементов
+        """
+        task = self.tasks.pop(self._key(msg), None)
+        if task is None:
+            task = asyncio.create_task(self._prefetch(msg))
+        try:
+            return await task
+        except Exception as e:
+            logger.error(f"Ошибка опережающей загрузки медиа сообщения {msg.get('id')}: {e}")
+            return [], []
+
+    def cancel(self, msg):
+        """Отмена опережающей загрузки (например, сообщение ушло прямым форвардом)."""
+        task = self.tasks.pop(self._key(msg), None)
+        if task and not task.done():
+            task.cancel()
+            logger.debug(f"Опережающая загрузка медиа сообщения {msg.get('id')} отменена")
+
+    async def close(self):
+        """Отмена всех незавершенных загрузок."""
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,169 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from media_cache import MediaCache
+from outbox import Outbox
+
+logger = logging.getLogger('MediaStore')
+
+
+class MediaStore:
+    """Управление медиа-хранилищем data/<channel_id>/media с квотой и LRU-вытеснением."""
+
+    def __init__(self, config, cache=None):
+        """
+        Инициализация хранилища.
+
+        Args:
+            config: Конфигурация приложения
+            cache: Общий MediaCache (если не передан, создается собственный)
+        """
+        self.config = config
+        self.data_dir = config['paths']['data_dir']
+        self.cache = cache or MediaCache(config)
+        self.quota_bytes = config.get('app', {}).get('media_quota_bytes', 5 * 1024 ** 3)
+        self.max_age_days = config.get('app', {}).get('media_max_age_days', 30)
+        self.evict_interval = config.get('app', {}).get('media_evict_interval', 600)
+
+    def _media_dirs(self):
+        """Пары (ID канала, путь к каталогу media)."""
+        if not os.path.isdir(self.data_dir):
+            return
+        for name in sorted(os.listdir(self.data_dir)):
+            media_dir = os.path.join(self.data_dir, name, 'media')
+            if os.path.isdir(media_dir):
+                yield name, media_dir
+
+    def _pending_refs(self):
+        """Ссылки "<channel_id>:<message_id>" на сообщения, которые еще ожидают отправки."""
+        outbox = Outbox(self.config)
+        try:
+            return outbox.pending_refs()
+        finally:
+            outbox.close()
+
+    def _protected_paths(self):
+        """Файлы медиа, на которые ссылаются ожидающие отправки сообщения."""
+        pending = self._pending_refs()
+        protected = set()
+        for entry in self.cache.entries.values():
+            if not pending.intersection(entry.get('refs', [])):
+                continue
+            paths = [entry.get('local_path')] + [v.get('local_path') for v in entry.get('variants', {}).values()]
+            protected.update(os.path.abspath(p) for p in paths if p)
+        return protected
+
+    def _last_access_times(self):
+        """Время последнего обращения к файлам, известным кэшу."""
+        access = {}
+        for entry in self.cache.entries.values():
+            last_access = entry.get('last_access') or entry.get('created_at')
+            if not last_access:
+                continue
+            stamp = datetime.fromisoformat(last_access).timestamp()
+            paths = [entry.get('local_path')] + [v.get('local_path') for v in entry.get('variants', {}).values()]
+            for path in paths:
+                if path:
+                    access[os.path.abspath(path)] = stamp
+        return access
+
+    def _scan(self, access):
+        """Список файлов хранилища: (путь, канал, размер, время последнего обращения)."""
+        files = []
+        for channel_id, media_dir in self._media_dirs():
+            with os.scandir(media_dir) as it:
+                for item in it:
+                    if not item.is_file():
+                        continue
+                    stat = item.stat()
+                    path = os.path.abspath(item.path)
+                    # Для файлов вне индекса используем время изменения
+                    files.append((path, channel_id, stat.st_size, access.get(path, stat.st_mtime)))
+        return files
+
+    def usage(self):
+        """
+        Использование диска по каналам.
+
+        Returns:
+            dict: ID канала -> {'files': количество, 'bytes': размер}
+        """
+        usage = {}
+        for path, channel_id, size, _ in self._scan({}):
+            stats = usage.setdefault(channel_id, {'files': 0, 'bytes': 0})
+            stats['files'] += 1
+            stats['bytes'] += size
+        return usage
+
+    def _in_use(self, path, protected, started):
+        """
+        Проверка файла непосредственно перед удалением.
+
+        Вытеснение идет в пуле потоков, а загрузка медиа (в том числе
+        опережающая) продолжается: файл, записанный или использованный после
+        начала вытеснения, уже может быть нужен отправке.
+        """
+        if path in protected or self.cache.used_at.get(path, 0) >= started:
+            return True
+        try:
+            return os.path.getmtime(path) >= started
+        except OSError:
+            return True  # Файл уже удален
+
+    def _remove_files(self, files, protected, started):
+        """
+        Удаление устаревших файлов и LRU-вытеснение до квоты (выполняется в пуле потоков).
+
+        Returns:
+            list: Пути удаленных файлов
+        """
+        removed = []
+        total = sum(size for _, _, size, _ in files)
+        expire_before = (datetime.now() - timedelta(days=self.max_age_days)).timestamp() if self.max_age_days else None
+
+        for path, _, size, last_access in sorted(files, key=lambda f: f[3]):
+            expired = expire_before is not None and last_access < expire_before
+            if not expired and total <= self.quota_bytes:
+                # Файлы отсортированы по времени обращения - дальше только более свежие
+                break
+            if self._in_use(path, protected, started):
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Не удалось удалить {path}: {e}")
+                continue
+            total -= size
+            removed.append(path)
+        return removed
+
+    async def evict(self):
+        """
+        Вытеснение медиа: сначала старше media_max_age_days, затем наименее
+        недавно использованные, пока хранилище не уложится в media_quota_bytes.
+        Медиа сообщений из очереди отправки и файлы, использованные во время
+        вытеснения, не удаляются.
+
+        Returns:
+            int: Количество удаленных файлов
+        """
+        # Запас в секунду: время изменения файла в ФС огрубляется и может оказаться раньше started
+        started = datetime.now().timestamp() - 1
+        protected = self._protected_paths()
+        access = self._last_access_times()
+        files = await asyncio.to_thread(self._scan, access)
+        removed = await asyncio.to_thread(self._remove_files, files, protected, started)
+        if removed:
+            self.cache.drop_files(removed)
+            logger.info(f"Из медиа-хранилища удалено {len(removed)} файлов")
+        return len(removed)
+
+    async def run_periodically(self):
+        """Фоновое вытеснение с интервалом media_evict_interval секунд."""
+        while True:
+            try:
+                await self.evict()
+            except Exception as e:
+                logger.error(f"Ошибка вытеснения медиа: {e}")
+            await asyncio.sleep(self.evict_interval)
@@ -1,51 +1,42 @@
 import os
 import json
 import logging
-import sys
 import re
 import requests
 from datetime import datetime
 import asyncio
 import time
 import difflib
+from metrics import REGISTRY, SIZE_BUCKETS
+from cassette import CassetteMiss, prompt_key
+from log_setup import LogSummary
+from atomic_io import atomic_write_json
+from checkpoint import BatchCheckpoint, messages_key
 
-# Настройка логирования
-class EmojiSafeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            # Безопасно заменяем неподдерживаемые символы
-            try:
-                stream.write(msg + self.terminator)
-            except UnicodeEncodeError:
-                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/analyzer_log.txt", mode='w', encoding='utf-8'),
-        EmojiSafeStreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('MessageAnalyzer')
 
-# Ensure logs dir exists
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-
 class MessageAnalyzer:
-    def __init__(self, config_path='config.json'):
-        """Инициализация анализатора сообщений."""
-        self.config = self._load_config(config_path)
+    def __init__(self, config_path='config.json', metrics=None, cassette=None, config=None):
+        """Инициализация анализатора сообщений.
+
+        Args:
+            config_path: Путь к файлу конфигурации
+            metrics: Реестр метрик (по умолчанию общий)
+            cassette: Кассета для записи или воспроизведения ответов LLM
+            config: Уже загруженная конфигурация (тогда config_path не читается)
+        """
+        self.config = config if config is not None else self._load_config(config_path)
+        self.metrics = metrics or REGISTRY
+        self.cassette = cassette
         self.data_dir = self.config['paths']['data_dir']
         self.llm_enabled = self.config.get('llm', {}).get('enabled', False)
         self.llm_api_url = self.config.get('llm', {}).get('lm_studio_api_url', '')
         self.llm_model = self.config.get('llm', {}).get('lm_studio_model', 'saiga_yandexgpt_8b_gguf')
+        # Суффикс файлов чекпойнтов: у параллельных воркеров анализа они не должны совпадать
+        self.checkpoint_tag = None
+        # Запись informative_messages.json и unique_messages.json; воркеры анализа ее отключают
+        # (файлы общие для всех заданий), результат передается только через очередь
+        self.save_outputs = True
         
     def _load_config(self, config_path):
         """Загрузка конфигурации из JSON файла."""
@@ -77,8 +68,13 @@ class MessageAnalyzer:
             logger.error(f"Ошибка загрузки сообщений для анализа: {e}")
             return None
             
-    def _call_llm_api(self, prompt):
-        """Вызов API языковой модели."""
+    def _call_llm_api(self, prompt, stage='llm'):
+        """Вызов API языковой модели.
+
+        Args:
+            prompt: Текст запроса
+            stage: Этап анализа для метрик ("filter" или "unique")
+        """
         headers = {
             "Content-Type": "application/json"
         }
@@ -91,13 +87,45 @@ class MessageAnalyzer:
             "temperature": 0.4
         }
         
+        start = time.perf_counter()
         try:
-            response = requests.post(self.llm_api_url, headers=headers, json=data)
-            response.raise_for_status()
-            return response.json()
+            if self.cassette and self.cassette.replaying:
+                # Ответ из кассеты с исходной задержкой
+                # Ответ на другой промпт дал бы другой результат анализа, поэтому без подстановки
+                event = self.cassette.take('llm', prompt_key(prompt), fallback=False)
+                if event is None:
+                    raise CassetteMiss(f"В кассете нет ответа LLM на промпт {prompt_key(prompt)} (этап {stage}): "
+                                       f"входные сообщения отличаются от записанных")
+                self.cassette.wait_sync(event)
+                result = event['response']
+            else:
+                response = requests.post(self.llm_api_url, headers=headers, json=data)
+                response.raise_for_status()
+                result = response.json()
+                if self.cassette:
+                    self.cassette.record('llm', {
+                        'stage': stage,
+                        'prompt_chars': len(prompt),
+                        'response': {'choices': result.get('choices', []), 'usage': result.get('usage')},
+                    }, time.perf_counter() - start, key=prompt_key(prompt))
+        except CassetteMiss:
+            raise
         except Exception as e:
             logger.error(f"Ошибка запроса к LLM API: {e}")
-            return {"choices": [{"message": {"content": "[]"}}]}
+            self.metrics.counter('news_tg_llm_errors_total', 'Ошибки запросов к LLM').inc(stage=stage)
+            # error: результат партии не сохраняется в чекпойнт и будет запрошен повторно
+            return {"choices": [{"message": {"content": "[]"}}], "error": str(e)}
+        finally:
+            self.metrics.histogram('news_tg_llm_seconds', 'Длительность запросов к LLM').observe(
+                time.perf_counter() - start, stage=stage
+            )
+        # Если сервер не вернул usage, оцениваем токены по длине текста
+        usage = result.get('usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or len(prompt) // 4
+        self.metrics.histogram('news_tg_llm_prompt_tokens', 'Размер промпта LLM в токенах', SIZE_BUCKETS).observe(
+            prompt_tokens, stage=stage
+        )
+        return result
 
     def _normalize_text(self, text: str) -> str:
         """Нормализует текст для более корректного сравнения."""
@@ -142,6 +170,7 @@ class MessageAnalyzer:
         removed_cnt = len(messages) - len(unique_messages)
         if removed_cnt:
             logger.info(f"Удалено {removed_cnt} дублирующих сообщений перед анализом")
+            self.metrics.counter('news_tg_messages_deduped_total', 'Отброшено дубликатов').inc(removed_cnt, method='near_duplicate')
         return unique_messages
 
     def analyze_messages(self, messages):
@@ -175,10 +204,15 @@ class MessageAnalyzer:
         # Обработка партиями сообщений
         max_context_items = 30  # Максимальное количество сообщений для одного запроса
         unique_messages = []
+        marked = LogSummary(logger, "Определены как уникальные (ID)")
+        checkpoint = BatchCheckpoint(self.data_dir, self._checkpoint_stage('unique'), messages_key(messages, max_context_items))
         
         for i in range(0, len(messages), max_context_items):
             batch_size = min(max_context_items, len(messages) - i)
-            batch_messages = messages[i:i + batch_size]
+            done = checkpoint.get(i)
+            if done is not None:
+                unique_messages.extend(messages[pos] for pos in done)
+                continue
             batch_texts = message_texts[i:i + batch_size]
             batch_indices = list(range(i + 1, i + batch_size + 1))  # Индексы этой партии
             
@@ -199,7 +233,8 @@ class MessageAnalyzer:
 """
 
             # Запрос к LLM API
-            response = self._call_llm_api(prompt)
+            response = self._call_llm_api(prompt, 'unique')
+            selected = []  # позиции выбранных сообщений в messages
             
             # Обработка ответа
             try:
@@ -221,40 +256,53 @@ class MessageAnalyzer:
                             original_idx = idx - 1  # -1 потому что индексы начинаются с 1
                             if 0 <= original_idx < len(messages):
                                 unique_msg = messages[original_idx]
-                                unique_messages.append(unique_msg)
-                                logger.info(f"Сообщение #{idx} (ID: {unique_msg['id']}) из канала {unique_msg['channel_name']} определено как уникальное")
+                                selected.append(original_idx)
+                                marked.add(unique_msg['id'], f"Сообщение #{idx} (ID: {unique_msg['id']}) из канала {unique_msg['channel_name']} определено как уникальное")
                 else:
                     logger.warning(f"Не удалось извлечь массив индексов из ответа LLM: {response_text}")
                     # Если не удалось распарсить ответ, берем все сообщения текущей партии
-                    unique_messages.extend(batch_messages)
+                    selected = list(range(i, i + batch_size))
                     
             except Exception as e:
                 logger.error(f"Ошибка при обработке ответа LLM: {e}")
                 # При ошибке берем все сообщения в этой партии
-                unique_messages.extend(batch_messages)
+                selected = list(range(i, i + batch_size))
+            
+            unique_messages.extend(messages[pos] for pos in selected)
+            if 'error' not in response:
+                checkpoint.put(i, selected)
         
+        marked.flush()
         logger.info(f"Анализ завершен. Определено {len(unique_messages)} уникальных сообщений из {len(messages)}")
+        self.metrics.counter('news_tg_messages_deduped_total', 'Отброшено дубликатов').inc(
+            len(messages) - len(unique_messages), method='llm'
+        )
         
         # Сохраняем уникальные сообщения в файл
-        self._save_unique_messages(unique_messages)
+        if self._save_unique_messages(unique_messages):
+            checkpoint.clear()
         
         return unique_messages
 
+    def _checkpoint_stage(self, stage):
+        return f"{stage}_{self.checkpoint_tag}" if self.checkpoint_tag else stage
+
     def _save_unique_messages(self, unique_messages):
-        """Сохранение списка уникальных сообщений."""
-        if not unique_messages:
-            return
+        """Сохранение списка уникальных сообщений (False - при ошибке записи)."""
+        if not unique_messages or not self.save_outputs:
+            return True
             
         output_file = os.path.join(self.data_dir, 'unique_messages.json')
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'timestamp': datetime.now().isoformat(),
-                    'messages': unique_messages
-                }, f, ensure_ascii=False, indent=2)
+            atomic_write_json(output_file, {
+                'timestamp': datetime.now().isoformat(),
+                'messages': unique_messages
+            })
             logger.info(f"Уникальные сообщения сохранены в {output_file}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка сохранения уникальных сообщений: {e}")
+            return False
 
     def filter_informative_messages(self, messages):
         """Фильтрует сообщения, оставляя только информативные и полезные."""
@@ -271,9 +319,15 @@ class MessageAnalyzer:
         # Обработка сообщений партиями
         max_context_items = 30  # Максимальное количество сообщений в одном запросе
         informative_messages = []
+        marked = LogSummary(logger, "Помечены как информативные (ID)")
+        checkpoint = BatchCheckpoint(self.data_dir, self._checkpoint_stage('filter'), messages_key(messages, max_context_items))
         
         for i in range(0, len(messages), max_context_items):
             batch_size = min(max_context_items, len(messages) - i)
+            done = checkpoint.get(i)
+            if done is not None:
+                informative_messages.extend(messages[pos] for pos in done)
+                continue
             batch_messages = messages[i:i + batch_size]
             
             # Формируем контекст для LLM
@@ -301,7 +355,8 @@ class MessageAnalyzer:
 """
 
             # Запрос к LLM API
-            response = self._call_llm_api(prompt)
+            response = self._call_llm_api(prompt, 'filter')
+            selected = []  # позиции выбранных сообщений в messages
             
             # Обработка ответа
             try:
@@ -319,32 +374,44 @@ class MessageAnalyzer:
                     for idx in informative_indices:
                         if 1 <= idx <= len(batch_messages):
                             msg = batch_messages[idx - 1]  # -1 потому что индексы начинаются с 1
-                            informative_messages.append(msg)
-                            logger.info(f"Сообщение #{idx} (ID: {msg['id']}) из канала {msg['channel_name']} помечено как информативное")
+                            selected.append(i + idx - 1)
+                            marked.add(msg['id'], f"Сообщение #{idx} (ID: {msg['id']}) из канала {msg['channel_name']} помечено как информативное")
                 else:
                     logger.warning(f"Не удалось извлечь массив индексов из ответа LLM: {response_text}")
                     # Если не удалось распарсить ответ, берем все сообщения текущей партии
-                    informative_messages.extend(batch_messages)
+                    selected = list(range(i, i + batch_size))
                     
             except Exception as e:
                 logger.error(f"Ошибка при обработке ответа LLM: {e}")
                 # При ошибке берем все сообщения в этой партии
-                informative_messages.extend(batch_messages)
+                selected = list(range(i, i + batch_size))
+            
+            informative_messages.extend(messages[pos] for pos in selected)
+            if 'error' not in response:
+                checkpoint.put(i, selected)
             
             # Добавляем задержку между запросами
             time.sleep(self.request_delay if hasattr(self, 'request_delay') else 0.5)
         
+        marked.flush()
         logger.info(f"Фильтрация завершена. Определено {len(informative_messages)} информативных сообщений из {len(messages)}")
+        self.metrics.counter('news_tg_messages_filtered_total', 'Отброшено неинформативных сообщений').inc(
+            len(messages) - len(informative_messages)
+        )
         
+        if not self.save_outputs:
+            checkpoint.clear()
+            return informative_messages
+
         # Сохраняем информативные сообщения в файл
         output_file = os.path.join(self.data_dir, 'informative_messages.json')
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'timestamp': datetime.now().isoformat(),
-                    'messages': informative_messages
-                }, f, ensure_ascii=False, indent=2)
+            atomic_write_json(output_file, {
+                'timestamp': datetime.now().isoformat(),
+                'messages': informative_messages
+            })
             logger.info(f"Информативные сообщения сохранены в {output_file}")
+            checkpoint.clear()
         except Exception as e:
             logger.error(f"Ошибка сохранения информативных сообщений: {e}")
         
@@ -0,0 +1,199 @@
+import logging
+from telethon.extensions import markdown
+from telethon.helpers import add_surrogate, del_surrogate
+from telethon.tl import types
+from telethon.utils import resolve_id
+
+logger = logging.getLogger('MessageFormatter')
+
+# Лимиты Telegram на длину текста сообщения и подписи к медиа
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+# Сущности Telethon (MTProto) -> типы сущностей Bot API
+_ENTITY_TYPES = {
+    types.MessageEntityBold: 'bold',
+    types.MessageEntityItalic: 'italic',
+    types.MessageEntityUnderline: 'underline',
+    types.MessageEntityStrike: 'strikethrough',
+    types.MessageEntitySpoiler: 'spoiler',
+    types.MessageEntityCode: 'code',
+    types.MessageEntityPre: 'pre',
+    types.MessageEntityTextUrl: 'text_link',
+    types.MessageEntityBlockquote: 'blockquote',
+}
+_TELETHON_TYPES = {name: cls for cls, name in _ENTITY_TYPES.items()}
+
+
+def utf16_len(text):
+    """Длина текста в единицах UTF-16 (в них Telegram считает смещения сущностей)."""
+    return len(add_surrogate(text))
+
+
+def parse_markdown(text):
+    """
+    Разбор текста сообщения в разметке Telethon (message.text) на простой
+    текст и сущности Bot API.
+
+    Returns:
+        tuple: (текст, список сущностей Bot API)
+    """
+    plain, tl_entities = markdown.parse(text or '')
+    entities = []
+    for entity in tl_entities:
+        entity_type = _ENTITY_TYPES.get(type(entity))
+        if not entity_type or not entity.length:
+            continue
+        item = {'type': entity_type, 'offset': entity.offset, 'length': entity.length}
+        if entity_type == 'text_link':
+            item['url'] = entity.url
+        elif entity_type == 'pre' and entity.language:
+            item['language'] = entity.language
+        entities.append(item)
+    return plain, entities
+
+
+def telethon_entities(entities):
+    """Сущности Bot API -> formatting_entities для client.send_message."""
+    result = []
+    for entity in entities:
+        cls = _TELETHON_TYPES.get(entity['type'])
+        if cls is types.MessageEntityTextUrl:
+            result.append(cls(entity['offset'], entity['length'], entity['url']))
+        elif cls is types.MessageEntityPre:
+            result.append(cls(entity['offset'], entity['length'], entity.get('language', '')))
+        elif cls:
+            result.append(cls(entity['offset'], entity['length']))
+    return result
+
+
+def bare_channel_id(channel_id):
+    """
+    ID канала без префикса: "-1001234567890" (формат config.json) и
+    1234567890 (entity.id, который сохраняет загрузчик) дают 1234567890.
+
+    Returns:
+        int: ID без префикса или None, если это не число (например, название канала)
+    """
+    try:
+        return resolve_id(int(channel_id))[0]
+    except (TypeError, ValueError):
+        return None
+
+
+def message_url(msg):
+    """Ссылка на оригинал сообщения в канале."""
+    channel_id = str(msg.get('channel_id'))
+    # Для ссылок t.me/c/ убираем префикс -100
+    channel_id_clean = channel_id[4:] if channel_id.startswith('-100') else channel_id
+    return f"https://t.me/c/{channel_id_clean}/{msg.get('id')}"
+
+
+def format_header(msg):
+    """
+    Заголовок сообщения: название канала со ссылкой на оригинал.
+
+    Returns:
+        tuple: (текст, список сущностей Bot API)
+    """
+    channel_name = msg.get('channel_name') or 'Канал'
+    link = {'type': 'text_link', 'offset': 0, 'length': utf16_len(channel_name), 'url': message_url(msg)}
+    return channel_name + "\n\n", [link]
+
+
+def concat(parts, separator=''):
+    """
+    Склейка нескольких текстов с сущностями в один со сдвигом смещений.
+
+    Args:
+        parts: Пары (текст, сущности)
+        separator: Разделитель между частями
+
+    Returns:
+        tuple: (текст, список сущностей Bot API)
+    """
+    texts = []
+    entities = []
+    shift = 0
+    for i, (text, part_entities) in enumerate(parts):
+        if i:
+            texts.append(separator)
+            shift += utf16_len(separator)
+        texts.append(text)
+        entities.extend({**entity, 'offset': entity['offset'] + shift} for entity in part_entities)
+        shift += utf16_len(text)
+    return ''.join(texts), entities
+
+
+def format_post(msg, header=None):
+    """
+    Текст поста с заголовком в виде текста и сущностей Bot API.
+
+    Args:
+        msg: Данные сообщения
+        header: Готовый заголовок (текст, сущности); по умолчанию format_header(msg)
+
+    Returns:
+        tuple: (текст, список сущностей Bot API)
+    """
+    return concat([header or format_header(msg), parse_markdown(msg.get('message', '').strip())])
+
+
+def _find_cut(text, limit):
+    """Позиция разреза не дальше limit: по абзацу, строке, пробелу или жестко."""
+    for separator in ("\n\n", "\n", " "):
+        cut = text.rfind(separator, 0, limit)
+        if cut > limit // 2:
+            return cut
+    cut = limit
+    # Не разрезаем суррогатную пару
+    if '\ud800' <= text[cut - 1] <= '\udbff':
+        cut -= 1
+    return cut
+
+
+def _slice_entities(entities, start, end):
+    """Сущности, попадающие в отрезок [start, end), со смещениями относительно start."""
+    result = []
+    for entity in entities:
+        left = max(entity['offset'], start)
+        right = min(entity['offset'] + entity['length'], end)
+        if right > left:
+            result.append({**entity, 'offset': left - start, 'length': right - left})
+    return result
+
+
+def split_message(text, entities, limit=MESSAGE_LIMIT, first_limit=None):
+    """
+    Разбиение длинного текста на части не длиннее лимита Telegram.
+
+    Текст режется по границам абзацев, строк или слов; сущности, попавшие
+    на разрез, продолжаются в следующей части.
+
+    Args:
+        text: Текст
+        entities: Сущности Bot API
+        limit: Максимальная длина части в единицах UTF-16
+        first_limit: Отдельный лимит для первой части (например, для подписи к медиа)
+
+    Returns:
+        list: Пары (текст, сущности) для последовательной отправки
+    """
+    surrogate = add_surrogate(text)
+    chunks = []
+    start = 0
+    current_limit = first_limit or limit
+    while start < len(surrogate):
+        rest = surrogate[start:]
+        cut = len(rest) if len(rest) <= current_limit else _find_cut(rest, current_limit)
+        # Telegram отбрасывает пробелы по краям, сущности не должны выходить за текст
+        chunk = rest[:cut].rstrip()
+        if chunk:
+            chunks.append((del_surrogate(chunk), _slice_entities(entities, start, start + len(chunk))))
+        start += cut
+        while start < len(surrogate) and surrogate[start].isspace():
+            start += 1
+        current_limit = limit
+    if len(chunks) > 1:
+        logger.info(f"Длинное сообщение разбито на {len(chunks)} частей")
+    return chunks
@@ -1,59 +1,63 @@
 import os
 import json
+import hashlib
 import logging
-import sys
 import asyncio
-import requests
 import re
+from functools import partial
 from datetime import datetime
 from telethon import TelegramClient
 from telethon.tl.types import InputPeerUser, InputPeerChannel
 from media_handler import MediaHandler
+from media_prefetch import MediaPrefetcher
+from media_store import MediaStore
+from bot_api import BotApi, DEFAULT_BOT_API_URL
+from send_scheduler import SendScheduler
+from digest import pack_posts, DIGEST_SEPARATOR
+from message_formatter import CAPTION_LIMIT, bare_channel_id, concat, format_header, format_post, split_message, telethon_entities
+from outbox import Outbox
+from metrics import REGISTRY
 
-# Настройка логирования
-class EmojiSafeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            # Безопасно заменяем неподдерживаемые символы
-            try:
-                stream.write(msg + self.terminator)
-            except UnicodeEncodeError:
-                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/sender_log.txt", mode='w', encoding='utf-8'),
-        EmojiSafeStreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('MessageSender')
 
-# Ensure logs directory exists
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-
 class MessageSender:
-    def __init__(self, config_path='config.json'):
-        """Инициализация отправителя сообщений."""
-        self.config = self._load_config(config_path)
+    def __init__(self, config_path='config.json', metrics=None, cassette=None, config=None):
+        """Инициализация отправителя сообщений.
+
+        Args:
+            config_path: Путь к файлу конфигурации
+            metrics: Реестр метрик (по умолчанию общий)
+            cassette: Кассета для записи или воспроизведения запросов Bot API
+            config: Уже загруженная конфигурация (тогда config_path не читается)
+        """
+        self.config = config if config is not None else self._load_config(config_path)
+        self.metrics = metrics or REGISTRY
+        self.cassette = cassette
         self.data_dir = self.config['paths']['data_dir']
         self.client = None
+        self.own_client = True  # False - клиент загрузчика (share_client), его не отключаем
         self.session_file = os.path.join(
             self.config['paths']['sessions_dir'], 
             f'tg_session_v3_{self.config["telegram"]["phone"]}'
         )
         self.bot_token = self.config['telegram']['bot_token']
-        self.user_id = self.config['telegram']['user_id']
+        # Получатели: telegram.recipients или единственный telegram.user_id
+        self.recipients = self._load_recipients()
+        self.targets = {}  # chat_id получателя -> entity для прямого форварда
         self.direct_forward = self.config.get('app', {}).get('direct_forward', True)
-        self.wait_delay = 1.0  # Задержка между сообщениями
+        self.bot_api = BotApi(self.bot_token, self.config['telegram'].get('bot_api_url', DEFAULT_BOT_API_URL), cassette)
+        # Паузы между отправками определяются лимитами Telegram, а не фиксированной задержкой
+        self.scheduler = SendScheduler(self.config, self.metrics)
+        # Постоянная очередь отправки с состоянием доставки
+        self.outbox = Outbox(self.config)
         self.media_handler = None
+        # Опережающая загрузка медиа для следующих сообщений очереди
+        self.prefetch_count = self.config.get('app', {}).get('media_prefetch_count', 3)
+        self.prefetch_max_bytes = self.config.get('app', {}).get('media_prefetch_max_bytes', 64 * 1024 * 1024)
+        # Режим дайджеста: несколько текстовых постов в одном сообщении
+        self.digest_mode = self.config.get('app', {}).get('digest_mode', False)
+        self.digest_strategy = self.config.get('app', {}).get('digest_strategy', 'greedy')
+        self.digest_limit = self.config.get('app', {}).get('digest_limit', 4000)
         
     def _load_config(self, config_path):
         """Загрузка конфигурации из JSON файла."""
@@ -65,6 +69,37 @@ class MessageSender:
             logger.critical(f"Ошибка загрузки конфигурации: {e}")
             raise
 
+    def _load_recipients(self):
+        """
+        Список получателей из конфигурации.
+
+        Элемент telegram.recipients - ID чата или словарь
+        {"chat_id": ..., "channels": [...]}, где channels ограничивает
+        получателя подмножеством каналов (ID или названия).
+        ID каналов хранятся без префикса -100, как их сохраняет загрузчик.
+
+        Returns:
+            list: Словари {'chat_id': str, 'channels': set или None}
+        """
+        telegram_config = self.config['telegram']
+        recipients = []
+        for item in telegram_config.get('recipients') or [telegram_config['user_id']]:
+            if not isinstance(item, dict):
+                item = {'chat_id': item}
+            channels = set()
+            for channel in item.get('channels') or []:
+                channel_id = bare_channel_id(channel)
+                channels.add(str(channel) if channel_id is None else channel_id)
+            recipients.append({'chat_id': str(item['chat_id']), 'channels': channels or None})
+        return recipients
+
+    @staticmethod
+    def _accepts(recipient, msg):
+        """Подписан ли получатель на канал сообщения."""
+        channels = recipient['channels']
+        return (not channels or bare_channel_id(msg.get('channel_id')) in channels
+                or msg.get('channel_name') in channels)
+
     def load_unique_messages(self):
         """Загрузка списка уникальных сообщений для отправки."""
         messages_file = os.path.join(self.data_dir, 'unique_messages.json')
@@ -87,6 +122,19 @@ class MessageSender:
 
     async def initialize_client(self):
         """Инициализация и авторизация клиента Telegram."""
+        if self.cassette and self.cassette.replaying:
+            # При воспроизведении Telegram недоступен: отправка идет только через Bot API
+            logger.info("Воспроизведение из кассеты: клиент Telegram не используется")
+            return False
+        if self.media_handler is not None:
+            # Клиент подключен при прошлой отправке (постоянный опрос) и переиспользуется
+            return True
+        if not self.own_client:
+            if self.client is None:
+                logger.error("Клиент загрузчика не подключен")
+                return False
+            self.media_handler = MediaHandler(self.client, self.config, self.scheduler, self.metrics, self.cassette)
+            return True
         logger.info("Инициализация клиента Telegram...")
         self.client = TelegramClient(
             self.session_file, 
@@ -98,46 +146,46 @@ class MessageSender:
         )
 
         try:
-            await self.client.start()
+            # connect, а не start: неавторизованная сессия не должна запрашивать вход в консоли
+            await self.client.connect()
             if not await self.client.is_user_authorized():
-                logger.error("Клиент не авторизован, требуется запустить telegram_downloader.py")
+                logger.error(f"Сессия {self.session_file} не авторизована: основная сессия авторизуется "
+                             f"запуском telegram_downloader.py, сессия воркера send - командой python main.py login")
                 return False
                 
             logger.info("Авторизация успешна!")
             # Инициализируем обработчик медиа
-            self.media_handler = MediaHandler(self.client, self.config)
+            self.media_handler = MediaHandler(self.client, self.config, self.scheduler, self.metrics, self.cassette)
             return True
         except Exception as e:
             logger.error(f"Ошибка при авторизации: {e}")
             return False
 
-    async def send_message_via_bot(self, user_id, text):
-        """Отправка сообщения через Telegram Bot API используя Markdown."""
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        # Текст с Markdown (header + body)
-        md_text = text
-        # Обрезка до лимита (4096 символов)
-        if len(md_text) > 4000:
-            logger.info(f"Сообщение слишком длинное ({len(md_text)}), обрезаем до 4000")
-            header_end = md_text.find("\n\n")
-            header = md_text[:header_end+2] if header_end > 0 else ""
-            md_text = header + md_text[header_end+2:4000 - len(header) - 20] + "...<сообщение обрезано>"
-        # Попытка отправки с Markdown
-        data = {"chat_id": user_id, "text": md_text, "parse_mode": "Markdown"}
-        try:
-            response = requests.post(url, json=data)
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка отправки Markdown: {e}")
-        # Фоллбэк без форматирования
-        try:
-            response = requests.post(url, json={"chat_id": user_id, "text": md_text})
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            logger.error(f"Фоллбэк plain text не удался: {e}")
-            return False
+    async def send_message_via_bot(self, user_id, text, entities=None):
+        """Отправка сообщения через Telegram Bot API.
+
+        Разметка передается явными сущностями (entities), поэтому Telegram
+        не разбирает Markdown и первый запрос не отклоняется из-за случайных
+        "_" или "*". Длинный текст отправляется несколькими сообщениями.
+
+        Args:
+            user_id: ID чата получателя
+            text: Текст сообщения
+            entities: Сущности Bot API (см. message_formatter)
+
+        Returns:
+            list: ID отправленных сообщений или False при ошибке
+        """
+        sent_ids = []
+        for chunk, chunk_entities in split_message(text, entities or []):
+            data = {"chat_id": user_id, "text": chunk, "entities": chunk_entities}
+            try:
+                result = await self.scheduler.submit(user_id, self.bot_api.call, 'sendMessage', data)
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения в {user_id}: {e}")
+                return False
+            sent_ids.append(result['message_id'])
+        return sent_ids or False
 
     async def group_messages_by_channel(self, messages):
         """Группировка сообщений по каналам."""
@@ -155,10 +203,17 @@ class MessageSender:
         return messages_by_channel
 
     async def load_channel_message_pair(self, channel_id, message_id):
-        """Загрузка пары канал-сообщение для прямой пересылки."""
+        """Загрузка пары канал-сообщение для прямой пересылки.
+
+        Для альбома message_id - список ID, и возвращается список сообщений.
+        """
         try:
             channel = await self.client.get_entity(int(channel_id))
-            message = await self.client.get_messages(channel, ids=int(message_id))
+            if isinstance(message_id, (list, tuple)):
+                message = await self.client.get_messages(channel, ids=[int(i) for i in message_id])
+                message = [m for m in message if m]
+            else:
+                message = await self.client.get_messages(channel, ids=int(message_id))
             if message:
                 return channel, message
         except Exception as e:
@@ -167,110 +222,431 @@ class MessageSender:
         return None, None
 
     async def create_clickable_header(self, msg):
-        """Создает кликабельный заголовок сообщения с названием канала и ссылкой на оригинал."""
+        """Создает кликабельный заголовок сообщения с названием канала и ссылкой на оригинал.
+
+        Returns:
+            tuple: (текст, сущности Bot API) или ("", []) при ошибке
+        """
+        if not (msg.get('channel_id') and msg.get('id')):
+            logger.warning("Не удалось создать заголовок: отсутствует channel_id или id сообщения")
+            return "", []
+        return format_header(msg)
+
+    async def send_digest(self, messages, chat_id):
+        """
+        Отправка текстовых постов, упакованных в сообщения-дайджесты.
+
+        Args:
+            messages: Текстовые сообщения без медиа
+            chat_id: ID чата получателя
+
+        Returns:
+            int: Количество отправленных постов
+        """
+        posts = []
+        for msg in messages:
+            posts.append(format_post(msg, await self.create_clickable_header(msg)))
+
+        sent_count = 0
+        # Разметка задана сущностями, поэтому проверять парность Markdown не нужно
+        bins = pack_posts([text for text, _ in posts], self.digest_limit, self.digest_strategy, check_markdown=False)
+        for indices in bins:
+            text, entities = concat([posts[i] for i in indices], DIGEST_SEPARATOR)
+            digest_messages = [messages[i] for i in indices]
+            for msg in digest_messages:
+                self.outbox.mark_sending(msg, chat_id)
+            sent_ids = await self._send_digest_parts(digest_messages, chat_id, text, entities)
+            if sent_ids:
+                for msg in digest_messages:
+                    self.outbox.mark_sent(msg, chat_id, sent_ids)
+                sent_count += len(indices)
+                self._count_delivery(len(indices), True)
+                logger.info(f"Bot API отправка дайджеста из {len(indices)} постов в {chat_id}")
+            else:
+                for msg in digest_messages:
+                    self.outbox.mark_failed(msg, chat_id, "digest send failed")
+                self._count_delivery(len(indices), False)
+                logger.error(f"Не удалось отправить дайджест в {chat_id}: {[msg['id'] for msg in digest_messages]}")
+        return sent_count
+
+    async def _send_digest_parts(self, digest_messages, chat_id, text, entities):
+        """
+        Отправка частей дайджеста, каждая - отдельным шагом доставки всех его постов.
+
+        Шаги называются по хэшу текста дайджеста: если при повторе посты
+        упакованы в тот же дайджест, отправляются только неотправленные части.
+
+        Returns:
+            list: ID всех частей или False, если какую-то часть отправить не удалось
+        """
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+        progress = [self.outbox.progress(msg, chat_id) for msg in digest_messages]
+        sent_ids = []
+        for number, (chunk, chunk_entities) in enumerate(split_message(text, entities)):
+            step = f"digest_{digest}_{number}"
+            part_ids = next((done[step] for done in progress if step in done), None)
+            if part_ids is None:
+                part_ids = await self.send_message_via_bot(chat_id, chunk, chunk_entities)
+                if not part_ids:
+                    return False
+                for msg, done in zip(digest_messages, progress):
+                    done[step] = list(part_ids)
+                    self.outbox.mark_progress(msg, chat_id, done)
+            sent_ids.extend(part_ids)
+        return sent_ids
+
+    async def _prepare(self, msg, recipients, prefetcher):
+        """
+        Подготовка сообщения один раз для всех получателей: заголовок,
+        оригинал для прямого форварда и загруженные медиа.
+
+        Returns:
+            dict: header, forward (сообщение Telegram), stream (сообщение
+                  Telegram для потоковой передачи), media_infos
+        """
+        prepared = {'header': await self.create_clickable_header(msg),
+                    'forward': None, 'stream': None, 'media_infos': []}
+
+        # 1. Оригинал для прямой пересылки (альбом - со всеми ID частей)
+        if self.direct_forward and any(r['chat_id'] in self.targets for r in recipients):
+            channel, tele_msg = await self.load_channel_message_pair(
+                msg['channel_id'], msg.get('message_ids') or msg['id']
+            )
+            if channel and tele_msg:
+                prepared['forward'] = tele_msg
+
+        # 2. Медиа нужны, только если хотя бы одному получателю нельзя переслать оригинал
+        #    и медиа не было доставлено ему при прошлой попытке (шаг media в outbox)
+        needs_media = any(
+            not (prepared['forward'] and r['chat_id'] in self.targets)
+            and 'media' not in self.outbox.progress(msg, r['chat_id'])
+            for r in recipients
+        )
+        if msg.get('has_media') and self.media_handler and needs_media:
+            if self.media_handler.streaming_enabled and not msg.get('message_ids'):
+                # Потоковая передача без сохранения файла на диск; оригинал мог быть уже получен для форварда
+                prepared['stream'] = prepared['forward']
+                if prepared['stream'] is None:
+                    _, prepared['stream'] = await self.load_channel_message_pair(msg['channel_id'], msg['id'])
+            else:
+                # Медиа обычно уже загружено префетчером
+                _, prepared['media_infos'] = await prefetcher.take(msg)
+        elif prefetcher:
+            prefetcher.cancel(msg)
+        return prepared
+
+    async def _step(self, msg, chat_id, done, step, send):
+        """
+        Шаг доставки, выполняемый не более одного раза.
+
+        Если шаг выполнен при прошлой попытке, повторно он не отправляется:
+        возвращаются сохраненные в outbox ID.
+
+        Args:
+            done: Выполненные шаги (имя шага -> ID сообщений), дополняется
+            step: Имя шага ("header", "forward", "media", "text<N>")
+            send: Корутинная функция без аргументов, возвращающая ID сообщений
+
+        Returns:
+            list: ID сообщений шага или None/False при ошибке
+        """
+        if step in done:
+            return done[step]
+        sent_ids = await send()
+        if sent_ids:
+            done[step] = list(sent_ids)
+            self.outbox.mark_progress(msg, chat_id, done)
+        return sent_ids
+
+    async def _send_text_parts(self, msg, chat_id, done, chunks, first=0):
+        """
+        Отправка частей текста по одной, каждая - отдельным шагом доставки.
+
+        Returns:
+            tuple: (ID отправленных сообщений, True если отправлены все части)
+        """
+        sent_ids = []
+        for number, (chunk, chunk_entities) in enumerate(chunks[first:], start=first):
+            part_ids = await self._step(
+                msg, chat_id, done, f"text{number}",
+                partial(self.send_message_via_bot, chat_id, chunk, chunk_entities)
+            )
+            if not part_ids:
+                return sent_ids, False
+            sent_ids.extend(part_ids)
+        return sent_ids, True
+
+    async def _deliver(self, msg, prepared, chat_id, done=None):
+        """
+        Доставка подготовленного сообщения одному получателю: прямой форвард,
+        медиа через Bot API или текст.
+
+        Доставка может состоять из нескольких сообщений (заголовок и форвард,
+        медиа и продолжение подписи, части длинного текста). Выполненные шаги
+        сохраняются в outbox, и повторная попытка продолжает с невыполненного.
+
+        Args:
+            done: Шаги, выполненные при прошлых попытках (см. Outbox.progress)
+
+        Returns:
+            list: ID отправленных сообщений или None при ошибке
+        """
+        done = {} if done is None else done
+        header_text, header_entities = prepared['header']
+        target = self.targets.get(chat_id)
+
+        # 1. Прямая пересылка оригинала
+        if prepared['forward'] and target:
+            sent_ids = []
+            # Для прямой пересылки нельзя изменить сообщение, поэтому отправляем заголовок отдельно
+            if header_text:
+                async def send_header():
+                    sent = await self.scheduler.submit(
+                        target.id, self.client.send_message, target, header_text.strip(),
+                        formatting_entities=telethon_entities(header_entities), kind='client'
+                    )
+                    return [sent.id]
+                sent_ids += await self._step(msg, chat_id, done, 'header', send_header)
+
+            async def forward():
+                forwarded = await self.scheduler.submit(
+                    target.id, self.client.forward_messages, target, prepared['forward'], kind='client'
+                )
+                return [m.id for m in (forwarded if isinstance(forwarded, list) else [forwarded]) if m]
+            sent_ids += await self._step(msg, chat_id, done, 'forward', forward) or []
+            logger.debug(f"Прямой форвард {msg['id']} в {chat_id} с заголовком")
+            return sent_ids
+
+        # Текст с заголовком: первая часть идет в подпись к медиа, остальное - продолжением
+        text, entities = format_post(msg, prepared['header'])
+
+        # 2. Пересылка медиа через Bot API (повторные отправки используют file_id первой загрузки)
+        media_infos = prepared['media_infos']
+        if prepared['stream'] or media_infos or 'media' in done:
+            chunks = split_message(text, entities, first_limit=CAPTION_LIMIT)
+            caption, caption_entities = chunks[0] if chunks else ('', [])
+            if 'media' in done:
+                # Медиа доставлено при прошлой попытке (и не готовилось заново): _step его не вызовет
+                send_media = None
+            elif prepared['stream']:
+                send_media = partial(
+                    self.media_handler.stream_media_to_bot,
+                    self.bot_token, chat_id, prepared['stream'], caption, caption_entities
+                )
+            elif len(media_infos) > 1:
+                # Альбом отправляем одним sendMediaGroup
+                send_media = partial(
+                    self.media_handler.forward_media_group_to_bot,
+                    self.bot_token, chat_id, media_infos, caption, caption_entities
+                )
+            else:
+                send_media = partial(
+                    self.media_handler.forward_media_to_bot,
+                    self.bot_token, chat_id, media_infos[0], caption, caption_entities
+                )
+            sent_ids = await self._step(msg, chat_id, done, 'media', send_media)
+            if sent_ids:
+                sent_ids = list(sent_ids)
+                more_ids, complete = await self._send_text_parts(msg, chat_id, done, chunks, first=1)
+                sent_ids.extend(more_ids)
+                if not complete:
+                    # Медиа уже доставлено, продолжение теряем, но не отправляем пост заново
+                    logger.error(f"Не удалось отправить продолжение подписи {msg['id']} в {chat_id}")
+                logger.debug(f"Bot API форвард медиа {msg['id']} ({max(len(media_infos), 1)} медиа) в {chat_id} с заголовком")
+                return sent_ids
+
+        # 3. Пересылка текста через Bot API
+        if msg.get('message', '').strip():
+            sent_ids, complete = await self._send_text_parts(msg, chat_id, done, split_message(text, entities))
+            if complete and sent_ids:
+                logger.debug(f"Bot API отправка текста {msg['id']} в {chat_id} с заголовком")
+                return sent_ids
+            logger.error(f"Не удалось отправить текст {msg['id']} в {chat_id}"
+                         + (f" (отправлено частей: {len(sent_ids)}, остальные будут отправлены при повторе)" if sent_ids else ""))
+        return None
+
+    def _count_delivery(self, count, success):
+        """Учет доставок в метриках: счетчики и оставшаяся глубина очереди."""
+        if success:
+            self.metrics.counter('news_tg_messages_sent_total', 'Доставлено сообщений').inc(count)
+        else:
+            self.metrics.counter('news_tg_messages_failed_total', 'Неудачных доставок').inc(count)
+        self.metrics.gauge('news_tg_queue_depth', 'Доставок в очереди отправки').inc(-count)
+
+    async def _deliver_tracked(self, msg, prepared, chat_id):
+        """Доставка одному получателю с записью результата в outbox."""
+        self.outbox.mark_sending(msg, chat_id)
         try:
-            channel_name = msg.get('channel_name', 'Канал')
-            channel_id = msg.get('channel_id')
-            message_id = msg.get('id')
-            
-            if not (channel_id and message_id):
-                logger.warning(f"Не удалось создать заголовок: отсутствует channel_id или id сообщения")
-                return ""
-            # Для публичных каналов убираем префикс в URL
-            channel_id_clean = str(channel_id)[4:] if str(channel_id).startswith('-100') else channel_id
-            message_url = f"https://t.me/c/{channel_id_clean}/{message_id}"
-            # Markdown-заголовок
-            header = f"[{channel_name}]({message_url})\n\n"
-            return header
+            sent_ids = await self._deliver(msg, prepared, chat_id, self.outbox.progress(msg, chat_id))
         except Exception as e:
-            logger.error(f"Ошибка при создании заголовка: {e}")
-            return ""
-
-    async def send_messages(self):
-        """Пересылает уникальные сообщения с добавлением кликабельного заголовка."""
-        messages = self.load_unique_messages()
-        if not messages:
-            logger.warning("Нет уникальных сообщений для отправки")
+            logger.error(f"Ошибка при отправке сообщения {msg.get('id')} в {chat_id}: {e}")
+            sent_ids = None
+            self.outbox.mark_failed(msg, chat_id, e)
+        else:
+            if sent_ids:
+                self.outbox.mark_sent(msg, chat_id, sent_ids)
+            else:
+                self.outbox.mark_failed(msg, chat_id, "delivery failed")
+        self._count_delivery(1, bool(sent_ids))
+        return bool(sent_ids)
+
+    async def _fan_out(self, msg, prepared, recipients):
+        """
+        Рассылка подготовленного сообщения всем получателям.
+
+        Первый получатель, которому сообщение идет через Bot API, обслуживается
+        отдельно: файл загружается один раз, остальные получают его по file_id
+        параллельно, с учетом лимитов на каждый чат. Получатели прямого
+        форварда файл не загружают, поэтому первыми быть не могут.
+
+        Returns:
+            int: Количество успешных доставок
+        """
+        first = next(
+            (r for r in recipients if not (prepared['forward'] and r['chat_id'] in self.targets)), None
+        )
+        rest = [r for r in recipients if r is not first]
+        results = [await self._deliver_tracked(msg, prepared, first['chat_id'])] if first else []
+        if rest:
+            results += await asyncio.gather(
+                *(self._deliver_tracked(msg, prepared, r['chat_id']) for r in rest)
+            )
+        return sum(1 for ok in results if ok)
+
+    async def _resolve_targets(self):
+        """Получение entity получателей для прямого форварда (уже полученные не запрашиваются)."""
+        for recipient in self.recipients:
+            if recipient['chat_id'] in self.targets:
+                continue
+            try:
+                entity = await self.client.get_entity(int(recipient['chat_id']))
+                self.targets[recipient['chat_id']] = entity
+                logger.info(f"Получен получатель для форварда: {entity.id}")
+            except Exception as e:
+                logger.error(f"Не удалось получить entity получателя {recipient['chat_id']}: {e}")
+
+    def share_client(self, client):
+        """
+        Отправка через уже подключенный клиент загрузчика.
+
+        Второй клиент на копии той же сессии использовал бы тот же ключ
+        авторизации одновременно с загрузчиком, и Telegram мог бы отозвать
+        сессию (AuthKeyDuplicatedError). Общий клиент при close() не отключается.
+
+        Args:
+            client: Подключенный TelegramClient или None (тогда только Bot API)
+        """
+        if client is not self.client and self.media_handler:
+            self.media_handler.close()
+            self.media_handler = None
+        self.client = client
+        self.own_client = False
+
+    async def send_messages(self, messages=None):
+        """Пересылает уникальные сообщения всем получателям с добавлением кликабельного заголовка.
+
+        Сообщения проходят через постоянную очередь outbox: уже доставленные
+        при прошлых запусках повторно не отправляются, а прерванная отправка
+        продолжается с того места, где остановилась. Каждое сообщение
+        загружается и подготавливается один раз, сколько бы ни было получателей.
+
+        Args:
+            messages: Сообщения для отправки (по умолчанию - из unique_messages.json)
+        """
+        unique_messages = (messages if messages is not None else self.load_unique_messages()) or []
+        for recipient in self.recipients:
+            accepted = [msg for msg in unique_messages if self._accepts(recipient, msg)]
+            added = self.outbox.enqueue(accepted, recipient['chat_id'])
+            if added:
+                logger.info(f"В очередь отправки для {recipient['chat_id']} добавлено {added} новых сообщений")
+
+        # План рассылки: сообщение -> получатели, которым оно еще не доставлено
+        plan = {}
+        for recipient in self.recipients:
+            for msg in self.outbox.pending(recipient['chat_id']):
+                plan.setdefault(Outbox.message_key(msg), (msg, []))[1].append(recipient)
+        if not plan:
+            logger.warning("Нет неотправленных сообщений")
             return False
-        logger.info(f"Пересылаем {len(messages)} сообщений...")
+        total_count = sum(len(recipients) for _, recipients in plan.values())
+        self.metrics.gauge('news_tg_queue_depth', 'Доставок в очереди отправки').set(total_count)
+        logger.info(f"Пересылаем {len(plan)} сообщений {len(self.recipients)} получателям ({total_count} доставок)...")
 
         # Инициализация клиента Telegram и media_handler (для прямого форварда и загрузки медиа)
-        target_user = None
         client_ok = await self.initialize_client()
-        if not client_ok:
+        if not client_ok and not (self.cassette and self.cassette.replaying):
             logger.error("Не удалось инициализировать клиент Telegram.")
-        # Если включён прямой форвард и клиент инициализирован, получаем пользователя
+        # Если включён прямой форвард и клиент инициализирован, получаем получателей
         if self.direct_forward and client_ok:
-            try:
-                target_user = await self.client.get_entity(int(self.user_id))
-                logger.info(f"Получен пользователь для форварда: {target_user.id}")
-            except Exception as e:
-                logger.error(f"Не удалось получить entity пользователя: {e}")
-                target_user = None
+            await self._resolve_targets()
         elif self.direct_forward and not client_ok:
             self.direct_forward = False
 
         sent_count = 0
-        for msg in messages:
+
+        # В режиме дайджеста текстовые посты без медиа отправляются пачками
+        if self.digest_mode:
+            digests = {}
+            for key, (msg, recipients) in list(plan.items()):
+                if msg.get('has_media') or not msg.get('message', '').strip():
+                    continue
+                for recipient in recipients:
+                    digests.setdefault(recipient['chat_id'], []).append(msg)
+                del plan[key]
+            if digests:
+                results = await asyncio.gather(
+                    *(self.send_digest(posts, chat_id) for chat_id, posts in digests.items())
+                )
+                sent_count += sum(results)
+
+        messages = [msg for msg, _ in plan.values()]
+
+        prefetcher = None
+        if self.media_handler:
+            # В потоковом режиме файлы заранее не загружаются (кроме альбомов, по запросу)
+            prefetch_count = 0 if self.media_handler.streaming_enabled else self.prefetch_count
+            # Если всем получателям пересылается оригинал, медиа не понадобятся
+            if self.direct_forward and all(r['chat_id'] in self.targets for r in self.recipients):
+                prefetch_count = 0
+            prefetcher = MediaPrefetcher(
+                self.media_handler, self.load_channel_message_pair,
+                prefetch_count, self.prefetch_max_bytes
+            )
+
+        # Фоновое вытеснение старых медиа, чтобы диск не переполнялся
+        evict_task = None
+        if self.media_handler:
+            evict_task = asyncio.create_task(MediaStore(self.config, self.media_handler.cache).run_periodically())
+
+        for position, (msg, recipients) in enumerate(plan.values()):
             try:
-                # Создаем заголовок для сообщения
-                header = await self.create_clickable_header(msg)
-                
-                # 1. Прямая пересылка оригинала
-                if self.direct_forward and target_user:
-                    channel, tele_msg = await self.load_channel_message_pair(msg['channel_id'], msg['id'])
-                    if channel and tele_msg:
-                        # Для прямой пересылки нельзя изменить сообщение, поэтому отправляем заголовок отдельно
-                        if header:
-                            try:
-                                await self.client.send_message(target_user, header, parse_mode='html')
-                                await asyncio.sleep(0.5)
-                            except Exception as e:
-                                logger.error(f"Ошибка отправки заголовка: {e}")
-                                await self.client.send_message(target_user, header.replace('<', '').replace('>', ''))
-                                await asyncio.sleep(0.5)
-                        await self.client.forward_messages(target_user, tele_msg)
-                        sent_count += 1
-                        logger.info(f"Прямой форвард {msg['id']} с заголовком")
-                        await asyncio.sleep(self.wait_delay)
-                        continue
-
-                # 2. Пересылка медиа через Bot API
-                if msg.get('has_media') and self.media_handler:
-                    # загружаем оригинальное сообщение для скачивания медиа
-                    channel_entity, tele_msg = await self.load_channel_message_pair(msg['channel_id'], msg['id'])
-                    if tele_msg:
-                        media_info = await self.media_handler.download_message_media(tele_msg, msg['channel_id'])
-                        if media_info:
-                            media_info['caption'] = header + media_info.get('caption', '')
-                            ok = await self.media_handler.forward_message_with_media(
-                                self.bot_token, self.user_id, msg, media_info, msg.get('channel_name')
-                            )
-                            if ok:
-                                sent_count += 1
-                                logger.info(f"Bot API форвард медиа {msg['id']} с заголовком")
-                                await asyncio.sleep(self.wait_delay)
-                                continue
-
-                # 3. Пересылка текста через Bot API
-                text = msg.get('message', '').strip()
-                if text:
-                    # Добавляем заголовок к тексту сообщения
-                    text_with_header = header + text
-                    if await self.send_message_via_bot(self.user_id, text_with_header):
-                        sent_count += 1
-                        logger.info(f"Bot API отправка текста {msg['id']} с заголовком")
-                    else:
-                        logger.error(f"Не удалось отправить текст {msg['id']}")
-                await asyncio.sleep(self.wait_delay)
+                # Пока отправляется текущее сообщение, загружаем медиа следующих
+                if prefetcher:
+                    prefetcher.fill(messages, position)
+
+                prepared = await self._prepare(msg, recipients, prefetcher)
+                sent_count += await self._fan_out(msg, prepared, recipients)
             except Exception as e:
                 logger.error(f"Ошибка при обработке сообщения {msg.get('id')}: {e}")
+                for recipient in recipients:
+                    self.outbox.mark_failed(msg, recipient['chat_id'], e)
+                self._count_delivery(len(recipients), False)
+
+        if prefetcher:
+            await prefetcher.close()
+        if evict_task:
+            evict_task.cancel()
 
-        logger.info(f"Отправлено {sent_count}/{len(messages)} сообщений")
+        if self.scheduler.flood_wait_seconds:
+            logger.warning(f"Telegram ограничивал частоту отправки, суммарное ожидание: {self.scheduler.flood_wait_seconds:.0f} с")
+        logger.info(f"Выполнено {sent_count}/{total_count} доставок")
         return sent_count > 0
 
     async def close(self):
         """Закрытие клиента."""
-        if self.client:
+        if self.media_handler:
+            self.media_handler.close()
+        self.outbox.close()
+        if self.client and self.own_client:
             await self.client.disconnect()
             logger.info("Клиент отключен")
\ No newline at end of file
@@ -0,0 +1,211 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from atomic_io import atomic_write_text
+
+logger = logging.getLogger('Metrics')
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Корзины для размеров (байты, токены)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовая метрика: значения по наборам меток."""
+
+    kind = None
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help = help_text
+        self.lock = lock
+        self.values = {}  # кортеж меток -> значение
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Текущее значение (глубина очереди, суммарное ожидание и т.п.)."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам с суммой и количеством наблюдений."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, lock, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def snapshot(self, **labels):
+        """Словарь {'counts', 'sum', 'count'} для набора меток (или None)."""
+        return self.values.get(self._key(labels))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = key + (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик с выводом в текстовом формате Prometheus.
+
+    Метрики создаются при первом обращении по имени, поэтому модули
+    могут записывать значения без предварительной регистрации.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _get(self, cls, name, help_text, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    metric = self.metrics[name] = cls(name, help_text, self.lock, **kwargs)
+        return metric
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=''):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    @contextmanager
+    def timer(self, name, help_text='', **labels):
+        """Замер длительности блока в гистограмму name (секунды)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, help_text).observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Запись метрик в файл (для пакетного режима)."""
+        atomic_write_text(path, self.render())
+        logger.info(f"Метрики сохранены в {path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Ошибка обработки запроса метрик: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=9464):
+        """
+        Запуск HTTP-эндпоинта /metrics.
+
+        Returns:
+            asyncio.Server: Сервер (закрывается вызывающим кодом)
+        """
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+        return server
+
+
+# Общий реестр процесса
+REGISTRY = MetricsRegistry()
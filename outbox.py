@@ -0,0 +1,174 @@
+import os
+import json
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger('Outbox')
+
+# Состояния доставки
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class Outbox:
+    """Надежная очередь отправки (SQLite) с состоянием доставки каждого сообщения.
+
+    Каждая пара (сообщение, получатель) доставляется не более одного раза:
+    после успешной отправки запись помечается как sent вместе с ID сообщений,
+    которые вернул Telegram, и при повторном запуске пропускается. Доставка
+    из нескольких сообщений (заголовок и форвард, части длинного текста)
+    сохраняет выполненные шаги, и повторная попытка продолжает с
+    невыполненного.
+    """
+
+    def __init__(self, config):
+        """
+        Инициализация очереди.
+
+        Args:
+            config: Конфигурация приложения
+        """
+        self.data_dir = config['paths']['data_dir']
+        self.db_file = os.path.join(self.data_dir, 'outbox.sqlite3')
+        self.max_attempts = config.get('app', {}).get('outbox_max_attempts', 3)
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS deliveries (
+                message_key TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sent_ids TEXT,
+                progress TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (message_key, recipient)
+            )
+        """)
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(deliveries)")}
+        if 'progress' not in columns:
+            # Очередь, созданная до учета выполненных шагов доставки
+            self.conn.execute("ALTER TABLE deliveries ADD COLUMN progress TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS deliveries_state ON deliveries (recipient, state)")
+        self.conn.commit()
+
+    @staticmethod
+    def message_key(msg):
+        """Ключ сообщения: "<channel_id>:<message_id>"."""
+        return f"{msg.get('channel_id')}:{msg.get('id')}"
+
+    def enqueue(self, messages, recipient):
+        """
+        Добавление сообщений в очередь получателя. Уже известные сообщения
+        (в том числе доставленные) повторно не добавляются.
+
+        Returns:
+            int: Количество новых записей
+        """
+        now = datetime.now().isoformat()
+        recipient = str(recipient)
+        row = self.conn.execute(
+            "SELECT COALESCE(MAX(position), -1) FROM deliveries WHERE recipient = ?", (recipient,)
+        ).fetchone()
+        position = row[0] + 1
+        added = 0
+        with self.conn:
+            for msg in messages:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO deliveries "
+                    "(message_key, recipient, position, payload, state, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.message_key(msg), recipient, position, json.dumps(msg, ensure_ascii=False), PENDING, now, now)
+                )
+                if cursor.rowcount:
+                    added += 1
+                    position += 1
+        return added
+
+    def pending(self, recipient):
+        """
+        Сообщения, еще не доставленные получателю, в порядке постановки в очередь.
+
+        Записи в состоянии sending остались от прерванного запуска: неизвестно,
+        дошли ли они, поэтому они отправляются повторно.
+        """
+        rows = self.conn.execute(
+            "SELECT payload, state FROM deliveries "
+            "WHERE recipient = ? AND (state IN (?, ?) OR (state = ? AND attempts < ?)) "
+            "ORDER BY position",
+            (str(recipient), PENDING, SENDING, FAILED, self.max_attempts)
+        ).fetchall()
+        interrupted = sum(1 for row in rows if row['state'] == SENDING)
+        if interrupted:
+            logger.warning(f"{interrupted} сообщений для {recipient} были прерваны при отправке и будут отправлены повторно")
+        return [json.loads(row['payload']) for row in rows]
+
+    def _update(self, msg, recipient, sql, params):
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE deliveries SET {sql}, updated_at = ? WHERE message_key = ? AND recipient = ?",
+                (*params, datetime.now().isoformat(), self.message_key(msg), str(recipient))
+            )
+
+    def mark_sending(self, msg, recipient):
+        """Отметка начала отправки (до обращения к Telegram)."""
+        self._update(msg, recipient, "state = ?, attempts = attempts + 1", (SENDING,))
+
+    def mark_sent(self, msg, recipient, sent_ids):
+        """Отметка успешной доставки с ID сообщений, которые вернул Telegram."""
+        self._update(msg, recipient, "state = ?, sent_ids = ?, error = NULL", (SENT, json.dumps(list(sent_ids or []))))
+
+    def progress(self, msg, recipient):
+        """
+        Выполненные шаги доставки (заголовок, форвард, части текста).
+
+        Returns:
+            dict: Имя шага -> ID отправленных на этом шаге сообщений
+        """
+        row = self.conn.execute(
+            "SELECT progress FROM deliveries WHERE message_key = ? AND recipient = ?",
+            (self.message_key(msg), str(recipient))
+        ).fetchone()
+        return json.loads(row['progress']) if row and row['progress'] else {}
+
+    def mark_progress(self, msg, recipient, progress):
+        """Сохранение выполненных шагов: при повторной попытке они не отправляются заново."""
+        self._update(msg, recipient, "progress = ?", (json.dumps(progress),))
+
+    def mark_failed(self, msg, recipient, error):
+        """Отметка неудачной попытки (будет повторена, пока не исчерпан outbox_max_attempts)."""
+        self._update(msg, recipient, "state = ?, error = ?", (FAILED, str(error)[:500]))
+
+    def pending_refs(self):
+        """Ссылки "<channel_id>:<message_id>" на все недоставленные сообщения (включая части альбомов)."""
+        refs = set()
+        rows = self.conn.execute(
+            "SELECT payload FROM deliveries WHERE state IN (?, ?) OR (state = ? AND attempts < ?)",
+            (PENDING, SENDING, FAILED, self.max_attempts)
+        ).fetchall()
+        for row in rows:
+            msg = json.loads(row['payload'])
+            for message_id in msg.get('message_ids') or [msg.get('id')]:
+                refs.add(f"{msg.get('channel_id')}:{message_id}")
+        return refs
+
+    def stats(self, recipient=None):
+        """Количество записей по состояниям."""
+        sql = "SELECT state, COUNT(*) FROM deliveries"
+        params = ()
+        if recipient is not None:
+            sql += " WHERE recipient = ?"
+            params = (str(recipient),)
+        return dict(self.conn.execute(sql + " GROUP BY state", params).fetchall())
+
+    def close(self):
+        self.conn.close()
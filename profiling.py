@@ -0,0 +1,254 @@
+import os
+import io
+import json
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('Profiler')
+
+# Глубина стека в collapsed-файле (защита от рекурсии в графе вызовов)
+MAX_STACK_DEPTH = 64
+# Путь, на который приходится меньше этой доли общего времени профиля, не раскрывается:
+# число путей в графе вызовов растет экспоненциально, а такие ветви на flamegraph не видны
+MIN_PATH_SHARE = 1e-4
+# Предельное число обойденных путей (страховка на случай очень плотного графа)
+MAX_PATHS = 200000
+# Кадр, в который попадает время нераскрытых ветвей
+PRUNED_LABEL = '[мелкие вызовы]'
+
+
+def _func_label(func):
+    """Имя функции pstats в виде file:line:name (как в flamegraph-инструментах)."""
+    filename, line, name = func
+    if filename == '~':
+        return name  # встроенные функции: "<built-in method time.sleep>"
+    return f"{os.path.basename(filename)}:{line}:{name}"
+
+
+def collapse_stats(stats):
+    """
+    Преобразование статистики cProfile в collapsed-стеки для flamegraph.pl/speedscope.
+
+    cProfile хранит только пары вызывающий -> вызываемый, поэтому полные
+    стеки восстанавливаются обходом графа от корней: собственное время
+    функции распределяется по путям пропорционально накопленному времени
+    каждого вызова. Ветви, на которые приходится меньше MIN_PATH_SHARE
+    общего времени (или сверх MAX_PATHS путей), не раскрываются: их время
+    записывается в кадр PRUNED_LABEL под вызывающей функцией, поэтому
+    сумма по стекам сохраняется, а обход остается быстрым на профилях
+    с тысячами функций.
+
+    Args:
+        stats: pstats.Stats
+
+    Returns:
+        list: Строки "корень;...;функция микросекунды"
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+    min_time = sum(tt for _, _, tt, _, _ in raw.values()) * MIN_PATH_SHARE
+
+    lines = {}
+    visited = [0]
+
+    def add(stack, seconds):
+        if seconds > 0:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0.0) + seconds
+
+    def walk(func, stack, share):
+        visited[0] += 1
+        cc, nc, tt, ct, _ = raw[func]
+        stack = stack + [_func_label(func)]
+        add(stack, tt * share)
+        if len(stack) >= MAX_STACK_DEPTH or not ct:
+            return
+        pruned = 0.0
+        for callee, edge_ct in callees.get(func, []):
+            callee_ct = raw[callee][3]
+            if callee == func or not callee_ct or _func_label(callee) in stack:
+                continue
+            callee_share = share * min(1.0, edge_ct / callee_ct)
+            if callee_share * callee_ct < min_time or visited[0] >= MAX_PATHS:
+                pruned += callee_share * callee_ct
+                continue
+            walk(callee, stack, callee_share)
+        add(stack + [PRUNED_LABEL], pruned)
+
+    for root in roots:
+        walk(root, [], 1.0)
+    if visited[0] >= MAX_PATHS:
+        logger.warning(f"Граф вызовов слишком велик: раскрыто {MAX_PATHS} путей, остальное время - в {PRUNED_LABEL}")
+    return [f"{key} {int(value * 1e6)}" for key, value in sorted(lines.items()) if int(value * 1e6) > 0]
+
+class LoopLagSampler:
+    """Замер задержки цикла событий: насколько позже просыпается sleep(interval)."""
+
+    def __init__(self, interval=0.1, metrics=None):
+        self.interval = interval
+        self.metrics = metrics
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.samples.append(lag)
+            if self.metrics is not None:
+                self.metrics.histogram(
+                    'news_tg_loop_lag_seconds', 'Задержка цикла событий'
+                ).observe(lag)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def summary(self):
+        """Сводка задержек: количество замеров, среднее, p95, максимум (секунды)."""
+        if not self.samples:
+            return {'interval': self.interval, 'samples': 0}
+        ordered = sorted(self.samples)
+        return {
+            'interval': self.interval,
+            'samples': len(ordered),
+            'mean': round(sum(ordered) / len(ordered), 4),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+            'max': round(ordered[-1], 4),
+        }
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Сбор предупреждений asyncio "Executing ... took N seconds"."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith('Executing '):
+            self.records.append(f"{datetime.fromtimestamp(record.created).isoformat()} {message}")
+
+
+class Profiler:
+    """Профилирование этапов конвейера.
+
+    Каждый этап выполняется под отдельным cProfile; по завершении этапа
+    в reports_dir/profiles/<время>_<команда>/ пишутся <этап>.pstats (для
+    pstats/snakeviz) и <этап>.collapsed (для flamegraph.pl, speedscope).
+    Дополнительно можно замерять задержку цикла событий и включить режим
+    отладки asyncio, который сообщает о callback-ах дольше slow_callback
+    секунд. Когда профилирование не запрошено, объект не создается и этапы
+    выполняются без обертки.
+
+    cProfile видит только поток, в котором включен, то есть цикл событий;
+    время в потоках (asyncio.to_thread) попадает в профиль как ожидание.
+    """
+
+    def __init__(self, reports_dir, command, loop_lag=None, slow_callback=None, metrics=None):
+        """
+        Инициализация профилировщика.
+
+        Args:
+            reports_dir: Каталог отчетов
+            command: Выполняемая команда (для имени каталога)
+            loop_lag: Интервал замера задержки цикла событий, с (None - не замерять)
+            slow_callback: Порог медленного callback-а asyncio, с (None - не отслеживать)
+            metrics: MetricsRegistry для гистограммы задержки цикла
+        """
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_dir = os.path.join(reports_dir, 'profiles', f"{stamp}_{command}")
+        self.slow_callback = slow_callback
+        self.lag_sampler = LoopLagSampler(loop_lag, metrics) if loop_lag else None
+        self.stages = {}
+        self._slow_handler = None
+
+    async def start(self):
+        """Запуск замеров цикла событий (вызывается внутри работающего цикла)."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.slow_callback:
+            loop = asyncio.get_running_loop()
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_callback
+            self._slow_handler = _SlowCallbackHandler()
+            logging.getLogger('asyncio').addHandler(self._slow_handler)
+        if self.lag_sampler:
+            self.lag_sampler.start()
+
+    @contextmanager
+    def stage(self, name, inner=None):
+        """
+        Профилирование блока как этапа name.
+
+        Args:
+            name: Имя этапа (имя файлов профиля)
+            inner: Контекстный менеджер, выполняемый внутри (например, таймер этапа)
+        """
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            if inner is None:
+                yield
+            else:
+                with inner:
+                    yield
+        finally:
+            profile.disable()
+            self._save_stage(name, profile, time.perf_counter() - start)
+
+    def _save_stage(self, name, profile, seconds):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, name)
+            profile.dump_stats(base + '.pstats')
+            stats = pstats.Stats(profile)
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                f.write("\n".join(collapse_stats(stats)) + "\n")
+
+            top = io.StringIO()
+            pstats.Stats(profile, stream=top).sort_stats('cumulative').print_stats(15)
+            self.stages[name] = {'seconds': round(seconds, 3), 'calls': stats.total_calls}
+            logger.info(f"Профиль этапа {name} ({seconds:.2f} с) сохранен в {base}.pstats")
+            logger.debug(top.getvalue())
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении профиля этапа {name}: {e}")
+
+    async def stop(self):
+        """Остановка замеров и запись сводки summary.json."""
+        summary = {'stages': self.stages}
+        if self.lag_sampler:
+            await self.lag_sampler.stop()
+            summary['loop_lag'] = self.lag_sampler.summary()
+            logger.info(f"Задержка цикла событий: {summary['loop_lag']}")
+        if self._slow_handler:
+            logging.getLogger('asyncio').removeHandler(self._slow_handler)
+            asyncio.get_running_loop().set_debug(False)
+            summary['slow_callbacks'] = len(self._slow_handler.records)
+            with open(os.path.join(self.output_dir, 'slow_callbacks.log'), 'w', encoding='utf-8') as f:
+                f.write("\n".join(self._slow_handler.records) + "\n")
+            logger.info(f"Медленных callback-ов asyncio: {summary['slow_callbacks']}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"Профили сохранены в {self.output_dir}")
@@ -0,0 +1,160 @@
+import os
+import json
+import logging
+import statistics
+from datetime import datetime
+from atomic_io import atomic_write_json
+
+logger = logging.getLogger('RunReport')
+
+# Этапы короче этого времени не сравниваются: их колебания - шум
+MIN_COMPARABLE_SECONDS = 0.5
+
+
+def _label_values(metric, label):
+    """Значения метрики по одной метке: {значение метки: значение}."""
+    result = {}
+    if metric is None:
+        return result
+    for key, value in metric.values.items():
+        labels = dict(key)
+        if label in labels:
+            result[labels[label]] = value
+    return result
+
+
+def _total(metric):
+    """Сумма значений счетчика по всем меткам."""
+    return sum(metric.values.values()) if metric is not None else 0
+
+
+def build_report(registry, command, started_at, finished_at=None):
+    """
+    Формирование отчета о запуске из реестра метрик.
+
+    Args:
+        registry: MetricsRegistry с метриками запуска
+        command: Выполненная команда (run, download, ...)
+        started_at: Время начала запуска (datetime)
+        finished_at: Время завершения (по умолчанию - сейчас)
+
+    Returns:
+        dict: Отчет с временем этапов, загрузкой по каналам, LLM и отправкой
+    """
+    finished_at = finished_at or datetime.now()
+    metrics = registry.metrics
+
+    stages = {stage: round(state['sum'], 3)
+              for stage, state in _label_values(metrics.get('news_tg_stage_seconds'), 'stage').items()}
+
+    fetched = _label_values(metrics.get('news_tg_messages_fetched_total'), 'channel')
+    fetch_seconds = _label_values(metrics.get('news_tg_channel_fetch_seconds'), 'channel')
+    channels = {
+        channel: {'messages': fetched.get(channel, 0), 'seconds': round(fetch_seconds.get(channel, 0.0), 3)}
+        for channel in sorted(set(fetched) | set(fetch_seconds))
+    }
+
+    llm = {}
+    tokens = _label_values(metrics.get('news_tg_llm_prompt_tokens'), 'stage')
+    errors = _label_values(metrics.get('news_tg_llm_errors_total'), 'stage')
+    for stage, state in _label_values(metrics.get('news_tg_llm_seconds'), 'stage').items():
+        llm[stage] = {
+            'calls': state['count'],
+            'errors': errors.get(stage, 0),
+            'seconds': round(state['sum'], 3),
+            'avg_latency': round(state['sum'] / state['count'], 3) if state['count'] else 0.0,
+            'prompt_tokens': int(tokens[stage]['sum']) if stage in tokens else 0,
+        }
+
+    sent = _total(metrics.get('news_tg_messages_sent_total'))
+    send_seconds = stages.get('send', 0.0)
+    send = {
+        'sent': sent,
+        'failed': _total(metrics.get('news_tg_messages_failed_total')),
+        'per_second': round(sent / send_seconds, 3) if send_seconds else 0.0,
+        'flood_wait_seconds': _total(metrics.get('news_tg_flood_wait_seconds')),
+    }
+
+    return {
+        'command': command,
+        'started_at': started_at.isoformat(),
+        'finished_at': finished_at.isoformat(),
+        'total_seconds': round((finished_at - started_at).total_seconds(), 3),
+        'stages': stages,
+        'channels': channels,
+        'llm': llm,
+        'send': send,
+        'messages': {
+            'fetched': sum(fetched.values()),
+            'filtered': _total(metrics.get('news_tg_messages_filtered_total')),
+            'deduped': _total(metrics.get('news_tg_messages_deduped_total')),
+        },
+    }
+
+
+def _runs_dir(reports_dir):
+    return os.path.join(reports_dir, 'runs')
+
+
+def save_report(report, reports_dir):
+    """
+    Сохранение отчета в reports_dir/runs/run_<время>.json.
+
+    Returns:
+        str: Путь к файлу отчета
+    """
+    runs_dir = _runs_dir(reports_dir)
+    stamp = datetime.fromisoformat(report['started_at']).strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(runs_dir, f"run_{stamp}.json")
+    atomic_write_json(path, report)
+    logger.info(f"Отчет о запуске сохранен в {path}")
+    return path
+
+
+def load_reports(reports_dir, command=None):
+    """Все сохраненные отчеты (от старых к новым), опционально только для одной команды."""
+    runs_dir = _runs_dir(reports_dir)
+    if not os.path.isdir(runs_dir):
+        return []
+    reports = []
+    for name in sorted(os.listdir(runs_dir)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(runs_dir, name), 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать отчет {name}: {e}")
+            continue
+        if command is None or report.get('command') == command:
+            reports.append(report)
+    return reports
+
+
+def compare(latest, baseline_reports, threshold_pct=20):
+    """
+    Сравнение этапов последнего запуска с базовой линией (медиана предыдущих запусков).
+
+    Args:
+        latest: Отчет последнего запуска
+        baseline_reports: Предыдущие отчеты той же команды
+        threshold_pct: Порог замедления в процентах
+
+    Returns:
+        list: Словари {'stage', 'latest', 'baseline', 'change_pct', 'regressed'}
+    """
+    rows = []
+    for stage, seconds in sorted(latest.get('stages', {}).items()):
+        history = [r['stages'][stage] for r in baseline_reports if stage in r.get('stages', {})]
+        if not history:
+            continue
+        baseline = statistics.median(history)
+        change_pct = (seconds - baseline) / baseline * 100 if baseline else 0.0
+        rows.append({
+            'stage': stage,
+            'latest': seconds,
+            'baseline': baseline,
+            'change_pct': change_pct,
+            'regressed': baseline >= MIN_COMPARABLE_SECONDS and change_pct > threshold_pct,
+        })
+    return rows
@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta, timezone
+from message_formatter import bare_channel_id
+
+try:
+    import snowballstemmer
+except ImportError:  # без snowballstemmer используется упрощенное отсечение окончаний
+    snowballstemmer = None
+
+logger = logging.getLogger('SearchIndex')
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+# Окончания русских слов (от длинных к коротким) для упрощенного стемминга
+_RU_ENDINGS = sorted("""
+    иями ями ами ией иям ием иях ого его ому ему ыми ими ешь ете ишь ите ают яют ует юет ость ости
+    ение ения ений ением ениям ениями ениях ировать ированный ировал
+    ая яя ое ее ые ие ый ий ой ей ом ем ам ям ах ях ов ев ью ия ие ию ии ую юю их ых ым им
+    ет ит ут ют ат ят ла ло ли ть ти ся сь
+    а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+_RU_ENDING_SETS = [(n, {e for e in _RU_ENDINGS if len(e) == n}) for n in range(len(_RU_ENDINGS[0]), 0, -1)]
+_RU_MIN_STEM = 3
+
+
+def _light_stem_ru(word):
+    """Упрощенный стемминг: отсечение самого длинного окончания с сохранением основы."""
+    for length, endings in _RU_ENDING_SETS:
+        if len(word) - length >= _RU_MIN_STEM and word[-length:] in endings:
+            return word[:-length]
+    return word
+
+
+class Stemmer:
+    """Нормализация слов для индекса и запросов: нижний регистр, ё -> е, стемминг.
+
+    Русские слова обрабатываются стеммером Snowball (snowballstemmer; если
+    установлен PyStemmer, он используется автоматически), английские - тоже.
+    Без snowballstemmer у русских слов отсекаются типичные окончания.
+    Основы кэшируются: словарь новостных текстов невелик.
+    """
+
+    CACHE_SIZE = 200000
+
+    def __init__(self):
+        self._cache = {}
+        if snowballstemmer is not None:
+            self._ru = snowballstemmer.stemmer('russian').stemWord
+            self._en = snowballstemmer.stemmer('english').stemWord
+            self.exact = True
+        else:
+            self._ru = _light_stem_ru
+            self._en = None
+            self.exact = False
+
+    def word(self, word):
+        stem = self._cache.get(word)
+        if stem is None:
+            stem = self._stem(word)
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[word] = stem
+        return stem
+
+    def _stem(self, word):
+        normalized = word.lower().replace('ё', 'е')
+        if _CYRILLIC_RE.search(normalized):
+            return self._ru(normalized)
+        if self._en is not None and normalized.isalpha():
+            return self._en(normalized)
+        return normalized
+
+    def words(self, text):
+        return [self.word(w) for w in _WORD_RE.findall(text or '')]
+
+    def text(self, text):
+        """Текст для индекса: основы слов через пробел."""
+        return " ".join(self.words(text))
+
+
+def _utc_iso(date_str):
+    """Дата сообщения (ISO, с часовым поясом или без) в виде UTC 'YYYY-MM-DDTHH:MM:SS'."""
+    try:
+        date = datetime.fromisoformat(date_str)
+    except (TypeError, ValueError):
+        return ''
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.isoformat(timespec='seconds')
+
+
+def _date_bound(value, end=False):
+    """Граница фильтра по дате: 'YYYY-MM-DD' или ISO-время; для end - конец указанного дня."""
+    if not value:
+        return None
+    date = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        date += timedelta(days=1)
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.isoformat(timespec='seconds')
+
+
+class SearchIndex:
+    """Полнотекстовый поиск по архиву сообщений (SQLite FTS5).
+
+    Таблица messages хранит исходные сообщения, виртуальная таблица
+    messages_fts - основы слов (см. Stemmer) с тем же rowid. Запрос
+    нормализуется тем же стеммером, результаты ранжируются по BM25 и фильтруются по каналу и дате.
+
+    ID каналов хранятся и принимаются в формате config.json ("-100..."),
+    хотя загрузчик сохраняет в сообщениях entity.id без префикса.
+    """
+
+    def __init__(self, config):
+        """
+        Инициализация индекса.
+
+        Args:
+            config: Конфигурация приложения
+        """
+        self.data_dir = config['paths']['data_dir']
+        self.db_file = os.path.join(self.data_dir, 'search.sqlite3')
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.stemmer = Stemmer()
+        # ID без префикса -> ID из config.json (у обычных групп префикс "-", а не "-100")
+        self._config_ids = {}
+        for channel_id in config.get('channels', []):
+            if bare_channel_id(channel_id) is not None:
+                self._config_ids[bare_channel_id(channel_id)] = int(channel_id)
+        self.conn = sqlite3.connect(self.db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                rowid INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                channel_name TEXT,
+                date TEXT NOT NULL,
+                text TEXT NOT NULL,
+                UNIQUE (channel_id, message_id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS messages_channel_date ON messages (channel_id, date)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS messages_date ON messages (date)")
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Индекс, созданный до перехода на формат config.json, хранил ID без префикса
+        for (channel_id,) in self.conn.execute("SELECT DISTINCT channel_id FROM messages WHERE channel_id > 0").fetchall():
+            self.conn.execute(
+                "UPDATE OR IGNORE messages SET channel_id = ? WHERE channel_id = ?",
+                (self.channel_id(channel_id), channel_id)
+            )
+        self.conn.commit()
+
+    def channel_id(self, value):
+        """
+        ID канала в формате config.json.
+
+        Args:
+            value: ID из сообщения (entity.id без префикса) или из config.json
+
+        Returns:
+            int: ID канала из конфигурации; для каналов, которых в ней нет, -
+                отрицательный ID как есть или "-100" + ID без префикса
+        """
+        bare = bare_channel_id(value)
+        if bare in self._config_ids:
+            return self._config_ids[bare]
+        return int(value) if int(value) < 0 else int(f"-100{bare}")
+
+    def add(self, messages):
+        """
+        Добавление или обновление сообщений в индексе (одной транзакцией).
+
+        Args:
+            messages: Сообщения в формате загрузчика (id, channel_id, channel_name, date, message)
+
+        Returns:
+            int: Количество проиндексированных сообщений
+        """
+        count = 0
+        with self.conn:
+            for msg in messages:
+                text = msg.get('message') or ''
+                if not text:
+                    continue
+                row = self.conn.execute(
+                    "SELECT rowid FROM messages WHERE channel_id = ? AND message_id = ?",
+                    (self.channel_id(msg['channel_id']), int(msg['id']))
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE messages SET channel_name = ?, date = ?, text = ? WHERE rowid = ?",
+                        (msg.get('channel_name'), _utc_iso(msg.get('date')), text, row[0])
+                    )
+                    self.conn.execute("DELETE FROM messages_fts WHERE rowid = ?", (row[0],))
+                    rowid = row[0]
+                else:
+                    rowid = self.conn.execute(
+                        "INSERT INTO messages (channel_id, message_id, channel_name, date, text) VALUES (?, ?, ?, ?, ?)",
+                        (self.channel_id(msg['channel_id']), int(msg['id']), msg.get('channel_name'), _utc_iso(msg.get('date')), text)
+                    ).lastrowid
+                self.conn.execute(
+                    "INSERT INTO messages_fts (rowid, body) VALUES (?, ?)", (rowid, self.stemmer.text(text))
+                )
+                count += 1
+        return count
+
+    def index_archive(self):
+        """
+        Индексация всех сохраненных сообщений из data_dir/<channel_id>/message_*.json.
+
+        Returns:
+            int: Количество проиндексированных сообщений
+        """
+        total = 0
+        batch = []
+        for channel in sorted(os.listdir(self.data_dir)):
+            channel_dir = os.path.join(self.data_dir, channel)
+            if not os.path.isdir(channel_dir):
+                continue
+            for name in os.listdir(channel_dir):
+                if not (name.startswith('message_') and name.endswith('.json')):
+                    continue
+                try:
+                    with open(os.path.join(channel_dir, name), 'r', encoding='utf-8') as f:
+                        batch.append(json.load(f))
+                except Exception as e:
+                    logger.error(f"Ошибка чтения {name}: {e}")
+                if len(batch) >= 1000:
+                    total += self.add(batch)
+                    batch = []
+        total += self.add(batch)
+        self.conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+        self.conn.commit()
+        logger.info(f"Проиндексировано {total} сообщений из архива {self.data_dir}")
+        return total
+
+    def _match_query(self, query):
+        """
+        Запрос пользователя в выражение FTS5: слова через AND, "-слово" - исключение.
+
+        Returns:
+            str: Выражение MATCH или None, если в запросе нет слов
+        """
+        include, exclude = [], []
+        for token in query.split():
+            target = exclude if token.startswith('-') and len(token) > 1 else include
+            for stem in self.stemmer.words(token):
+                # Упрощенный стемминг оставляет часть суффиксов, поэтому основа ищется как префикс
+                target.append(f'"{stem}"' if self.stemmer.exact else f'"{stem}"*')
+        if not include:
+            return None
+        expression = " AND ".join(include)
+        if exclude:
+            expression += " NOT " + " NOT ".join(exclude)
+        return expression
+
+    def search(self, query, channel_ids=None, since=None, until=None, limit=20):
+        """
+        Поиск сообщений.
+
+        Args:
+            query: Слова запроса ("-слово" - исключить)
+            channel_ids: Список ID каналов в формате config.json или без префикса (None - все)
+            since: Дата начала ('YYYY-MM-DD' или ISO), включительно
+            until: Дата окончания ('YYYY-MM-DD' - включая весь день)
+            limit: Максимум результатов
+
+        Returns:
+            list: Словари channel_id, message_id, channel_name, date, text, rank
+                (меньше - релевантнее)
+        """
+        expression = self._match_query(query)
+        if expression is None:
+            return []
+        sql = [
+            "SELECT m.channel_id, m.message_id, m.channel_name, m.date, m.text, bm25(messages_fts) AS rank",
+            "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid",
+            "WHERE messages_fts MATCH ?",
+        ]
+        params = [expression]
+        if channel_ids:
+            sql.append(f"AND m.channel_id IN ({', '.join('?' * len(channel_ids))})")
+            params.extend(self.channel_id(c) for c in channel_ids)
+        if since:
+            sql.append("AND m.date >= ?")
+            params.append(_date_bound(since))
+        if until:
+            sql.append("AND m.date < ?" if len(until) <= 10 else "AND m.date <= ?")
+            params.append(_date_bound(until, end=True))
+        sql.append("ORDER BY rank LIMIT ?")
+        params.append(limit)
+        return [dict(row) for row in self.conn.execute(" ".join(sql), params)]
+
+    def snippet(self, text, query, width=160):
+        """Фрагмент текста вокруг первого найденного слова запроса."""
+        stems = [s for s in self.stemmer.words(query.replace('-', ' ')) if s]
+        lowered = text.lower().replace('ё', 'е')
+        position = min((p for p in (lowered.find(s) for s in stems) if p >= 0), default=0)
+        start = max(0, position - width // 3)
+        fragment = text[start:start + width].replace("\n", " ")
+        return ("..." if start else "") + fragment + ("..." if start + width < len(text) else "")
+
+    def stats(self):
+        """Количество сообщений в индексе и число каналов."""
+        row = self.conn.execute("SELECT COUNT(*), COUNT(DISTINCT channel_id) FROM messages").fetchone()
+        return {'messages': row[0], 'channels': row[1]}
+
+    def close(self):
+        self.conn.close()
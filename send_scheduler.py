@@ -0,0 +1,145 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from telethon.errors import FloodWaitError
+from bot_api import BotApiError
+from metrics import REGISTRY
+
+logger = logging.getLogger('SendScheduler')
+
+
+class RateWindow:
+    """Скользящее окно: не более limit событий за period секунд."""
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.stamps = deque()
+
+    def delay(self, now):
+        """Сколько секунд нужно подождать до следующего разрешенного события."""
+        while self.stamps and self.stamps[0] <= now - self.period:
+            self.stamps.popleft()
+        if len(self.stamps) < self.limit:
+            return 0.0
+        return self.stamps[0] + self.period - now
+
+    def record(self, now):
+        self.stamps.append(now)
+
+
+class SendScheduler:
+    """Планировщик исходящих отправок с учетом лимитов Telegram.
+
+    Вместо фиксированных пауз отправка ждет ровно столько, сколько требуют
+    лимиты: общий лимит в секунду, лимит на один чат и лимит на группу в минуту.
+    Лимиты Bot API ("bot") и пользовательского аккаунта MTProto ("client")
+    учитываются раздельно. Ответы retry_after и FloodWaitError приостанавливают
+    отправку в чат (или весь аккаунт) и запрос повторяется.
+    """
+
+    def __init__(self, config, metrics=None):
+        """
+        Инициализация планировщика.
+
+        Args:
+            config: Конфигурация приложения (лимиты в разделе app)
+            metrics: Реестр метрик (по умолчанию общий)
+        """
+        self.metrics = metrics or REGISTRY
+        app_config = config.get('app', {})
+        self.limits = {
+            'bot': {
+                'global_per_second': app_config.get('bot_global_per_second', 30),
+                'chat_per_second': app_config.get('bot_chat_per_second', 1),
+                'group_per_minute': app_config.get('bot_group_per_minute', 20),
+            },
+            'client': {
+                'global_per_second': app_config.get('client_global_per_second', 10),
+                'chat_per_second': app_config.get('client_chat_per_second', 1),
+                'group_per_minute': app_config.get('client_group_per_minute', 20),
+            },
+        }
+        self.max_retries = app_config.get('flood_max_retries', 3)
+        self.global_windows = {
+            kind: RateWindow(limits['global_per_second'], 1.0) for kind, limits in self.limits.items()
+        }
+        self.chat_windows = {}   # (kind, chat_id) -> RateWindow
+        self.group_windows = {}  # (kind, chat_id) -> RateWindow
+        self.blocked_until = {}  # (kind, chat_id или None) -> time.monotonic()
+        self.flood_wait_seconds = 0.0
+
+    @staticmethod
+    def is_group(chat_id):
+        """Группы и каналы в Bot API имеют отрицательные ID."""
+        return str(chat_id).startswith('-')
+
+    def _windows(self, kind, chat_id):
+        limits = self.limits[kind]
+        key = (kind, str(chat_id))
+        windows = [self.global_windows[kind]]
+        if key not in self.chat_windows:
+            self.chat_windows[key] = RateWindow(limits['chat_per_second'], 1.0)
+        windows.append(self.chat_windows[key])
+        if self.is_group(chat_id):
+            if key not in self.group_windows:
+                self.group_windows[key] = RateWindow(limits['group_per_minute'], 60.0)
+            windows.append(self.group_windows[key])
+        return windows
+
+    async def acquire(self, chat_id, kind='bot'):
+        """Ожидание слота для отправки в чат с учетом всех лимитов."""
+        windows = self._windows(kind, chat_id)
+        while True:
+            now = time.monotonic()
+            delay = max(
+                [self.blocked_until.get((kind, None), 0) - now,
+                 self.blocked_until.get((kind, str(chat_id)), 0) - now]
+                + [window.delay(now) for window in windows]
+            )
+            if delay <= 0:
+                for window in windows:
+                    window.record(now)
+                return
+            await asyncio.sleep(delay)
+
+    def penalize(self, chat_id, seconds, kind='bot'):
+        """Приостановка отправки в чат (chat_id=None - для всего аккаунта) на seconds секунд."""
+        key = (kind, None if chat_id is None else str(chat_id))
+        until = time.monotonic() + seconds
+        self.blocked_until[key] = max(self.blocked_until.get(key, 0), until)
+        self.flood_wait_seconds += seconds
+        self.metrics.gauge('news_tg_flood_wait_seconds', 'Суммарное ожидание по flood wait').inc(seconds, kind=kind)
+
+    async def submit(self, chat_id, func, *args, kind='bot', **kwargs):
+        """
+        Выполнение отправки с соблюдением лимитов и повтором после flood wait.
+
+        Args:
+            chat_id: ID чата получателя
+            func: Корутинная функция, выполняющая отправку
+            kind: "bot" для Bot API, "client" для пользовательского аккаунта
+            *args, **kwargs: Аргументы func
+
+        Returns:
+            Результат func
+        """
+        # Для Bot API первым аргументом передается имя метода
+        method = args[0] if args and isinstance(args[0], str) else getattr(func, '__name__', 'call')
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, kind)
+            try:
+                with self.metrics.timer('news_tg_rpc_seconds', 'Длительность запросов к Telegram', method=method):
+                    return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                if attempt >= self.max_retries:
+                    raise
+                # FloodWait в MTProto относится ко всему аккаунту
+                logger.warning(f"FloodWait {e.seconds} с при отправке в {chat_id}, ждем и повторяем")
+                self.penalize(None, e.seconds, kind)
+            except BotApiError as e:
+                if not e.retry_after or attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Bot API просит подождать {e.retry_after} с перед отправкой в {chat_id}")
+                self.penalize(chat_id, e.retry_after, kind)
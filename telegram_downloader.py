@@ -2,55 +2,61 @@ import os
 import json
 import logging
 import asyncio
-import sys
+import time
 from datetime import datetime, timedelta
 from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
+from telethon.errors import SessionPasswordNeededError, FloodWaitError
 from telethon.tl.types import Channel, Chat, User
-import requests
+from metrics import REGISTRY
+from log_setup import LogSummary
+from atomic_io import atomic_write_json
+from account_pool import AccountPool, load_accounts
 
-# Настройка логирования
-class EmojiSafeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            # Безопасно заменяем неподдерживаемые символы
-            try:
-                stream.write(msg + self.terminator)
-            except UnicodeEncodeError:
-                stream.write(msg.encode('utf-8', 'replace').decode('utf-8') + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/downloader_log.txt", mode='w', encoding='utf-8'),
-        EmojiSafeStreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger('TelegramDownloader')
 
-# Ensure logs directory exists
-if not os.path.exists("logs"):
-    os.makedirs("logs")
+async def _timed(iterator, elapsed):
+    """
+    Обход асинхронного итератора с учетом времени ожидания его элементов.
+
+    Args:
+        iterator: Асинхронный итератор (например, client.iter_messages)
+        elapsed: Список из одного числа, к которому прибавляются секунды ожидания
+    """
+    iterator = iterator.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            elapsed[0] += time.perf_counter() - start
+        yield item
+
 
 class TelegramDownloader:
-    def __init__(self, config_path='config.json'):
-        """Инициализация загрузчика Telegram."""
-        self.config = self._load_config(config_path)
+    def __init__(self, config_path='config.json', metrics=None, cassette=None, config=None):
+        """Инициализация загрузчика Telegram.
+
+        Args:
+            config_path: Путь к файлу конфигурации
+            metrics: Реестр метрик (по умолчанию общий)
+            cassette: Кассета для записи или воспроизведения загруженных сообщений
+            config: Уже загруженная конфигурация (тогда config_path не читается)
+        """
+        self.config = config if config is not None else self._load_config(config_path)
+        self.metrics = metrics or REGISTRY
+        self.cassette = cassette
         self.last_run_file = os.path.join(self.config['paths']['data_dir'], 'last_run.json')
         self.client = None
-        self.session_file = os.path.join(
-            self.config['paths']['sessions_dir'], 
-            f'tg_session_v3_{self.config["telegram"]["phone"]}'
-        )
+        self.clients = {}  # имя аккаунта -> клиент
+        self._entities = {}  # (клиент, ID канала) -> объект канала, чтобы не запрашивать его на каждом опросе
+        self.accounts = load_accounts(self.config)
+        self.session_file = self.accounts[0]['session']
         self.request_delay = self.config.get('app', {}).get('request_delay', 0.5)
         self.media_enabled = self.config.get('app', {}).get('media_enabled', True)
         self.direct_forward = self.config.get('app', {}).get('direct_forward', True)
+        self.search_index_enabled = self.config.get('app', {}).get('search_index', True)
         self._ensure_dirs_exist()
 
     def _load_config(self, config_path):
@@ -96,19 +102,30 @@ class TelegramDownloader:
     def _save_last_run_time(self):
         """Сохранение времени текущего запуска."""
         try:
-            with open(self.last_run_file, 'w', encoding='utf-8') as f:
-                json.dump({'last_run': datetime.now().isoformat()}, f)
+            atomic_write_json(self.last_run_file, {'last_run': datetime.now().isoformat()}, indent=None)
             logger.info(f"Время запуска сохранено: {datetime.now().isoformat()}")
         except Exception as e:
             logger.error(f"Ошибка сохранения времени запуска: {e}")
 
     async def initialize_client(self):
-        """Инициализация и авторизация клиента Telegram."""
-        logger.info("Инициализация клиента Telegram...")
-        self.client = TelegramClient(
-            self.session_file, 
-            self.config['telegram']['api_id'], 
-            self.config['telegram']['api_hash'],
+        """Инициализация и авторизация клиента Telegram основного аккаунта."""
+        self.client = await self._connect_account(self.accounts[0])
+        return self.client is not None
+
+    async def _connect_account(self, account):
+        """
+        Подключение и авторизация аккаунта загрузчика.
+
+        Returns:
+            TelegramClient: Клиент или None при ошибке авторизации
+        """
+        if account['name'] in self.clients:
+            return self.clients[account['name']]
+        logger.info(f"Инициализация клиента Telegram ({account['name']})...")
+        client = TelegramClient(
+            account['session'],
+            account['api_id'],
+            account['api_hash'],
             device_model="Desktop",
             system_version="Windows 10",
             app_version="1.0.0",
@@ -121,31 +138,48 @@ class TelegramDownloader:
         )
 
         try:
-            await self.client.start(phone=self.config['telegram']['phone'])
-            if not await self.client.is_user_authorized():
+            await client.start(phone=account['phone'])
+            if not await client.is_user_authorized():
                 logger.info("Необходима авторизация!")
-                await self.client.send_code_request(self.config['telegram']['phone'])
-                code = input('Введите код подтверждения: ')
+                await client.send_code_request(account['phone'])
+                code = input(f"Введите код подтверждения для {account['phone']}: ")
                 
                 # Проверка, требуется ли двухфакторная аутентификация
                 try:
-                    await self.client.sign_in(self.config['telegram']['phone'], code)
+                    await client.sign_in(account['phone'], code)
                 except SessionPasswordNeededError:
                     password = input('Введите пароль двухфакторной аутентификации: ')
-                    await self.client.sign_in(password=password)
+                    await client.sign_in(password=password)
             
-            logger.info("Авторизация успешна!")
-            return True
+            logger.info(f"Авторизация успешна! ({account['name']})")
+            self.clients[account['name']] = client
+            return client
         except Exception as e:
-            logger.error(f"Ошибка при авторизации: {e}")
-            return False
+            logger.error(f"Ошибка при авторизации {account['name']}: {e}")
+            await client.disconnect()
+            return None
+
+    async def get_channels(self, client=None, channel_ids=None):
+        """Получение объектов каналов по их ID (по умолчанию - все каналы из конфигурации)."""
+        resolved, _ = await self._resolve_channels(client or self.client, channel_ids or self.config['channels'])
+        return [channel for _, channel in resolved]
+
+    async def _resolve_channels(self, client, channel_ids):
+        """
+        Получение объектов каналов через клиент аккаунта.
 
-    async def get_channels(self):
-        """Получение объектов каналов по их ID."""
-        channels = []
-        for channel_id in self.config['channels']:
+        Returns:
+            tuple: ([(ID из конфигурации, объект канала)], [ID, которые не удалось получить])
+        """
+        resolved, failed = [], []
+        for channel_id in channel_ids:
+            cached = self._entities.get((client, channel_id))
+            if cached is not None:
+                resolved.append((channel_id, cached))
+                continue
             try:
-                channel = await self.client.get_entity(int(channel_id))
+                with self.metrics.timer('news_tg_rpc_seconds', 'Длительность запросов к Telegram', method='get_entity'):
+                    channel = await client.get_entity(int(channel_id))
                 # Проверяем тип объекта
                 if isinstance(channel, User):
                     channel_title = f"Пользователь {channel.first_name} {channel.last_name or ''}".strip()
@@ -158,13 +192,88 @@ class TelegramDownloader:
                 if not hasattr(channel, 'title'):
                     channel.title = channel_title
                 
-                channels.append(channel)
+                self._entities[(client, channel_id)] = channel
+                resolved.append((channel_id, channel))
             except Exception as e:
                 logger.error(f"Ошибка получения канала {channel_id}: {e}")
-        return channels
+                failed.append(channel_id)
+        return resolved, failed
+
+    def _add_message(self, message, channel, channel_title, messages, albums, skipped):
+        """
+        Добавление сообщения Telegram в список загруженных.
+
+        Части альбома (несколько фото/видео) приходят отдельными сообщениями
+        с общим grouped_id - они объединяются в одно логическое сообщение.
+
+        Returns:
+            dict: Данные одиночного сообщения или None (часть альбома или сообщение без текста)
+        """
+        if message.grouped_id:
+            album = albums.get(message.grouped_id)
+            if album is None:
+                album = albums[message.grouped_id] = {
+                    'id': message.id,
+                    'channel_id': channel.id,
+                    'channel_name': channel_title,
+                    'date': message.date.isoformat(),
+                    'message': message.text or '',
+                    'has_media': message.media is not None,
+                    'grouped_id': message.grouped_id,
+                    'message_ids': [message.id]
+                }
+                messages.append(album)
+            else:
+                album['message_ids'].append(message.id)
+                album['has_media'] = album['has_media'] or message.media is not None
+                # Подпись альбома обычно есть только у одной из частей
+                if message.text and not album['message']:
+                    album['message'] = message.text
+            return None
+
+        # Пропускаем сообщения без текста (даже если есть медиа)
+        if not message.text:
+            skipped.add(message.id, f"Пропускаем сообщение {message.id} без текста из канала {channel_title}")
+            return None
 
-    async def fetch_messages_from_channel(self, channel, last_run_time):
-        """Получение новых сообщений из канала с момента последнего запуска."""
+        # Для прямой пересылки нам не нужно загружать медиа
+        msg_data = {
+            'id': message.id,
+            'channel_id': channel.id,
+            'channel_name': channel_title,
+            'date': message.date.isoformat(),
+            'message': message.text or '',
+            'has_media': message.media is not None
+        }
+        messages.append(msg_data)
+        return msg_data
+
+    def _finish_albums(self, albums, messages, skipped, channel_title):
+        """
+        Завершение альбомов после загрузки: альбомы без подписи пропускаются
+        так же, как одиночные сообщения без текста.
+
+        Returns:
+            list: Оставшиеся альбомы
+        """
+        kept = []
+        for album in albums.values():
+            if not album['message']:
+                skipped.add(album['id'], f"Пропускаем альбом {album['grouped_id']} без текста из канала {channel_title}")
+                messages.remove(album)
+                continue
+            album['media_count'] = len(album['message_ids'])
+            kept.append(album)
+        return kept
+
+    async def fetch_messages_from_channel(self, channel, last_run_time, client=None):
+        """Получение новых сообщений из канала с момента последнего запуска.
+
+        Ошибки не перехватываются: при FloodWaitError канал передается другому
+        аккаунту, а при прочих ошибках загрузка канала считается неудачной,
+        чтобы не сдвигать время, с которого он загружается (иначе сообщения
+        после места ошибки были бы потеряны).
+        """
         channel_dir = os.path.join(self.config['paths']['data_dir'], str(channel.id))
         if not os.path.exists(channel_dir):
             os.makedirs(channel_dir)
@@ -174,44 +283,104 @@ class TelegramDownloader:
         logger.info(f"Получение сообщений из канала '{channel_title}' с {last_run_time.isoformat()}")
         
         messages = []
+        albums = {}  # grouped_id -> объединенное сообщение альбома
+        skipped = LogSummary(logger, f"Пропущены сообщения без текста из канала '{channel_title}' (ID)")
+        fetch_start = time.perf_counter()
+        rpc_seconds = [0.0]
         try:
             # Получаем сообщения с ограничением в 100 за раз
-            async for message in self.client.iter_messages(
+            async for message in _timed((client or self.client).iter_messages(
                 channel, 
                 offset_date=last_run_time,
                 reverse=True,  # От старых к новым
                 limit=None    # Без ограничения общего количества
-            ):
-                # Пропускаем сообщения без текста (даже если есть медиа)
-                if not message.text:
-                    logger.info(f"Пропускаем сообщение {message.id} без текста из канала {channel_title}")
+            ), rpc_seconds):
+                msg_data = self._add_message(message, channel, channel_title, messages, albums, skipped)
+                if msg_data is None:
                     continue
-                    
-                # Для прямой пересылки нам не нужно загружать медиа
-                msg_data = {
-                    'id': message.id,
-                    'channel_id': channel.id,
-                    'channel_name': channel_title,
-                    'date': message.date.isoformat(),
-                    'message': message.text or '',
-                    'has_media': message.media is not None
-                }
                 
                 # Сохраняем сообщение в файл
                 self._save_message_to_file(channel.id, message.id, msg_data)
                 
-                # Добавляем в общий список для анализа
-                messages.append(msg_data)
-                
                 # Добавляем небольшую задержку, чтобы избежать ограничений API
                 await asyncio.sleep(self.request_delay)
                 
+        except FloodWaitError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при получении сообщений из канала {channel_title}: {e}")
+            raise
+
+        for album in self._finish_albums(albums, messages, skipped, channel_title):
+            self._save_message_to_file(channel.id, album['id'], album)
+        skipped.flush()
         
+        fetch_seconds = time.perf_counter() - fetch_start
+        # Только ожидание ответов Telegram, без сохранения сообщений и паузы request_delay
+        self.metrics.histogram('news_tg_rpc_seconds', 'Длительность запросов к Telegram').observe(
+            rpc_seconds[0], method='iter_messages'
+        )
+        self.metrics.gauge('news_tg_channel_fetch_seconds', 'Время загрузки канала').inc(fetch_seconds, channel=channel.id)
+        self.metrics.counter('news_tg_messages_fetched_total', 'Загружено сообщений из каналов').inc(
+            len(messages), channel=channel.id
+        )
+        if self.cassette:
+            self.cassette.record('fetch', {
+                'channel_id': channel.id, 'channel_title': channel_title, 'messages': messages
+            }, fetch_seconds)
         logger.info(f"Получено {len(messages)} сообщений из канала '{channel_title}'")
         return messages
 
+    async def _replay_messages(self):
+        """Воспроизведение загрузки сообщений из кассеты (без обращения к Telegram)."""
+        all_messages = []
+        for event in self.cassette.all('fetch'):
+            await self.cassette.wait(event)
+            channel_id = event['channel_id']
+            os.makedirs(os.path.join(self.config['paths']['data_dir'], str(channel_id)), exist_ok=True)
+            for msg in event['messages']:
+                self._save_message_to_file(channel_id, msg['id'], msg)
+            self.metrics.counter('news_tg_messages_fetched_total', 'Загружено сообщений из каналов').inc(
+                len(event['messages']), channel=channel_id
+            )
+            self.metrics.gauge('news_tg_channel_fetch_seconds', 'Время загрузки канала').inc(
+                event['duration'], channel=channel_id
+            )
+            logger.info(f"Воспроизведено {len(event['messages'])} сообщений из канала '{event['channel_title']}'")
+            all_messages.extend(event['messages'])
+        return all_messages
+
+    def _save_new_messages(self, all_messages):
+        """Сохранение списка всех новых сообщений для анализатора."""
+        messages_file = os.path.join(self.config['paths']['data_dir'], 'new_messages.json')
+        try:
+            atomic_write_json(messages_file, {
+                'timestamp': datetime.now().isoformat(),
+                'messages': all_messages
+            })
+            logger.info(f"Список новых сообщений сохранен в {messages_file}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения списка новых сообщений: {e}")
+
+    async def _index_messages(self, all_messages):
+        """Добавление новых сообщений в полнотекстовый индекс (в отдельном потоке)."""
+        if not self.search_index_enabled or not all_messages:
+            return
+
+        def index():
+            from search_index import SearchIndex
+            search_index = SearchIndex(self.config)
+            try:
+                return search_index.add(all_messages)
+            finally:
+                search_index.close()
+
+        try:
+            count = await asyncio.to_thread(index)
+            logger.info(f"В поисковый индекс добавлено {count} сообщений")
+        except Exception as e:
+            logger.error(f"Ошибка обновления поискового индекса: {e}")
+
     def _save_message_to_file(self, channel_id, message_id, message_data):
         """Сохранение сообщения в JSON файл."""
         channel_dir = os.path.join(self.config['paths']['data_dir'], str(channel_id))
@@ -219,52 +388,143 @@ class TelegramDownloader:
         filepath = os.path.join(channel_dir, filename)
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(message_data, f, ensure_ascii=False, indent=2)
+            atomic_write_json(filepath, message_data)
         except Exception as e:
             logger.error(f"Ошибка сохранения сообщения {message_id} из канала {channel_id}: {e}")
 
+    async def _download_account(self, account, channel_ids, since, pool):
+        """
+        Загрузка каналов одним аккаунтом (последовательно, как и раньше).
+
+        Returns:
+            tuple: (сообщения, {ID загруженного канала: число сообщений},
+                ID каналов для передачи другому аккаунту (нет подключения, FloodWait
+                или ошибка загрузки),
+                ID каналов, которые аккаунт не смог получить через get_entity)
+        """
+        client = await self._connect_account(account)
+        if client is None:
+            return [], {}, list(channel_ids), []
+        if self.client is None:
+            self.client = client
+
+        resolved, failed = await self._resolve_channels(client, channel_ids)
+        messages, fetched, retry = [], {}, []
+        for position, (channel_id, channel) in enumerate(resolved):
+            try:
+                channel_messages = await self.fetch_messages_from_channel(channel, since[channel_id], client)
+            except FloodWaitError as e:
+                pool.ban(account['name'], e.seconds)
+                self.metrics.counter('news_tg_account_failovers_total', 'Каналы, переданные другому аккаунту').inc(
+                    len(resolved) - position, account=account['name']
+                )
+                return messages, fetched, retry + [cid for cid, _ in resolved[position:]], failed
+            except Exception:
+                # Ошибка уже в логе: канал пробует другой аккаунт, а если не сможет ни один,
+                # канал останется незагруженным
+                retry.append(channel_id)
+                continue
+            messages.extend(channel_messages)
+            fetched[channel_id] = len(channel_messages)
+        return messages, fetched, retry, failed
+
+    async def _download_sharded(self, since):
+        """
+        Загрузка каналов, распределенных по аккаунтам консистентным хэшированием.
+
+        Аккаунты работают параллельно. Каналы аккаунта, получившего FloodWait
+        (или не сумевшего получить либо загрузить канал), переходят к следующему аккаунту на
+        кольце. Сообщения всех аккаунтов сохраняются в общее хранилище.
+
+        Канал, который не удалось получить (get_entity) ни одним аккаунтом,
+        не зависит от FloodWait: он пропускается и не считается незагруженным,
+        иначе время последнего запуска не обновлялось бы никогда.
+
+        Args:
+            since: {ID канала: время, с которого загружать сообщения}
+
+        Returns:
+            tuple: (сообщения, {ID загруженного канала: число сообщений}, ID каналов,
+                которые остались незагруженными: подходящие аккаунты получили
+                FloodWait, недоступны или не смогли загрузить канал)
+        """
+        pool = AccountPool(self.config, self.accounts)
+        accounts = {account['name']: account for account in self.accounts}
+        tried = {}  # ID канала -> аккаунты, которые уже пробовали
+        unresolved = {}  # ID канала -> аккаунты, не сумевшие получить канал
+        pending = list(since)
+        all_messages, fetched, unfetched, missing = [], {}, [], []
+
+        while pending:
+            groups = {}
+            for channel_id in pending:
+                name = pool.assign(channel_id, tried.get(channel_id, ()))
+                if name is None:
+                    if unresolved.get(channel_id, set()) >= set(accounts):
+                        # Канал не получил ни один аккаунт - ошибка уже в логе, повторять не нужно
+                        missing.append(channel_id)
+                    else:
+                        # Остались аккаунты, которые канал еще не пробовали, но они недоступны
+                        unfetched.append(channel_id)
+                else:
+                    groups.setdefault(name, []).append(channel_id)
+            if len(accounts) > 1 and groups:
+                logger.info("Распределение каналов: " + ", ".join(f"{name}: {len(ids)}" for name, ids in groups.items()))
+
+            results = await asyncio.gather(*(
+                self._download_account(accounts[name], ids, since, pool) for name, ids in groups.items()
+            ))
+            pending = []
+            for name, (messages, counts, retry, failed) in zip(groups, results):
+                all_messages.extend(messages)
+                fetched.update(counts)
+                for channel_id in failed:
+                    unresolved.setdefault(channel_id, set()).add(name)
+                for channel_id in retry + failed:
+                    tried.setdefault(channel_id, set()).add(name)
+                    pending.append(channel_id)
+        if missing:
+            logger.error(f"Каналы не удалось получить ни одним аккаунтом, они пропущены: {', '.join(map(str, missing))}")
+        return all_messages, fetched, unfetched
+
     async def download_messages(self):
         """Основная функция загрузки сообщений."""
+        if self.cassette and self.cassette.replaying:
+            all_messages = await self._replay_messages()
+            logger.info(f"Всего воспроизведено {len(all_messages)} сообщений из кассеты")
+            self._save_new_messages(all_messages)
+            await self._index_messages(all_messages)
+            return all_messages or None
+
         try:
-            # Инициализация клиента
-            if not await self.initialize_client():
-                logger.critical("Невозможно продолжить без авторизации в Telegram.")
-                return None
-                
             # Получаем время последнего запуска
             last_run_time = self._get_last_run_time()
             logger.info(f"Последний запуск: {last_run_time.isoformat()}")
             
-            # Получаем объекты каналов
-            channels = await self.get_channels()
+            # Получаем сообщения из всех каналов (каналы распределены по аккаунтам)
+            all_messages, fetched, unfetched = await self._download_sharded(
+                {channel_id: last_run_time for channel_id in self.config['channels']}
+            )
             
-            if not channels:
-                logger.warning("Не найдено ни одного канала для парсинга.")
+            if not fetched:
+                if not self.clients:
+                    logger.critical("Невозможно продолжить без авторизации в Telegram.")
+                else:
+                    logger.warning("Не найдено ни одного канала для парсинга.")
                 return None
-                
-            # Получаем сообщения из всех каналов
-            all_messages = []
-            for channel in channels:
-                channel_messages = await self.fetch_messages_from_channel(channel, last_run_time)
-                all_messages.extend(channel_messages)
             
-            logger.info(f"Всего получено {len(all_messages)} новых сообщений из {len(channels)} каналов")
+            logger.info(f"Всего получено {len(all_messages)} новых сообщений из {len(fetched)} каналов")
             
-            # Сохраняем время текущего запуска
-            self._save_last_run_time()
+            # Сохраняем время текущего запуска (если загружены все каналы, иначе
+            # следующий запуск повторит период для пропущенных каналов)
+            if unfetched:
+                logger.error(f"Не удалось загрузить каналы: {', '.join(map(str, unfetched))}; время запуска не обновлено")
+            else:
+                self._save_last_run_time()
             
             # Создаем файл со списком всех новых сообщений для анализатора
-            messages_file = os.path.join(self.config['paths']['data_dir'], 'new_messages.json')
-            try:
-                with open(messages_file, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'timestamp': datetime.now().isoformat(),
-                        'messages': all_messages
-                    }, f, ensure_ascii=False, indent=2)
-                logger.info(f"Список новых сообщений сохранен в {messages_file}")
-            except Exception as e:
-                logger.error(f"Ошибка сохранения списка новых сообщений: {e}")
+            self._save_new_messages(all_messages)
+            await self._index_messages(all_messages)
             
             return all_messages if all_messages else None
             
@@ -272,7 +532,66 @@ class TelegramDownloader:
             logger.critical(f"Критическая ошибка при загрузке сообщений: {e}", exc_info=True)
             return None
         finally:
-            # Закрываем клиент в любом случае
-            if self.client:
-                await self.client.disconnect()
-                logger.info("Клиент Telegram отключен.")
\ No newline at end of file
+            # Закрываем клиенты в любом случае
+            await self.close()
+
+    async def poll_channels(self, schedule):
+        """
+        Загрузка только тех каналов, которые пора опросить по расписанию.
+
+        Каждый канал загружается со времени своего прошлого опроса, после
+        чего расписание пересчитывает его интервал. Клиенты остаются
+        подключенными до close(), чтобы не переподключаться на каждом опросе.
+
+        Args:
+            schedule: Расписание опроса (ChannelSchedule)
+
+        Returns:
+            list: Новые сообщения (пустой список, если опрашивать было нечего)
+        """
+        due = schedule.due(self.config['channels'])
+        if not due:
+            return []
+        polled_at = datetime.now()
+        default_since = self._get_last_run_time()
+        since = {channel_id: schedule.since(channel_id, default_since, polled_at) for channel_id in due}
+        logger.info(f"Опрос {len(due)} из {len(self.config['channels'])} каналов")
+
+        try:
+            all_messages, fetched, unfetched = await self._download_sharded(since)
+        except Exception as e:
+            logger.error(f"Ошибка опроса каналов: {e}", exc_info=True)
+            return []
+        if unfetched:
+            logger.warning(f"Не удалось опросить каналы: {', '.join(map(str, unfetched))}; они будут опрошены позже")
+
+        polls = self.metrics.counter('news_tg_channel_polls_total', 'Опросы каналов по расписанию')
+        for channel_id, count in fetched.items():
+            interval = schedule.record(channel_id, count, since[channel_id], polled_at)
+            polls.inc(channel=channel_id, result='new' if count else 'empty')
+            self.metrics.gauge('news_tg_channel_poll_interval_seconds', 'Интервал опроса канала').set(
+                round(interval), channel=channel_id
+            )
+            logger.debug(f"Канал {channel_id}: {count} новых, {schedule.rate(channel_id):.2f} в час, "
+                         f"следующий опрос через {interval:.0f} с")
+        for channel_id in due:
+            if channel_id not in fetched and channel_id not in unfetched:
+                # Канал не получил ни один аккаунт (ошибка уже в логе): не повторяем на каждом опросе
+                schedule.defer(channel_id, polled_at)
+        schedule.save()
+
+        if all_messages:
+            logger.info(f"Получено {len(all_messages)} новых сообщений из {len(fetched)} каналов")
+            self._save_new_messages(all_messages)
+            await self._index_messages(all_messages)
+        return all_messages
+
+    async def close(self):
+        """Отключение клиентов всех аккаунтов."""
+        for client in self.clients.values():
+            await client.disconnect()
+        if self.clients:
+            logger.info("Клиенты Telegram отключены.")
+        self.clients = {}
+        self._entities = {}
+        self.client = None
\ No newline at end of file
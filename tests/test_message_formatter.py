@@ -0,0 +1,100 @@
+from message_formatter import (
+    concat, format_header, format_post, parse_markdown, split_message, utf16_len
+)
+
+EMOJI = "\U0001F600"  # вне BMP: в UTF-16 это суррогатная пара
+
+
+def entity_text(text, entity):
+    """Текст, покрытый сущностью (смещения в единицах UTF-16)."""
+    encoded = text.encode('utf-16-le')
+    return encoded[entity['offset'] * 2:(entity['offset'] + entity['length']) * 2].decode('utf-16-le')
+
+
+def test_utf16_len_counts_surrogate_pairs():
+    assert utf16_len("abc") == 3
+    assert utf16_len("абв") == 3
+    assert utf16_len(EMOJI) == 2
+    assert utf16_len(f"a{EMOJI}b") == 4
+
+
+def test_parse_markdown_offsets_after_emoji():
+    text, entities = parse_markdown(f"{EMOJI}{EMOJI} **жирный** [ссылка](https://example.com)")
+
+    assert text == f"{EMOJI}{EMOJI} жирный ссылка"
+    bold, link = entities
+    assert bold == {'type': 'bold', 'offset': 5, 'length': 6}
+    assert entity_text(text, bold) == "жирный"
+    assert link['type'] == 'text_link' and link['url'] == "https://example.com"
+    assert entity_text(text, link) == "ссылка"
+
+
+def test_format_header_link_covers_emoji_channel_name():
+    text, (link,) = format_header({'channel_id': '-1001234567890', 'id': 7, 'channel_name': f"Новости {EMOJI}"})
+
+    assert text == f"Новости {EMOJI}\n\n"
+    assert link['length'] == utf16_len(f"Новости {EMOJI}")
+    assert link['url'] == "https://t.me/c/1234567890/7"
+
+
+def test_concat_shifts_offsets_by_utf16_length():
+    text, entities = concat([
+        (f"{EMOJI} раз", [{'type': 'bold', 'offset': 3, 'length': 3}]),
+        (f"два {EMOJI}", [{'type': 'italic', 'offset': 4, 'length': 2}]),
+    ], separator=EMOJI)
+
+    assert [entity_text(text, e) for e in entities] == ["раз", EMOJI]
+    assert entities[1]['offset'] == utf16_len(f"{EMOJI} раз{EMOJI}два ")
+
+
+def test_format_post_entities_point_into_combined_text():
+    msg = {'channel_id': '-1001', 'id': 1, 'channel_name': EMOJI, 'message': f"{EMOJI} __курсив__"}
+    text, entities = format_post(msg)
+
+    assert [entity_text(text, e) for e in entities] == [EMOJI, "курсив"]
+
+
+def test_split_message_short_text_is_single_chunk():
+    entities = [{'type': 'bold', 'offset': 0, 'length': 2}]
+    assert split_message(f"{EMOJI} текст", entities) == [(f"{EMOJI} текст", entities)]
+
+
+def test_split_message_prefers_paragraph_boundary():
+    text = "а" * 30 + "\n\n" + "б" * 30 + " " + "в" * 10
+    chunks = split_message(text, [], limit=50)
+
+    assert [chunk for chunk, _ in chunks] == ["а" * 30, "б" * 30 + " " + "в" * 10]
+
+
+def test_split_message_never_cuts_surrogate_pair():
+    text = EMOJI * 10
+    chunks = split_message(text, [], limit=5)
+
+    assert "".join(chunk for chunk, _ in chunks) == text
+    for chunk, _ in chunks:
+        assert utf16_len(chunk) <= 5
+        chunk.encode('utf-8')  # одиночный суррогат не кодируется
+
+
+def test_split_message_entity_continues_across_cut():
+    words = " ".join([f"слово{EMOJI}"] * 20)
+    text, entities = parse_markdown(f"**{words}**")
+    chunks = split_message(text, entities, limit=40)
+
+    assert len(chunks) > 1
+    for chunk, chunk_entities in chunks:
+        assert utf16_len(chunk) <= 40
+        (bold,) = chunk_entities
+        assert bold['offset'] == 0
+        assert bold['length'] == utf16_len(chunk)
+        assert entity_text(chunk, bold) == chunk
+
+
+def test_split_message_first_limit_applies_to_first_chunk_only():
+    text = " ".join(["слово"] * 40)
+    chunks = split_message(text, [], limit=100, first_limit=20)
+
+    assert utf16_len(chunks[0][0]) <= 20
+    assert all(utf16_len(chunk) <= 100 for chunk, _ in chunks[1:])
+    assert any(utf16_len(chunk) > 20 for chunk, _ in chunks[1:])
+    assert " ".join(chunk for chunk, _ in chunks) == text
@@ -0,0 +1,37 @@
+import pytest
+
+from message_sender import MessageSender
+
+
+@pytest.fixture
+def make_sender(tmp_path):
+    def make(recipients):
+        config = {
+            'telegram': {'api_id': 1, 'api_hash': 'x', 'phone': '1', 'bot_token': 't', 'recipients': recipients},
+            'paths': {'data_dir': str(tmp_path), 'sessions_dir': str(tmp_path)},
+        }
+        sender = MessageSender(config=config)
+        sender.outbox.close()
+        return sender
+    return make
+
+
+def test_channel_filter_matches_config_and_entity_ids(make_sender):
+    # В config.json каналы указываются как "-100...", загрузчик сохраняет entity.id без префикса
+    sender = make_sender([
+        {'chat_id': '1', 'channels': ['-1001234567890']},
+        {'chat_id': '2', 'channels': [-1001234567890, 'Новости']},
+        {'chat_id': '3'},
+    ])
+    msg = {'channel_id': 1234567890, 'channel_name': 'Другой канал'}
+
+    assert [MessageSender._accepts(r, msg) for r in sender.recipients] == [True, True, True]
+    assert MessageSender._accepts(sender.recipients[0], {'channel_id': '-1001234567890'})
+
+
+def test_channel_filter_rejects_other_channels(make_sender):
+    sender = make_sender([{'chat_id': '1', 'channels': ['-1001234567890', 'Новости']}])
+    recipient = sender.recipients[0]
+
+    assert not MessageSender._accepts(recipient, {'channel_id': 1111111111, 'channel_name': 'Другой канал'})
+    assert MessageSender._accepts(recipient, {'channel_id': 1111111111, 'channel_name': 'Новости'})
@@ -0,0 +1,72 @@
+import random
+import time
+
+from profiling import PRUNED_LABEL, collapse_stats
+
+
+class FakeStats:
+    """Минимальная замена pstats.Stats: только словарь stats."""
+
+    def __init__(self, raw):
+        self.stats = raw
+
+
+def layered_profile(layers=40, width=140, fan_in=5, seed=1):
+    """
+    Плотный граф вызовов (~5 600 функций), в котором число путей от корня
+    астрономическое, как в профиле с импортами и asyncio.
+    """
+    rng = random.Random(seed)
+    funcs = [[(f"mod{layer}.py", i, f"f{layer}_{i}") for i in range(width)] for layer in range(layers)]
+    raw = {}
+    # Каждая функция тратит 1 мс собственного времени; накопленное время считается снизу вверх
+    cumulative = {}
+    callers = {func: {} for layer in funcs for func in layer}
+    for layer in range(1, layers):
+        for func in funcs[layer]:
+            for caller in rng.sample(funcs[layer - 1], fan_in):
+                callers[func][caller] = None
+    for layer in reversed(range(layers)):
+        for func in funcs[layer]:
+            children = [f for f in funcs[layer + 1] if func in callers[f]] if layer + 1 < layers else []
+            cumulative[func] = 0.001 + sum(cumulative[c] / len(callers[c]) for c in children)
+    root = ('~', 0, '<module>')
+    raw[root] = (1, 1, 0.0, sum(cumulative[f] for f in funcs[0]), {})
+    for func in funcs[0]:
+        callers[func][root] = None
+    for func, func_callers in callers.items():
+        ct = cumulative[func]
+        edges = {caller: (1, 1, 0.001 / len(func_callers), ct / len(func_callers)) for caller in func_callers}
+        raw[func] = (1, 1, 0.001, ct, edges)
+    return raw
+
+
+def total_microseconds(lines):
+    return sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+
+
+def test_collapse_stats_is_fast_on_dense_call_graph():
+    raw = layered_profile()
+    start = time.perf_counter()
+    lines = collapse_stats(FakeStats(raw))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 10, f"collapse_stats занял {elapsed:.1f} с"
+    assert lines
+    # Время нераскрытых ветвей не теряется, а переносится в отдельный кадр
+    assert any(PRUNED_LABEL in line for line in lines)
+    own_time = sum(tt for _, _, tt, _, _ in raw.values())
+    assert abs(total_microseconds(lines) / 1e6 - own_time) / own_time < 0.05
+
+
+def test_collapse_stats_keeps_exact_stacks_for_small_graph():
+    main = ('main.py', 1, 'main')
+    work = ('main.py', 10, 'work')
+    raw = {
+        main: (1, 1, 0.5, 2.0, {}),
+        work: (2, 2, 1.5, 1.5, {main: (2, 2, 1.5, 1.5)}),
+    }
+    assert sorted(collapse_stats(FakeStats(raw))) == [
+        "main.py:1:main 500000",
+        "main.py:1:main;main.py:10:work 1500000",
+    ]
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('WorkQueue')
+
+# Состояния задания
+READY = 'ready'
+LEASED = 'leased'
+DONE = 'done'
+DEAD = 'dead'
+
+
+class WorkQueue:
+    """Локальная надежная очередь заданий между этапами (SQLite).
+
+    Задание, выданное воркеру (lease), невидимо для остальных до истечения
+    таймаута видимости. Если воркер не подтвердил задание (ack) - например,
+    процесс упал, - по истечении таймаута оно снова выдается, пока не
+    исчерпан queue_max_attempts; после этого задание помечается как dead.
+
+    Файл очереди может лежать на общем томе, тогда воркеры разных машин
+    работают с одной очередью (для сетевых ФС нужен queue_journal_mode
+    "DELETE": WAL требует общей памяти и работает только на одной машине).
+    """
+
+    def __init__(self, config):
+        """
+        Инициализация очереди.
+
+        Args:
+            config: Конфигурация приложения
+        """
+        app_config = config.get('app', {})
+        self.data_dir = config['paths']['data_dir']
+        self.db_file = app_config.get('queue_path') or os.path.join(self.data_dir, 'queue.sqlite3')
+        self.visibility_timeout = app_config.get('queue_visibility_timeout', 600)
+        self.max_attempts = app_config.get('queue_max_attempts', 5)
+        os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+        # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы выдача задания была атомарной между процессами
+        self.conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(f"PRAGMA journal_mode={app_config.get('queue_journal_mode', 'WAL')}")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                worker TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_topic_state ON jobs (topic, state, available_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _insert(self, topic, payload, delay=0):
+        now = datetime.now().isoformat()
+        return self.conn.execute(
+            "INSERT INTO jobs (topic, payload, state, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (topic, json.dumps(payload, ensure_ascii=False), READY, time.time() + delay, now, now)
+        ).lastrowid
+
+    def put(self, topic, payload, delay=0):
+        """
+        Добавление задания.
+
+        Args:
+            topic: Очередь ("analyze", "send")
+            payload: Данные задания (сериализуются в JSON)
+            delay: Через сколько секунд задание станет доступно
+
+        Returns:
+            int: ID задания
+        """
+        with self._transaction():
+            return self._insert(topic, payload, delay)
+
+    def lease(self, topic, worker, timeout=None):
+        """
+        Получение следующего доступного задания.
+
+        Доступны новые задания и задания, таймаут видимости которых истек.
+
+        Args:
+            topic: Очередь
+            worker: Имя воркера
+            timeout: Таймаут видимости, секунд (по умолчанию queue_visibility_timeout)
+
+        Returns:
+            dict: id, topic, payload, attempts - или None, если заданий нет
+        """
+        timeout = timeout or self.visibility_timeout
+        with self._transaction():
+            while True:
+                now = time.time()
+                row = self.conn.execute(
+                    "SELECT id, topic, payload, attempts, state, worker FROM jobs "
+                    "WHERE topic = ? AND state IN (?, ?) AND available_at <= ? ORDER BY id LIMIT 1",
+                    (topic, READY, LEASED, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row['state'] == LEASED:
+                    logger.warning(f"Задание {row['id']} ({topic}) не подтверждено воркером {row['worker']} "
+                                   f"до истечения таймаута видимости и будет выдано повторно")
+                if row['attempts'] >= self.max_attempts:
+                    self.conn.execute(
+                        "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                        (DEAD, datetime.now().isoformat(), row['id'])
+                    )
+                    logger.error(f"Задание {row['id']} ({topic}) исчерпало {self.max_attempts} попыток и отложено как dead")
+                    continue
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, available_at = ?, worker = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (LEASED, now + timeout, worker, datetime.now().isoformat(), row['id'])
+                )
+                return {
+                    'id': row['id'],
+                    'topic': row['topic'],
+                    'payload': json.loads(row['payload']),
+                    'attempts': row['attempts'] + 1,
+                }
+
+    def _owned_update(self, job_id, worker, sql, params):
+        return self.conn.execute(
+            f"UPDATE jobs SET {sql}, updated_at = ? WHERE id = ? AND state = ? AND worker = ?",
+            (*params, datetime.now().isoformat(), job_id, LEASED, worker)
+        ).rowcount > 0
+
+    def extend(self, job_id, worker, timeout=None):
+        """
+        Продление таймаута видимости задания, которое еще обрабатывается.
+
+        Returns:
+            bool: False, если задание уже выдано другому воркеру
+        """
+        with self._transaction():
+            return self._owned_update(job_id, worker, "available_at = ?",
+                                      (time.time() + (timeout or self.visibility_timeout),))
+
+    def ack(self, job_id, worker, forward=()):
+        """
+        Подтверждение задания и, в той же транзакции, постановка заданий
+        следующего этапа: результат либо передан дальше один раз, либо не передан.
+
+        Args:
+            job_id: ID задания
+            worker: Имя воркера
+            forward: Задания следующего этапа, список (topic, payload)
+
+        Returns:
+            bool: False, если таймаут истек и задание уже выдано другому воркеру
+                (тогда forward не ставятся)
+        """
+        with self._transaction():
+            if not self._owned_update(job_id, worker, "state = ?, error = NULL", (DONE,)):
+                logger.warning(f"Задание {job_id} уже выдано другому воркеру, результат {worker} отброшен")
+                return False
+            for topic, payload in forward:
+                self._insert(topic, payload)
+            return True
+
+    def nack(self, job_id, worker, error, delay=0):
+        """Возврат задания в очередь после ошибки (повтор через delay секунд)."""
+        with self._transaction():
+            return self._owned_update(job_id, worker, "state = ?, available_at = ?, error = ?",
+                                      (READY, time.time() + delay, str(error)[:500]))
+
+    def acquire_lock(self, name, owner, ttl):
+        """
+        Захват или продление именованной блокировки (единственный воркер этапа).
+
+        Returns:
+            bool: True, если блокировка принадлежит owner
+        """
+        now = time.time()
+        with self._transaction():
+            row = self.conn.execute("SELECT owner, expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is not None and row['owner'] != owner and row['expires_at'] > now:
+                return False
+            self.conn.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl)
+            )
+            return True
+
+    def release_lock(self, name, owner):
+        with self._transaction():
+            self.conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def purge(self, days):
+        """Удаление выполненных заданий старше days дней."""
+        cutoff = datetime.fromtimestamp(time.time() - days * 86400).isoformat()
+        with self._transaction():
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE state = ? AND updated_at < ?", (DONE, cutoff)
+            ).rowcount
+
+    def stats(self):
+        """Количество заданий по очередям и состояниям: {topic: {state: count}}."""
+        result = {}
+        for row in self.conn.execute("SELECT topic, state, COUNT(*) FROM jobs GROUP BY topic, state"):
+            result.setdefault(row[0], {})[row[1]] = row[2]
+        return result
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,270 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+from contextlib import asynccontextmanager
+from metrics import REGISTRY
+from work_queue import WorkQueue
+from account_pool import sender_session
+
+logger = logging.getLogger('Workers')
+
+STAGES = ('download', 'analyze', 'send')
+
+# Очереди между этапами
+ANALYZE_TOPIC = 'analyze'
+SEND_TOPIC = 'send'
+
+
+def worker_name(stage, index):
+    """Имя воркера, уникальное в пределах всех машин с общей очередью."""
+    return f"{socket.gethostname()}:{os.getpid()}:{stage}{index}"
+
+
+async def _wait(stop, seconds):
+    """Пауза, прерываемая остановкой воркера."""
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+@asynccontextmanager
+async def _heartbeat(interval, renew, what):
+    """Периодическое продление аренды (задания или блокировки), пока выполняется блок."""
+    async def beat():
+        while True:
+            await asyncio.sleep(interval)
+            if not renew():
+                logger.warning(f"Не удалось продлить {what}: его уже получил другой воркер")
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+class StageWorker:
+    """Воркер одного этапа конвейера.
+
+    download периодически (или по расписанию активности каналов, если
+    включен adaptive_polling) загружает новые сообщения и ставит их в очередь
+    analyze; analyze берет задания, фильтрует и отбирает уникальные
+    сообщения и передает их в очередь send; send пересылает их получателям.
+
+    Воркеры analyze работают параллельно. download и send в каждый момент
+    выполняет только один воркер (блокировка в очереди): у них общий аккаунт
+    Telegram и лимиты отправки. Остальные ждут и подхватывают работу, если
+    активный воркер остановился.
+    """
+
+    def __init__(self, stage, config, index=0):
+        """
+        Args:
+            stage: Этап ("download", "analyze" или "send")
+            config: Конфигурация приложения
+            index: Номер воркера этапа
+        """
+        app_config = config.get('app', {})
+        self.stage = stage
+        self.config = config
+        self.name = worker_name(stage, index)
+        self.queue = WorkQueue(config)
+        self.ttl = self.queue.visibility_timeout
+        self.poll_interval = app_config.get('worker_poll_interval', 5)
+        self.download_interval = app_config.get('worker_download_interval', 300)
+        self.adaptive_polling = app_config.get('adaptive_polling', False)
+        self.analyze_chunk = app_config.get('worker_analyze_chunk', 0)
+        self.retention_days = app_config.get('queue_retention_days', 7)
+        self.stop = asyncio.Event()
+
+    def _lock(self):
+        return self.queue.acquire_lock(self.stage, self.name, self.ttl)
+
+    async def run(self):
+        """Цикл воркера до остановки (SIGINT/SIGTERM или stop.set())."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # Windows: остановка через KeyboardInterrupt
+        logger.info(f"Воркер {self.name} запущен")
+        try:
+            await getattr(self, f"_run_{self.stage}")()
+        finally:
+            if self.stage in ('download', 'send'):
+                self.queue.release_lock(self.stage, self.name)
+            self.queue.close()
+            logger.info(f"Воркер {self.name} остановлен")
+
+    async def _run_download(self):
+        from telegram_downloader import TelegramDownloader
+        from channel_schedule import ChannelSchedule
+
+        downloader = None
+        try:
+            while not self.stop.is_set():
+                if not self._lock():
+                    logger.debug(f"Загрузку выполняет другой воркер, {self.name} ожидает")
+                    if downloader:
+                        await downloader.close()
+                        downloader = None
+                    await _wait(self.stop, self.poll_interval)
+                    continue
+                async with _heartbeat(self.ttl / 3, self._lock, "блокировку загрузки"):
+                    if self.adaptive_polling:
+                        # Клиенты остаются подключенными между опросами; расписание читается заново,
+                        # так как его мог обновить другой воркер
+                        downloader = downloader or TelegramDownloader(config=self.config)
+                        schedule = ChannelSchedule(self.config)
+                        messages = await downloader.poll_channels(schedule)
+                        # Ждем не дольше трети таймаута, чтобы продлевать блокировку
+                        wait = min(schedule.seconds_until_due(self.config['channels']), self.ttl / 3)
+                    else:
+                        messages = await TelegramDownloader(config=self.config).download_messages()
+                        wait = self.download_interval
+                if messages:
+                    size = self.analyze_chunk or len(messages)
+                    for start in range(0, len(messages), size):
+                        self.queue.put(ANALYZE_TOPIC, {'messages': messages[start:start + size]})
+                    logger.info(f"В очередь анализа поставлено {len(messages)} сообщений")
+                self.queue.purge(self.retention_days)
+                await _wait(self.stop, max(wait, 1))
+        finally:
+            if downloader:
+                await downloader.close()
+
+    def _analyze(self, job):
+        from message_analyzer import MessageAnalyzer
+
+        analyzer = MessageAnalyzer(config=self.config)
+        analyzer.checkpoint_tag = f"job{job['id']}"
+        analyzer.save_outputs = False
+        informative = analyzer.filter_informative_messages(job['payload']['messages'])
+        return analyzer.analyze_messages(informative) if informative else []
+
+    async def _run_analyze(self):
+        while not self.stop.is_set():
+            job = self.queue.lease(ANALYZE_TOPIC, self.name)
+            if job is None:
+                await _wait(self.stop, self.poll_interval)
+                continue
+            logger.info(f"Задание {job['id']}: анализ {len(job['payload']['messages'])} сообщений (попытка {job['attempts']})")
+            try:
+                # Анализ синхронный (requests к LLM), поэтому выполняется в потоке, а цикл продлевает аренду
+                async with _heartbeat(self.ttl / 3, lambda: self.queue.extend(job['id'], self.name), f"задание {job['id']}"):
+                    unique = await asyncio.to_thread(self._analyze, job)
+            except Exception as e:
+                logger.error(f"Ошибка анализа в задании {job['id']}: {e}")
+                self._count(job, 'failed')
+                self.queue.nack(job['id'], self.name, e, delay=self.poll_interval * job['attempts'])
+                continue
+            forward = [(SEND_TOPIC, {'messages': unique})] if unique else []
+            if self.queue.ack(job['id'], self.name, forward):
+                self._count(job, 'done')
+
+    async def _send(self, job):
+        from message_sender import MessageSender
+
+        sender = MessageSender(config=self.config)
+        # Своя авторизация: сессию загрузчика держит воркер download
+        sender.session_file = sender_session(self.config)
+        try:
+            # Повторная выдача задания безопасна: outbox не отправляет доставленное еще раз
+            await sender.send_messages(job['payload']['messages'])
+        finally:
+            await sender.close()
+
+    async def _run_send(self):
+        while not self.stop.is_set():
+            if not self._lock():
+                await _wait(self.stop, self.poll_interval)
+                continue
+            job = self.queue.lease(SEND_TOPIC, self.name)
+            if job is None:
+                await _wait(self.stop, self.poll_interval)
+                continue
+            logger.info(f"Задание {job['id']}: отправка {len(job['payload']['messages'])} сообщений")
+            try:
+                async with _heartbeat(self.ttl / 3,
+                                      lambda: self._lock() and self.queue.extend(job['id'], self.name),
+                                      f"задание {job['id']}"):
+                    await self._send(job)
+            except Exception as e:
+                logger.error(f"Ошибка отправки в задании {job['id']}: {e}")
+                self._count(job, 'failed')
+                self.queue.nack(job['id'], self.name, e, delay=self.poll_interval * job['attempts'])
+                continue
+            if self.queue.ack(job['id'], self.name):
+                self._count(job, 'done')
+
+    def _count(self, job, result):
+        REGISTRY.counter('news_tg_worker_jobs_total', 'Обработано заданий очереди').inc(
+            topic=job['topic'], result=result
+        )
+
+
+def _worker_process(stage, index, config):
+    """Точка входа процесса воркера."""
+    from log_setup import setup_logging
+
+    setup_logging(f"worker_{stage}{index}", config)
+    try:
+        asyncio.run(StageWorker(stage, config, index).run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reports_dir = config['paths'].get('reports_dir', 'reports')
+        REGISTRY.dump(os.path.join(reports_dir, f"metrics_{stage}{index}.prom"))
+
+
+def supervise(config, counts):
+    """
+    Запуск воркеров этапов в отдельных процессах и перезапуск упавших.
+
+    Args:
+        config: Конфигурация приложения
+        counts: Количество процессов по этапам, например {"download": 1, "analyze": 4, "send": 1}
+    """
+    restart_delay = config.get('app', {}).get('worker_restart_delay', 10)
+    # spawn: дочерние процессы не наследуют цикл событий и потоки родителя
+    context = multiprocessing.get_context('spawn')
+    processes = {}
+    restart_at = {}
+
+    def start(spec):
+        process = context.Process(target=_worker_process, args=(*spec, config), name=f"{spec[0]}{spec[1]}")
+        process.start()
+        processes[spec] = process
+        logger.info(f"Запущен воркер {spec[0]}{spec[1]} (pid {process.pid})")
+
+    for stage in STAGES:
+        for index in range(counts.get(stage, 0)):
+            start((stage, index))
+    try:
+        while processes:
+            time.sleep(1)
+            for spec, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if spec not in restart_at:
+                    logger.error(f"Воркер {spec[0]}{spec[1]} завершился с кодом {process.exitcode}, "
+                                 f"перезапуск через {restart_delay} с")
+                    restart_at[spec] = time.monotonic() + restart_delay
+                elif time.monotonic() >= restart_at[spec]:
+                    del restart_at[spec]
+                    start(spec)
+    except KeyboardInterrupt:
+        # SIGINT получают и дочерние процессы: они завершают текущее задание и выходят
+        logger.info("Остановка воркеров...")
+    finally:
+        for process in processes.values():
+            process.join(config.get('app', {}).get('worker_shutdown_timeout', 60))
+            if process.is_alive():
+                process.terminate()
+                process.join(5)